@@ -16,11 +16,40 @@ oauth_scope = ''
 # Config
 base_url = 'http://localhost:8000/'
 upload_poll_interval = 0.1
+# Status polls back off exponentially from upload_poll_interval up to this.
+max_poll_interval = 5.0
 one_megabyte = 2**20
 upload_chunk_size = 16 * one_megabyte
+# Bounds of, and the duration of a PATCH aimed at by, the chunk sizes chosen
+# by analyzere.uploads.ChunkSizer for adaptive uploads.
+min_upload_chunk_size = one_megabyte
+max_upload_chunk_size = 256 * one_megabyte
+upload_chunk_seconds = 2.0
+download_chunk_size = one_megabyte
 tls_verify = True
 user_agent = 'analyzere-python 0.9-dev'
 connection_pool_maxsize = 10
+# Wait for a free connection instead of opening extra, unpooled ones once
+# connection_pool_maxsize connections to a host are in use.
+connection_pool_block = False
+# Pool sizes for specific hosts, keyed by URL prefix,
+# e.g. {'https://api.example.com': 50}
+connection_pool_maxsize_per_host = {}
+max_concurrent_requests = 8
+# Longer lists of probabilities or thresholds are split into several
+# concurrent metrics requests.
+max_url_length = 2000
+
+# Optional analyzere.cache.ResourceCache used as an identity map by
+# Resource.retrieve and reference resolution.
+resource_cache = None
+# Optional analyzere.cache.MetricsCache for the results of MetricsResource
+# methods.
+metrics_cache = None
+# Convert JSON objects embedded in responses (e.g. metrics rows, candidate
+# parameters) into compact EmbeddedResources shared per set of attribute
+# names, which take about half the memory.
+compact_resources = False
 retry_strategy_total = 0
 retry_strategy_backoff_factor = 0.1
 
@@ -52,6 +81,19 @@ from analyzere.resources import (  # noqa
     Treaty,
 )
 
+from analyzere.base_resources import (  # noqa
+    batch_metrics,
+    resolve_references,
+)
+
+from analyzere.client import (  # noqa
+    Client,
+)
+
+from analyzere.uploads import (  # noqa
+    UploadManager,
+)
+
 from analyzere.errors import (  # noqa
     AuthenticationError,
     InvalidRequestError,
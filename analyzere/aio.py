@@ -0,0 +1,697 @@
+"""
+asyncio counterparts of :mod:`analyzere.requestor` and the resource classes.
+
+Every resource class in :mod:`analyzere.resources` has an equivalent here whose
+network-bound methods are coroutines, e.g.::
+
+    from analyzere import aio
+
+    lv = await aio.LayerView.retrieve('abc123')
+    metrics = await lv.tail_metrics([0.01, 0.004])
+    await aio.LossSet(id='xyz456').upload_data(data)
+
+The returned objects are built by the same ``convert_to_analyzere_object``
+model layer as the synchronous API, and configuration (``base_url``,
+credentials, ``tls_verify``, ...) is read from the :mod:`analyzere` module,
+or from an `analyzere.Client` the class is bound to, e.g.
+``tenant.bind(aio.LayerView)``, which gets its own httpx session.
+References embedded in responses are still resolved lazily and synchronously
+on attribute access.
+
+Requires the optional ``httpx`` package (``pip install analyzere[aio]``).
+"""
+import asyncio
+import json
+import sys
+import warnings
+import weakref
+
+from oauthlib.oauth2 import BackendApplicationClient, TokenExpiredError
+from six import StringIO
+import six
+from six.moves.urllib.parse import urljoin
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+import analyzere
+from analyzere import errors, resources, tables, utils
+from analyzere.base_resources import convert_to_analyzere_object, to_dict
+from analyzere.cache import metrics_key
+from analyzere.requestor import get_config, handle_api_error
+
+
+session = None
+oauth_client = None
+_token_request = None
+# The event loop the session was created in; httpx clients can't be used
+# from another loop, e.g. that of a later asyncio.run().
+_session_loop = None
+
+# Optional httpx transport used when creating the session, e.g. to route
+# requests through a custom connection layer or a mock in tests.
+transport = None
+
+
+class ClientState(object):
+    """
+    Session and authentication state of an `analyzere.Client` for this
+    module, kept like the module's own globals above.
+    """
+    def __init__(self):
+        self.session = None
+        self.oauth_client = None
+        self._token_request = None
+        self._session_loop = None
+
+
+_client_states = weakref.WeakKeyDictionary()
+
+
+def get_state(client=None):
+    """
+    Returns the object holding the session of ``client`` or, if it is None,
+    this module, whose globals hold that of the module-level configuration.
+    """
+    if client is None:
+        return sys.modules[__name__]
+    state = _client_states.get(client)
+    if state is None:
+        state = _client_states.setdefault(client, ClientState())
+    return state
+
+
+async def request(method, path, params=None, data=None, auto_retry=True,
+                  client=None):
+    """
+    Coroutine version of :func:`analyzere.requestor.request`.
+    """
+    body = None
+    if data is not None:
+        body = json.dumps(data, cls=utils.DateTimeEncoder)
+
+    headers = {
+        'accept': 'application/json',
+        'content-type': 'application/json',
+        'user-agent': get_config(client).user_agent,
+    }
+    resp = await request_raw(method, path, params=params, body=body,
+                             headers=headers, auto_retry=auto_retry,
+                             client=client)
+    content = resp.text
+    if content:
+        try:
+            content = json.loads(content, cls=utils.DateTimeDecoder)
+        except ValueError:
+            raise errors.ServerError('Unable to parse JSON response returned '
+                                     'from server.', resp, resp.status_code)
+    return content
+
+
+def ensure_session_exists(client=None):
+    """
+    Creates the httpx session of ``client`` (or of the module-level
+    configuration) in the running event loop, and its OAuth client if it
+    uses Client Credentials. Returns the state holding them.
+    """
+    if httpx is None:
+        raise ImportError('httpx is required for analyzere.aio; install it '
+                          'with "pip install analyzere[aio]"')
+
+    config = get_config(client)
+    state = get_state(client)
+    if config.oauth_client_id:
+        if state.oauth_client is None or state.oauth_client.client_id != config.oauth_client_id:
+            state.oauth_client = BackendApplicationClient(client_id=config.oauth_client_id,
+                                                          scope=config.oauth_scope)
+    else:
+        state.oauth_client = None
+
+    loop = asyncio.get_running_loop()
+    if state.session and state._session_loop is not loop:
+        # Created in another (usually closed) event loop; its connections
+        # can't be reused or even closed from this one.
+        state.session = None
+        state._token_request = None
+
+    if not state.session:
+        limits = httpx.Limits(max_connections=config.connection_pool_maxsize)
+        state.session = httpx.AsyncClient(verify=config.tls_verify, limits=limits,
+                                          transport=transport)
+        state._session_loop = loop
+    return state
+
+
+async def close(client=None):
+    """Closes the shared connection pool of ``client`` or of the module."""
+    state = get_state(client)
+    if state.session is not None:
+        session, state.session = state.session, None
+        await session.aclose()
+
+
+async def fetch_token(stale_token=None, client=None):
+    """
+    Requests a new Client Credentials access token and stores it on the
+    OAuth client of ``client`` (or of the module). Concurrent callers share
+    a single token request. If ``stale_token``, the token a failed request
+    was sent with, is given, no new token is requested once another caller
+    has already replaced it.
+    """
+    state = get_state(client)
+    if state._token_request is None or state._token_request.done():
+        if stale_token is not None and state.oauth_client.token is not stale_token:
+            return state.oauth_client.token
+        state._token_request = asyncio.ensure_future(_fetch_token(state, get_config(client)))
+    return await asyncio.shield(state._token_request)
+
+
+async def _fetch_token(state, config):
+    body = state.oauth_client.prepare_request_body(
+        include_client_id=True, client_secret=config.oauth_client_secret)
+    headers = {
+        'Accept': 'application/json',
+        'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8',
+    }
+    resp = await state.session.post(config.oauth_token_url, content=body,
+                                    headers=headers)
+    state.oauth_client.parse_request_body_response(resp.text,
+                                                   scope=config.oauth_scope)
+    return state.oauth_client.token
+
+
+async def _send(method, url, kwargs, client=None):
+    """
+    Sends the request, returning the response and the OAuth token it was
+    sent with (None without Client Credentials).
+    """
+    state = get_state(client)
+    headers = dict(kwargs['headers'] or {})
+    token = None
+    if state.oauth_client is not None:
+        if not state.oauth_client.access_token:
+            await fetch_token(client=client)
+        token = state.oauth_client.token
+        _, headers, _ = state.oauth_client.add_token(url, http_method=method.upper(),
+                                                     headers=headers)
+    resp = await state.session.request(method, url, params=kwargs['params'],
+                                       content=kwargs['content'], headers=headers,
+                                       auth=kwargs['auth'])
+    return resp, token
+
+
+async def request_raw(method, path, params=None, body=None, headers=None,
+                      handle_errors=True, auto_retry=True, client=None):
+    """
+    Coroutine version of :func:`analyzere.requestor.request_raw`. Returns an
+    ``httpx.Response``. ``client`` is an `analyzere.Client` to send the
+    request with, through its own session, instead of the module-level
+    configuration.
+    """
+    config = get_config(client)
+    kwargs = {
+        'params': params,
+        'content': body,
+        'headers': headers,
+        'auth': None,
+    }
+
+    url = urljoin(config.base_url, path)
+
+    # Basic Auth
+    if config.username and config.password:
+        kwargs['auth'] = (config.username, config.password)
+
+    # Direct token
+    elif config.bearer_auth_token:
+        if headers is None:
+            headers = {}
+
+        headers['Authorization'] = f'Bearer {config.bearer_auth_token}'
+        kwargs['headers'] = headers
+
+    state = ensure_session_exists(client)
+
+    try:
+        resp, token = await _send(method, url, kwargs, client)
+    except TokenExpiredError:
+        # Client Credentials doesn't support refresh tokens, so fetch a new one
+        await fetch_token(state.oauth_client.token, client)
+        resp, token = await _send(method, url, kwargs, client)
+
+    # Handle HTTP 401 for Client Credentials
+    # The token could have been invalidated before expiry, refresh and retry in that case
+    if resp.status_code == 401 and config.oauth_client_id:
+        await fetch_token(token, client)
+        resp, token = await _send(method, url, kwargs, client)
+
+    # Handle HTTP 503 with the Retry-After header by automatically retrying
+    # request after sleeping for the recommended amount of time, without
+    # blocking the event loop.
+    retry_after = resp.headers.get('Retry-After')
+    while auto_retry and (resp.status_code == 503 and retry_after):
+        await asyncio.sleep(float(retry_after))
+        resp, token = await _send(method, url, kwargs, client)
+        retry_after = resp.headers.get('Retry-After')
+
+    if handle_errors and (not 200 <= resp.status_code < 300):
+        handle_api_error(resp, resp.status_code)
+
+    return resp
+
+
+async def iter_pages(fetch_page, offset=0):
+    """
+    Async generator counterpart of :func:`analyzere.base_resources.iter_pages`.
+    ``fetch_page(offset)`` is a coroutine function; the next page is requested
+    while the caller consumes the current one.
+    """
+    task = asyncio.ensure_future(fetch_page(offset))
+    try:
+        while task is not None:
+            page = await task
+            offset += len(page)
+            total_count = getattr(getattr(page, 'meta', None), 'total_count', None)
+            if len(page) and (total_count is None or offset < total_count):
+                task = asyncio.ensure_future(fetch_page(offset))
+            else:
+                task = None
+            for item in page:
+                yield item
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+# Resource mixins. Each overrides the network-bound methods of its synchronous
+# counterpart with a coroutine of the same name and signature.
+
+class AsyncResourceMixin(object):
+    @classmethod
+    async def retrieve(cls, id_):
+        cache = analyzere.resource_cache
+        if cache is not None:
+            obj = cache.get(cls, id_)
+            if obj is not None:
+                return obj
+        resp = await request('get', cls._get_path(id_), client=cls._client)
+        obj = convert_to_analyzere_object(resp, cls)
+        if cache is not None and isinstance(obj, cls):
+            cache.set(obj, id_)
+        return obj
+
+    @classmethod
+    async def list(cls, **params):
+        resp = await request('get', cls._get_path(), params=params,
+                             client=cls._client)
+        return convert_to_analyzere_object(resp, cls)
+
+    @classmethod
+    def iter_all(cls, **params):
+        """``async for`` counterpart of :meth:`Resource.iter_all`."""
+        path = cls._get_path()
+        params = dict(params)
+        offset = params.pop('offset', 0)
+
+        async def fetch_page(offset):
+            resp = await request('get', path, params=dict(params, offset=offset),
+                                 client=cls._client)
+            return convert_to_analyzere_object(resp, cls)
+
+        return iter_pages(fetch_page, offset)
+
+    async def save(self):
+        id_ = getattr(self, 'id', None)
+        method = 'put' if id_ else 'post'
+        resp = await request(method, self._get_path(id_), data=self.to_dict(),
+                             client=self._client)
+        self.clear()
+        self.update(convert_to_analyzere_object(resp, client=self._client))
+        self._update_cache(id_)
+        return self
+
+    async def reload(self):
+        id_ = getattr(self, 'id', None)
+        if not id_:
+            raise errors.MissingIdError()
+        if analyzere.resource_cache is not None:
+            analyzere.resource_cache.invalidate(type(self), id_)
+        self.clear()
+        self.update(await self.retrieve(id_))
+        self._update_cache(id_)
+        return self
+
+
+class AsyncDataResourceMixin(AsyncResourceMixin):
+    @property
+    def upload_status(self):
+        """Awaitable: ``status = await ds.upload_status``"""
+        return self._fetch_upload_status()
+
+    async def _fetch_upload_status(self):
+        resp = await request('get', self._status_path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+    async def upload_data(self, file_or_str, chunk_size=analyzere.upload_chunk_size,
+                          poll_interval=analyzere.upload_poll_interval,
+                          upload_callback=lambda x: None,
+                          commit_callback=lambda x: None):
+        """
+        Coroutine version of :meth:`DataResource.upload_data`, for strings,
+        file-like objects, bytes-like objects and iterables of bytes or str
+        pieces. Each chunk is read or generated on a worker thread, so the
+        event loop isn't blocked meanwhile. Polling for the commit to finish
+        uses ``asyncio.sleep``.
+        """
+        if not callable(upload_callback):
+            raise Exception('provided upload_callback is not callable')
+        if not callable(commit_callback):
+            raise Exception('provided commit_callback is not callable')
+
+        file_obj = StringIO(file_or_str) if isinstance(
+            file_or_str, six.string_types) else file_or_str
+        is_buffer = isinstance(file_obj, (bytes, bytearray, memoryview))
+
+        length = None
+        if is_buffer:
+            length = memoryview(file_obj).nbytes
+        elif hasattr(file_obj, 'seek'):
+            length = utils.file_length(file_obj)
+
+        if is_buffer:
+            # httpx sends bytes, not memoryview slices
+            chunks = ((bytes(c), o) for c, o in utils.slice_in_chunks(file_obj, chunk_size))
+        elif hasattr(file_obj, 'read'):
+            chunks = utils.read_in_chunks(file_obj, chunk_size)
+        else:
+            chunks = utils.iter_in_chunks(file_obj, chunk_size)
+
+        if length is not None:
+            await request_raw('post', self._data_path,
+                              headers={'Entity-Length': str(length)},
+                              client=self._client)
+        else:
+            await request_raw('post', self._data_path, client=self._client)
+
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, next, chunks, None)
+            if item is None:
+                break
+            chunk, offset = item
+            headers = {'Offset': str(offset),
+                       'Content-Type': 'application/offset+octet-stream'}
+            await request_raw('patch', self._data_path, headers=headers,
+                              body=chunk, client=self._client)
+            if length:
+                upload_callback(offset * 100.0 / length)
+
+        upload_callback(100.0)
+        await request_raw('post', self._commit_path, client=self._client)
+
+        while True:
+            resp = await self.upload_status
+            if (resp.status == 'Processing Successful' or resp.status == 'Processing Failed'):
+                commit_callback(100.0)
+                return resp
+            else:
+                commit_callback(float(resp.commit_progress))
+                await asyncio.sleep(poll_interval)
+                # Back off like the synchronous poller
+                poll_interval = min(poll_interval * 2,
+                                    max(analyzere.max_poll_interval, poll_interval))
+
+    async def upload_table(self, table, header=None, batch_rows=None, **kwargs):
+        """
+        Coroutine version of :meth:`DataResource.upload_table`; the CSV is
+        rendered batch by batch on worker threads while earlier chunks are
+        being sent.
+        """
+        return await self.upload_data(tables.iter_csv(table, header, batch_rows), **kwargs)
+
+    async def download_data(self):
+        return (await request_raw('get', self._data_path, client=self._client)).content
+
+    async def delete_data(self):
+        await request_raw('delete', self._data_path, client=self._client)
+
+
+_missing = object()
+
+
+class AsyncMetricsResourceMixin(AsyncResourceMixin):
+    # tail_metrics, window_metrics, co_metrics, window_co_metrics, ep, tvar
+    # and window_var are inherited unchanged: they return the coroutine
+    # produced by _get_vector_metrics.
+    async def _request_metrics(self, path, params=None, auto_retry=True):
+        cache = analyzere.metrics_cache
+        if cache is None:
+            return await request('get', path, params=params,
+                                 auto_retry=auto_retry, client=self._client)
+        key = metrics_key(get_config(self._client).base_url, path, params)
+        resp = cache.get(key, _missing)
+        if resp is _missing:
+            resp = await request('get', path, params=params,
+                                 auto_retry=auto_retry, client=self._client)
+            cache.set(key, resp)
+        return resp
+
+    async def _get_metrics(self, path, params=None, auto_retry=True):
+        resp = await self._request_metrics(path, params, auto_retry)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+    async def _fetch_vector_metrics(self, kind, values, vectorizer,
+                                    params=None, auto_retry=True):
+        chunks = (self._split_vector(kind, values, vectorizer, params)
+                  if isinstance(values, list) else [])
+
+        async def fetch(values):
+            return await request('get', self._vector_path(kind, values, vectorizer),
+                                 params=params, auto_retry=auto_retry,
+                                 client=self._client)
+
+        if len(chunks) <= 1:
+            return await fetch(values)
+        responses = await asyncio.gather(*[fetch(chunk) for chunk in chunks])
+        return self._join_vector_metrics(chunks, responses)
+
+    async def _get_vector_metrics(self, kind, values, vectorizer, params=None,
+                                  auto_retry=True):
+        cache = analyzere.metrics_cache
+        if cache is None:
+            resp = await self._fetch_vector_metrics(kind, values, vectorizer,
+                                                    params, auto_retry)
+            return convert_to_analyzere_object(resp, client=self._client)
+
+        items = values if isinstance(values, list) else [values]
+        keys, found, missing = self._lookup_vector_metrics(
+            kind, items, vectorizer, params, cache)
+        resp = None
+        if missing:
+            resp = await self._fetch_vector_metrics(
+                kind, list(missing.values()), vectorizer, params, auto_retry)
+        merged = self._merge_vector_metrics(values, keys, found, missing, resp,
+                                            cache)
+        if merged is None:
+            if len(missing) < len(items):
+                resp = await self._fetch_vector_metrics(kind, values, vectorizer,
+                                                        params, auto_retry)
+            merged = resp
+        return convert_to_analyzere_object(merged, client=self._client)
+
+    def submit(self, metric, *args, **params):
+        """
+        Requests ``metric`` (the name of a metrics method, e.g.
+        ``'tail_metrics'``) with ``args`` and ``params`` in the background and
+        returns an `asyncio.Task` for its result; must be called with an event
+        loop running.
+
+        A 503 Retry-After response is retried after the interval with
+        `asyncio.sleep`, so any number of computations can be pending at once.
+        """
+        params['auto_retry'] = True
+        return asyncio.ensure_future(getattr(self, metric)(*args, **params))
+
+    async def el(self, auto_retry=True, **params):
+        path = '{}/el'.format(self._get_path(self.id))
+        return float(await self._request_metrics(path, params, auto_retry))
+
+    async def download_ylt(self, auto_retry=True, **params):
+        path = '{}/ylt'.format(self._get_path(self.id))
+        resp = await request_raw('get', path, params=params,
+                                 auto_retry=auto_retry, client=self._client)
+        return resp.content
+
+    async def download_yelt(self, auto_retry=True, **params):
+        path = '{}/yelt'.format(self._get_path(self.id))
+        resp = await request_raw('get', path, params=params,
+                                 auto_retry=auto_retry, client=self._client)
+        return resp.content
+
+    async def back_allocation(self, source_id, auto_retry=True, **params):
+        params['source_id'] = source_id
+        path = '{}/back_allocations'.format(self._get_path(self.id))
+        return await self._get_metrics(path, params, auto_retry)
+
+
+# Event catalogs
+
+class EventCatalog(AsyncDataResourceMixin, resources.EventCatalog):
+    async def profile(self):
+        path = '%s/profile' % self._get_path(self.id)
+        resp = await request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+
+# Exchange rate tables
+
+class ExchangeRateTable(AsyncDataResourceMixin, resources.ExchangeRateTable):
+    async def currencies(self):
+        path = '{}/currencies'.format(self._get_path(self.id))
+        resp = await request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+
+class ExchangeRateProfile(AsyncResourceMixin, resources.ExchangeRateProfile):
+    pass
+
+
+# Distributions
+
+class Distribution(AsyncDataResourceMixin, resources.Distribution):
+    pass
+
+
+# Loss sets
+
+class LossSet(AsyncDataResourceMixin, resources.LossSet):
+    pass
+
+
+# Layers
+
+class Layer(AsyncResourceMixin, resources.Layer):
+    pass
+
+
+# Portfolios
+
+class Portfolio(AsyncResourceMixin, resources.Portfolio):
+    pass
+
+
+# Simulations
+
+class Simulation(AsyncDataResourceMixin, resources.Simulation):
+    pass
+
+
+# Loss attributes
+
+class LossAttribute(AsyncResourceMixin, resources.LossAttribute):
+    pass
+
+
+# Loss filters
+
+class LossFilter(AsyncResourceMixin, resources.LossFilter):
+    pass
+
+
+# Layer views
+
+class LayerView(AsyncMetricsResourceMixin, resources.LayerView):
+    pass
+
+
+class AnalysisProfile(AsyncResourceMixin, resources.AnalysisProfile):
+    pass
+
+
+# Portfolio views
+
+class PortfolioView(AsyncMetricsResourceMixin, resources.PortfolioView):
+    async def marginal(self, layer_views_to_add, layer_views_to_remove):
+        path = 'portfolio_view_marginals'
+        data = await request('post', path, client=self._client, data={
+            'portfolio_view_id': to_dict(self.reference()),
+            'add_layer_view_ids': [to_dict(lv.reference()) for lv in layer_views_to_add],
+            'remove_layer_view_ids': [to_dict(lv.reference()) for lv in layer_views_to_remove]
+        })
+        return await self.retrieve(data['portfolio_view']['ref_id'])
+
+
+class DynamicPortfolioView(AsyncMetricsResourceMixin, resources.DynamicPortfolioView):
+    pass
+
+
+# Optimization views
+
+class OptimizationView(AsyncResourceMixin, resources.OptimizationView):
+    async def result(self):
+        warnings.warn(
+            "result() is deprecated, use candidates() instead to page over results",
+            DeprecationWarning
+        )
+        path = '{}/result'.format(self._get_path(self.id))
+        resp = await request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+    async def initial_metrics(self):
+        path = '{}/initial_portfolio_metrics'.format(self._get_path(self.id))
+        resp = await request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+    def _candidates_path(self, name, index):
+        if index is None:
+            return '{}/{}'.format(self._get_path(self.id), name)
+        try:
+            index = int(index)
+        except ValueError:
+            raise Exception('index argument provided to OptimizationView.{}() '
+                            'must be an integer'.format(name))
+        return '{}/{}/{}'.format(self._get_path(self.id), name, index)
+
+    async def candidates(self, index=None, **params):
+        resp = await request('get', self._candidates_path('candidates', index),
+                             params=params or None, client=self._client)
+        return convert_to_analyzere_object(resp, Candidate, self._client,
+                                           optimization_view_id=self.id)
+
+    def iter_candidates(self, **params):
+        """``async for`` counterpart of :meth:`OptimizationView.iter_candidates`."""
+        params = dict(params)
+        offset = params.pop('offset', 0)
+        return iter_pages(lambda offset: self.candidates(offset=offset, **params),
+                          offset)
+
+    async def candidate_parameters(self, index=None):
+        resp = await request('get', self._candidates_path('candidate_parameters', index),
+                             client=self._client)
+        return convert_to_analyzere_object(resp, Candidate, self._client,
+                                           optimization_view_id=self.id)
+
+    async def candidate_metrics(self):
+        path = '{}/candidate_metrics'.format(self._get_path(self.id))
+        resp = await request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+    async def sensitivity_analysis(self, candidates=[]):
+        candidates = list(filter(lambda x: isinstance(x, int) and x >= 0, candidates))
+        if len(candidates) == 0:
+            path = '{}/sensitivity_analysis'.format(self._get_path(self.id))
+        else:
+            path = '{}/sensitivity_analysis?candidates={}'.format(self._get_path(self.id),
+                                                                  ','.join(str(c) for c in candidates))
+        resp = await request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+
+class Candidate(resources.Candidate):
+    async def portfolio_view(self):
+        path = '{}/candidates/{}/portfolio_view'.format(OptimizationView._get_path(self.optimization_view_id),
+                                                        self.index)
+        resp = await request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, PortfolioView, self._client)
@@ -1,5 +1,9 @@
 from __future__ import division
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import copy
+import functools
+import heapq
 import json
 import time
 from inspect import isclass
@@ -8,12 +12,13 @@ from lazy_object_proxy import Proxy
 import six
 import uuid
 from six import StringIO
-from six.moves.urllib.parse import urljoin
+from six.moves.urllib.parse import urlencode, urljoin
 
 import analyzere
-from analyzere import utils
-from analyzere.errors import MissingIdError
-from analyzere.requestor import request, request_raw
+from analyzere import polling, tables, uploads, utils
+from analyzere.cache import metrics_key
+from analyzere.errors import InvalidRequestError, MissingIdError, RetryAfter, ServerError
+from analyzere.requestor import get_config, request, request_raw
 from analyzere.utils import vectorize, vectorize_range
 
 
@@ -28,15 +33,18 @@ class Reference(Proxy):
     _id = None
     _href = None
     _resolved = False
+    _client = None
 
-    def __init__(self, href):
+    def __init__(self, href, client=None):
         collection_name, self._id = utils.parse_href(href)
         self._href = href
+        self._client = client
 
         def resolve():
             r = load_reference(
                 collection_name,
-                Proxy.__getattribute__(self, '_id')
+                Proxy.__getattribute__(self, '_id'),
+                client=client
             )
             self._resolved = True
             return r
@@ -46,12 +54,12 @@ class Reference(Proxy):
     def __copy__(self):
         if self._resolved:
             return copy.copy(self.__wrapped__)
-        return Reference(self._href)
+        return Reference(self._href, self._client)
 
     def __deepcopy__(self, memo):
         if self._resolved:
             return copy.deepcopy(self.__wrapped__, memo)
-        return Reference(self._href)
+        return Reference(self._href, self._client)
 
     def __getattribute__(self, name):
         # To see if name is an instanced attribute of Reference. Here we can
@@ -68,7 +76,8 @@ class Reference(Proxy):
         def update_ref(item):
             try:
                 id_ = item.id
-                href_ = urljoin(analyzere.base_url, item._get_path(id_))
+                href_ = urljoin(get_config(self._client).base_url,
+                                item._get_path(id_))
                 self._id = id_
                 self._href = href_
             except AttributeError:
@@ -91,7 +100,7 @@ class Reference(Proxy):
             return attr
 
 
-def load_reference(collection_name, id_):
+def load_reference(collection_name, id_, client=None):
     class_name = utils.to_camel_case(collection_name[:-1])
     try:
         cls = getattr(analyzere, class_name)
@@ -109,23 +118,151 @@ def load_reference(collection_name, id_):
                 # one is made for each collection.
                 return self.__dict__ == other.__dict__
         cls = UnknownResource
+    if client is not None:
+        cls = client.bind(cls)
     return cls.retrieve(id_)
 
 
-def convert_to_analyzere_object(value, cls=None, **kwargs):
+def _collect_references(value, found, seen):
+    if isinstance(value, Reference):
+        # Checked first since other operations may evaluate the reference.
+        if not value._resolved:
+            found.append(value)
+            return
+        value = value.__wrapped__
+    if id(value) in seen:
+        return
+    seen.add(id(value))
     if isinstance(value, list):
-        return [convert_to_analyzere_object(v, cls, **kwargs) for v in value]
+        for v in value:
+            _collect_references(v, found, seen)
+    elif isinstance(value, AnalyzeReObject):
+        for v in value.__dict__.values():
+            _collect_references(v, found, seen)
+
+
+def resolve_references(value, max_workers=None):
+    """
+    Concurrently resolves the unresolved references in ``value``, which may
+    be a Reference, a resource (e.g. a Portfolio, whose ``layers`` are then
+    resolved), or a list or PaginatedCollection of either. Each reference is
+    populated in place, so later attribute access makes no request.
+
+    References are fetched once per href, at most ``max_workers`` (default
+    `analyzere.max_concurrent_requests`) at a time. References within the
+    resolved objects are left lazy. Returns ``value``.
+    """
+    found = []
+    _collect_references(value, found, set())
+
+    by_href = {}
+    for ref in found:
+        by_href.setdefault(ref._href, []).append(ref)
+    if not by_href:
+        return value
+
+    def resolve(refs):
+        obj = refs[0].__wrapped__
+        for ref in refs[1:]:
+            # Duplicates get their own copy, as if each had been resolved
+            # separately, unless the identity map is enabled.
+            shared = analyzere.resource_cache is not None
+            ref.__wrapped__ = obj if shared else copy.deepcopy(obj)
+            ref._resolved = True
+
+    max_workers = max_workers or analyzere.max_concurrent_requests
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(by_href))) as executor:
+        for _ in executor.map(resolve, by_href.values()):
+            pass
+    return value
+
+
+def batch_metrics(views, metric, *args, **kwargs):
+    """
+    Requests the same metrics for many views concurrently, e.g.::
+
+        batch_metrics(layer_views, 'tail_metrics', [0.01, 0.004])
+        batch_metrics(portfolio_views, 'el', perspective='NetLoss')
+
+    ``metric`` names a MetricsResource method (or is a function taking the
+    view first), called with ``args`` and ``kwargs`` for every view. At most
+    ``max_workers`` (default `analyzere.max_concurrent_requests`) requests
+    run at a time.
+
+    A view answered with 503 Retry-After is rescheduled after the requested
+    delay while the other views proceed, unless ``auto_retry`` is False.
+    Returns the results in the order of ``views``; a view whose request
+    failed gets the exception instance in place of its result.
+    """
+    max_workers = kwargs.pop('max_workers', None) or analyzere.max_concurrent_requests
+    auto_retry = kwargs.pop('auto_retry', True)
+    views = list(views)
+    results = [None] * len(views)
+
+    def fetch(view):
+        method = (getattr(view, metric) if isinstance(metric, str)
+                  else functools.partial(metric, view))
+        return method(*args, auto_retry=False, **kwargs)
+
+    ready = deque(range(len(views)))
+    delayed = []  # heap of (monotonic time, index)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(views)))) as executor:
+        while ready or delayed or running:
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                ready.append(heapq.heappop(delayed)[1])
+            while ready and len(running) < max_workers:
+                i = ready.popleft()
+                running[executor.submit(fetch, views[i])] = i
+
+            timeout = max(0, delayed[0][0] - now) if delayed else None
+            if not running:
+                # Only rescheduled views are left
+                time.sleep(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                try:
+                    results[i] = future.result()
+                except RetryAfter as e:
+                    if auto_retry and e.retry_after is not None:
+                        heapq.heappush(delayed, (time.monotonic() + e.retry_after, i))
+                    else:
+                        results[i] = e
+                except Exception as e:
+                    results[i] = e
+    return results
+
+
+def convert_to_analyzere_object(value, cls=None, client=None, **kwargs):
+    """
+    Converts a deserialized response into resources of class ``cls``,
+    embedded resources and References. Resources and References are bound to
+    ``client``, which defaults to the client ``cls`` is bound to.
+    """
+    if cls is not None and client is None:
+        client = cls._client
+    if isinstance(value, list):
+        return [convert_to_analyzere_object(v, cls, client, **kwargs) for v in value]
     elif isinstance(value, dict):
         if 'href' in value:
-            return Reference(value['href'])
+            return Reference(value['href'], client)
 
         if 'items' in value and 'meta' in value:
-            items = convert_to_analyzere_object(value['items'], cls, **kwargs)
+            items = convert_to_analyzere_object(value['items'], cls, client, **kwargs)
             meta = convert_to_analyzere_object(value['meta'])
             return PaginatedCollection(items, meta)
 
         if cls and ('id' in value or issubclass(cls, NestedResource)):
+            if client is not None:
+                cls = client.bind(cls)
             obj = cls(**kwargs)
+        elif analyzere.compact_resources:
+            return compact_resource(
+                {('type' if k == '_type' else k): convert_to_analyzere_object(v, client=client)
+                 for k, v in six.iteritems(value)})
         else:
             obj = EmbeddedResource()
 
@@ -133,7 +270,7 @@ def convert_to_analyzere_object(value, cls=None, **kwargs):
             # Rename "_type" attribute to "type" so it's not considered private
             if k == '_type':
                 k = 'type'
-            setattr(obj, k, convert_to_analyzere_object(v))
+            setattr(obj, k, convert_to_analyzere_object(v, client=client))
         return obj
     else:
         return value
@@ -158,9 +295,67 @@ def to_dict(value):
         return value
 
 
+def iter_pages(fetch_page, offset=0):
+    """
+    Generator over every item of a paginated listing. ``fetch_page(offset)``
+    must return the PaginatedCollection starting at ``offset``. While the
+    caller consumes one page, the next is fetched on a background thread, so
+    only two pages are held in memory at a time.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fetch_page, offset)
+        while future is not None:
+            page = future.result()
+            offset += len(page)
+            total_count = getattr(getattr(page, 'meta', None), 'total_count', None)
+            if len(page) and (total_count is None or offset < total_count):
+                future = executor.submit(fetch_page, offset)
+            else:
+                future = None
+            for item in page:
+                yield item
+
+
+def iter_response(resp, chunk_size, lines=False):
+    """
+    Generator over the body of a streamed response, as byte chunks or, with
+    ``lines=True``, as lines without their line endings. The response is
+    closed once exhausted.
+    """
+    try:
+        if lines:
+            for line in resp.iter_lines(chunk_size=chunk_size):
+                yield line
+        else:
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                yield chunk
+    finally:
+        resp.close()
+
+
+def download(path, file_or_path=None, chunk_size=None, params=None,
+             auto_retry=True, client=None):
+    """
+    Returns the body at ``path`` as bytes or, if ``file_or_path`` is given,
+    streams it into that file object or path and returns the number of bytes
+    written.
+    """
+    if file_or_path is None:
+        return request_raw('get', path, params=params, auto_retry=auto_retry,
+                           client=client).content
+    resp = request_raw('get', path, params=params, auto_retry=auto_retry,
+                       stream=True, client=client)
+    chunk_size = chunk_size or analyzere.download_chunk_size
+    return utils.write_chunks(iter_response(resp, chunk_size), file_or_path)
+
+
 # Base classes
 
 class AnalyzeReObject(object):
+    # analyzere.Client that requests are sent with; set on classes bound with
+    # Client.bind(), None for the module-level configuration.
+    _client = None
+
     def __init__(self, **kwargs):
         type_value = kwargs.pop('_type', None)
         if type_value:
@@ -190,7 +385,7 @@ class AnalyzeReObject(object):
         return not self.__eq__(other)
 
     def update(self, other):
-        return self.__dict__.update(other.__dict__)
+        return self.__dict__.update(_attributes(other))
 
     def clear(self):
         return self.__dict__.clear()
@@ -241,33 +436,75 @@ class Resource(AnalyzeReObject):
 
     @classmethod
     def retrieve(cls, id_):
-        resp = request('get', cls._get_path(id_))
-        return convert_to_analyzere_object(resp, cls)
+        cache = analyzere.resource_cache
+        if cache is not None:
+            obj = cache.get(cls, id_)
+            if obj is not None:
+                return obj
+        resp = request('get', cls._get_path(id_), client=cls._client)
+        obj = convert_to_analyzere_object(resp, cls)
+        if cache is not None and isinstance(obj, cls):
+            cache.set(obj, id_)
+        return obj
 
     @classmethod
     def list(cls, **params):
-        resp = request('get', cls._get_path(), params=params)
+        resp = request('get', cls._get_path(), params=params,
+                       client=cls._client)
         return convert_to_analyzere_object(resp, cls)
 
+    @classmethod
+    def iter_all(cls, **params):
+        """
+        Generator over every resource matching the ``list`` query ``params``,
+        requesting page after page (of ``limit`` items, if given) and
+        prefetching the next page while the current one is consumed.
+        """
+        path = cls._get_path()
+        params = dict(params)
+        offset = params.pop('offset', 0)
+
+        def fetch_page(offset):
+            resp = request('get', path, params=dict(params, offset=offset),
+                           client=cls._client)
+            return convert_to_analyzere_object(resp, cls)
+
+        return iter_pages(fetch_page, offset)
+
     def save(self):
         id_ = getattr(self, 'id', None)
         method = 'put' if id_ else 'post'
-        resp = request(method, self._get_path(id_), data=self.to_dict())
+        resp = request(method, self._get_path(id_), data=self.to_dict(),
+                       client=self._client)
         self.clear()
-        self.update(convert_to_analyzere_object(resp))
+        self.update(convert_to_analyzere_object(resp, client=self._client))
+        self._update_cache(id_)
         return self
 
     def reload(self):
         id_ = getattr(self, 'id', None)
         if not id_:
             raise MissingIdError()
+        if analyzere.resource_cache is not None:
+            analyzere.resource_cache.invalidate(type(self), id_)
         self.clear()
         self.update(self.retrieve(id_))
+        self._update_cache(id_)
         return self
 
+    def _update_cache(self, previous_id=None):
+        # Makes this instance, which holds fresh server state, the cached
+        # identity for its id.
+        cache = analyzere.resource_cache
+        if cache is not None:
+            if previous_id:
+                cache.invalidate(type(self), previous_id)
+            cache.set(self)
+
     def reference(self):
         id_ = getattr(self, 'id', None)
-        return Reference(urljoin(analyzere.base_url, self._get_path(id_)))
+        base_url = get_config(self._client).base_url
+        return Reference(urljoin(base_url, self._get_path(id_)), self._client)
 
 
 class EmbeddedResource(AnalyzeReObject):
@@ -279,6 +516,132 @@ class EmbeddedResource(AnalyzeReObject):
         return getattr(self, item, None)
 
 
+class CompactResource(EmbeddedResource):
+    """
+    Base of the EmbeddedResource classes created by `compact_resource`, one
+    per set of attribute names, which hold those attributes in slots rather
+    than in a ``__dict__``. Other attributes set later are kept in a dict of
+    their own; the ``__dict__`` inherited from EmbeddedResource is never
+    used, nor created.
+    """
+    __slots__ = ('_extra',)
+    _fields = ()
+
+    def __init__(self, **kwargs):
+        for k, v in six.iteritems(kwargs):
+            setattr(self, k, v)
+
+    def _extras(self):
+        try:
+            return self._extra
+        except AttributeError:
+            return None
+
+    def _attributes(self):
+        d = {}
+        for name in self._fields:
+            try:
+                d[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        extra = self._extras()
+        if extra:
+            d.update(extra)
+        return d
+
+    def __getattr__(self, name):
+        # Only called for attributes not found in the slots
+        extra = self._extras() if name != '_extra' else None
+        if extra and name in extra:
+            return extra[name]
+        raise AttributeError("'EmbeddedResource' object has no attribute '{}'".format(name))
+
+    def __setattr__(self, name, value):
+        if name in self._fields or name == '_extra':
+            object.__setattr__(self, name, value)
+        else:
+            extra = self._extras()
+            if extra is None:
+                extra = self._extra = {}
+            extra[name] = value
+
+    def __delattr__(self, name):
+        extra = self._extras()
+        if extra and name in extra:
+            del extra[name]
+        else:
+            object.__delattr__(self, name)
+
+    def __eq__(self, other):
+        return (isinstance(other, CompactResource) or type(other) is EmbeddedResource) and \
+            self._attributes() == _attributes(other)
+
+    def __hash__(self):
+        return super(CompactResource, self).__hash__()
+
+    def __reduce__(self):
+        return compact_resource, (self._attributes(),)
+
+    def update(self, other):
+        for k, v in six.iteritems(_attributes(other)):
+            setattr(self, k, v)
+
+    def clear(self):
+        for name in self._attributes():
+            delattr(self, name)
+
+    def to_dict(self):
+        d = {}
+        for k, v in six.iteritems(self._attributes()):
+            if isinstance(k, str) and k.startswith('_'):
+                continue
+            elif k == 'type':
+                k = '_type'
+            d[k] = to_dict(v)
+        return d
+
+
+def _attributes(obj):
+    return obj._attributes() if isinstance(obj, CompactResource) else obj.__dict__
+
+
+# CompactResource classes by their attribute names
+_compact_classes = {}
+_max_compact_classes = 1024
+
+
+def _compact_class(fields):
+    cls = _compact_classes.get(fields)
+    if cls is None:
+        if len(_compact_classes) >= _max_compact_classes or not all(
+                isinstance(f, str) and f.isidentifier() and not f.startswith('_') and
+                not hasattr(CompactResource, f) for f in fields):
+            return None
+        cls = type('EmbeddedResource', (CompactResource,),
+                   {'__slots__': fields, '_fields': fields, '__module__': __name__})
+        cls._setters = tuple(cls.__dict__[f].__set__ for f in fields)
+        cls = _compact_classes.setdefault(fields, cls)
+    return cls
+
+
+def compact_resource(attributes):
+    """
+    Returns an EmbeddedResource with the given attributes, as an instance of
+    the CompactResource class shared by every object with the same attribute
+    names. Falls back to a plain EmbeddedResource for names that can't be
+    slots.
+    """
+    cls = _compact_class(tuple(attributes))
+    if cls is None:
+        obj = EmbeddedResource()
+        obj.__dict__.update(attributes)
+        return obj
+    obj = cls.__new__(cls)
+    for setter, value in zip(cls._setters, attributes.values()):
+        setter(obj, value)
+    return obj
+
+
 class NestedResource(AnalyzeReObject):
     """
     May appear embedded within another response object, similar to EmbeddedResource,
@@ -303,24 +666,66 @@ class DataResource(Resource):
 
     @property
     def upload_status(self):
-        resp = request('get', self._status_path)
-        return convert_to_analyzere_object(resp)
+        resp = request('get', self._status_path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
 
     def upload_data(self, file_or_str, chunk_size=analyzere.upload_chunk_size,
                     poll_interval=analyzere.upload_poll_interval,
                     upload_callback=lambda x: None,
-                    commit_callback=lambda x: None):
+                    commit_callback=lambda x: None,
+                    read_ahead=1, wait=True, resume=False,
+                    progress_file=None, compression=None, memory_map=False,
+                    throttle=None):
         """
-        Accepts a file-like object or string and uploads it. Files are
-        automatically uploaded in chunks. The default chunk size is 16MiB and
-        can be overwritten by specifying the number of bytes in the
-        ``chunk_size`` variable.
-        Accepts an optional poll_interval for temporarily overriding the
-        default value `analyzere.upload_poll_interval`.
-        Implements the tus protocol.
-        Takes optional callbacks that return the percentage complete for the
-        given "phase" of upload: upload/commit.
-        Callback values are returned as 10.0 for 10%
+        Uploads a file-like object, string, bytes-like object (bytes,
+        bytearray, memoryview) or an iterable of bytes or str pieces, e.g. a
+        generator of CSV rows, in chunks using the tus protocol, then commits
+        it. Returns the final upload status once the data has been processed.
+
+        ``chunk_size``: bytes per chunk (default 16MiB), or an
+        `analyzere.uploads.ChunkSizer` that adapts it to the measured
+        throughput; a new size applies to chunks read after it was chosen.
+
+        ``poll_interval``: first interval between commit status checks
+        (default `analyzere.upload_poll_interval`), doubled with every check
+        up to `analyzere.max_poll_interval`.
+
+        ``upload_callback``, ``commit_callback``: called with the percentage
+        complete of each phase, e.g. 10.0 for 10%.
+
+        ``read_ahead``: number of chunks read, generated and compressed on
+        background threads while the current one is sent; 0 prepares each
+        chunk on the calling thread. Chunks are always sent in offset order.
+
+        ``wait``: if False, a ``Future`` for the final status is returned as
+        soon as the upload is committed; the status is polled by the shared
+        poller of `analyzere.polling`, which also calls ``commit_callback``.
+
+        ``resume``: continue an interrupted upload session from the offset
+        the server has stored; a file object must be positioned at its
+        start. A session for data of another length is replaced instead.
+
+        ``progress_file``: local file recording the acknowledged offset, from
+        which an upload of the same resource and length is resumed
+        automatically, e.g. after a crash. Removed once committed.
+
+        ``compression``: gzip level (1-9) to compress each chunk with before
+        sending it with ``Content-Encoding: gzip``.
+
+        ``memory_map``: send a file on disk from pieces of it mapped into
+        memory instead of reading a copy of each chunk. Bytes-like objects
+        are always sent in slices without copying.
+
+        ``throttle``: called with the number of bytes of each chunk (after
+        compression) before it is sent, e.g. an
+        `analyzere.uploads.RateLimiter` shared by uploads.
+
+        Memory: with ``read_ahead=0`` one chunk is held at a time. Otherwise
+        up to ``read_ahead + 2`` chunks are: those read ahead, one waiting to
+        be queued and one being sent. ``compression`` adds up to
+        ``read_ahead`` more being compressed, for ``2 * read_ahead + 2``.
+        Bytes-like objects and memory-mapped files are not copied, so only
+        their compressed chunks count.
         """
         if not callable(upload_callback):
             raise Exception('provided upload_callback is not callable')
@@ -329,109 +734,400 @@ class DataResource(Resource):
 
         file_obj = StringIO(file_or_str) if isinstance(
             file_or_str, six.string_types) else file_or_str
+        is_buffer = isinstance(file_obj, (bytes, bytearray, memoryview))
+        is_iterable = not is_buffer and not hasattr(file_obj, 'read')
 
         # Upload file with known entity size if file object supports random
         # access.
         length = None
-        if hasattr(file_obj, 'seek'):
+        if is_buffer:
+            length = memoryview(file_obj).nbytes
+        elif hasattr(file_obj, 'seek'):
             length = utils.file_length(file_obj)
 
+        progress = None
+        offset_callback = None
+        if progress_file is not None:
+            url = urljoin(get_config(self._client).base_url, self._data_path)
+            progress = uploads.UploadProgress(progress_file)
+            resume = resume or progress.matches(url, length)
+            offset_callback = functools.partial(progress.save, url, length)
+
+        offset = None
+        if resume:
+            try:
+                # None for a session started for data of another length
+                offset = uploads.get_offset(self._data_path, self._client, length)
+            except InvalidRequestError:
+                # No upload session to continue
+                offset = None
+
+        if offset is None:
             # Initiate upload session
-            request_raw('post', self._data_path,
-                        headers={'Entity-Length': str(length)})
-        else:
-            request_raw('post', self._data_path)
+            offset = 0
+            if length is not None:
+                request_raw('post', self._data_path,
+                            headers={'Entity-Length': str(length)},
+                            client=self._client)
+            else:
+                request_raw('post', self._data_path, client=self._client)
+        elif offset and not (is_buffer or is_iterable or memory_map):
+            # Skip the data the server already has
+            if hasattr(file_obj, 'seek'):
+                file_obj.seek(offset)
+            else:
+                utils.skip_bytes(file_obj, offset, chunk_size)
 
         # Upload chunks
-        for chunk, offset in utils.read_in_chunks(file_obj, chunk_size):
-            headers = {'Offset': str(offset),
-                       'Content-Type': 'application/offset+octet-stream'}
-            request_raw('patch', self._data_path, headers=headers, body=chunk)
-            # if there is a known size, and an upload callback, call it
-            if length:
-                upload_callback(offset * 100.0 / length)
+        if is_buffer:
+            chunks = utils.slice_in_chunks(file_obj, chunk_size, offset)
+        elif memory_map:
+            chunks = utils.map_in_chunks(file_obj, chunk_size, offset)
+        elif is_iterable:
+            chunks = utils.iter_in_chunks(file_obj, chunk_size, offset)
+        else:
+            chunks = utils.read_in_chunks(file_obj, chunk_size, offset)
+        if read_ahead > 0 and not (is_buffer or memory_map):
+            # Slices of buffers and mapped files cost nothing to produce
+            chunks = uploads.prefetch(chunks, depth=read_ahead)
+        if compression:
+            chunks = uploads.compress_chunks(chunks, compression, ahead=read_ahead)
+        try:
+            uploads.send_chunks(self._data_path, chunks,
+                                length=length, upload_callback=upload_callback,
+                                client=self._client, offset_callback=offset_callback,
+                                sizer=chunk_size if isinstance(chunk_size, uploads.ChunkSizer) else None,
+                                throttle=throttle)
+        finally:
+            # Stops any background reading of the data
+            chunks.close()
 
         upload_callback(100.0)
         # Commit the session
-        request_raw('post', self._commit_path)
+        request_raw('post', self._commit_path, client=self._client)
+        if progress is not None:
+            progress.clear()
 
-        # Block until data has finished processing
-        while True:
+        # Poll until data has finished processing
+        def check():
             resp = self.upload_status
             if (resp.status == 'Processing Successful' or resp.status == 'Processing Failed'):
                 commit_callback(100.0)
-                return resp
+                return True, resp
             else:
                 commit_callback(float(resp.commit_progress))
-                time.sleep(poll_interval)
+                return False, resp
+
+        commit = polling.poll(check, interval=poll_interval)
+        return commit.result() if wait else commit
+
+    def upload_table(self, table, header=None, batch_rows=None, **kwargs):
+        """
+        Uploads a table of numeric columns, e.g. a YELT as a NumPy structured
+        array or a dict of column arrays, as CSV. Rows are rendered in
+        batches on a background thread while earlier chunks are being sent,
+        so the CSV is never held in memory as a whole. See
+        `tables.iter_csv` for ``header`` and ``batch_rows``; other arguments
+        are passed to ``upload_data``.
+        """
+        return self.upload_data(tables.iter_csv(table, header, batch_rows), **kwargs)
 
-    def download_data(self):
-        return request_raw('get', self._data_path).content
+    def download_data(self, file_or_path=None, chunk_size=None):
+        """
+        Returns the uploaded data as bytes. If ``file_or_path`` is given, the
+        data is instead streamed in ``chunk_size`` pieces into that file
+        object or path, and the number of bytes written is returned.
+        """
+        return download(self._data_path, file_or_path, chunk_size,
+                        client=self._client)
+
+    def iter_data(self, chunk_size=None, lines=False):
+        """
+        Streams the uploaded data, yielding byte chunks of ``chunk_size``
+        (default `analyzere.download_chunk_size`) or lines if ``lines`` is set.
+        """
+        resp = request_raw('get', self._data_path, stream=True,
+                           client=self._client)
+        return iter_response(resp, chunk_size or analyzere.download_chunk_size,
+                             lines)
 
     def delete_data(self):
-        request_raw('delete', self._data_path)
+        request_raw('delete', self._data_path, client=self._client)
+
+
+_missing = object()
 
 
 class MetricsResource(Resource):
     """
     TODO: should the names of these functions be improved?
     """
+    def _request_metrics(self, path, params=None, auto_retry=True):
+        # Metrics of a view never change, so responses are served from
+        # analyzere.metrics_cache when one is configured.
+        cache = analyzere.metrics_cache
+        if cache is None:
+            return request('get', path, params=params, auto_retry=auto_retry,
+                           client=self._client)
+        key = metrics_key(get_config(self._client).base_url, path, params)
+        resp = cache.get(key, _missing)
+        if resp is _missing:
+            resp = request('get', path, params=params, auto_retry=auto_retry,
+                           client=self._client)
+            cache.set(key, resp)
+        return resp
+
     def _get_metrics(self, path, params=None, auto_retry=True):
-        resp = request('get', path, params=params, auto_retry=auto_retry)
-        return convert_to_analyzere_object(resp)
+        resp = self._request_metrics(path, params, auto_retry)
+        return convert_to_analyzere_object(resp, client=self._client)
+
+    def _vector_path(self, kind, values, vectorizer):
+        return '{}/{}/{}'.format(self._get_path(self.id), kind, vectorizer(values))
+
+    def _lookup_vector_metrics(self, kind, items, vectorizer, params, cache):
+        """
+        Looks up the result of every probability, threshold or window in
+        ``items`` separately, under the key it would have if requested alone.
+        Returns the keys, the cached results by key and the missing values by
+        key.
+        """
+        base_url = get_config(self._client).base_url
+        keys = [metrics_key(base_url, self._vector_path(kind, item, vectorizer), params)
+                for item in items]
+        found = {}
+        missing = OrderedDict()
+        for key, item in zip(keys, items):
+            if key not in found and key not in missing:
+                result = cache.get(key, _missing)
+                if result is _missing:
+                    missing[key] = item
+                else:
+                    found[key] = result
+        return keys, found, missing
+
+    @staticmethod
+    def _merge_vector_metrics(values, keys, found, missing, resp, cache):
+        """
+        Caches the results ``resp`` of the ``missing`` values one by one and
+        merges them with the ``found`` ones in the order of ``keys``. Returns
+        None if ``resp`` doesn't hold one result per missing value.
+        """
+        if missing:
+            if len(missing) == 1 and not isinstance(resp, list):
+                # A single value is answered with a single result
+                resp = [resp]
+            if not isinstance(resp, list) or len(resp) != len(missing):
+                return None
+            for key, result in zip(missing, resp):
+                cache.set(key, result)
+                found[key] = result
+        merged = [found[key] for key in keys]
+        return merged if isinstance(values, list) else merged[0]
+
+    def _split_vector(self, kind, values, vectorizer, params):
+        """
+        Splits the list ``values`` into chunks whose request URLs stay within
+        `analyzere.max_url_length`. A value too long by itself gets its own
+        chunk.
+        """
+        url = urljoin(get_config(self._client).base_url,
+                      self._vector_path(kind, [], vectorizer))
+        if params:
+            url += '?' + urlencode(params, doseq=True)
+        budget = analyzere.max_url_length - len(url)
+        chunks = []
+        length = budget
+        for value in values:
+            size = len(str(vectorizer([value])))
+            # Values after the first of a chunk are preceded by a comma
+            if length + 1 + size > budget:
+                chunks.append([])
+                length = size
+            else:
+                length += 1 + size
+            chunks[-1].append(value)
+        return chunks
+
+    @staticmethod
+    def _join_vector_metrics(chunks, responses):
+        """Concatenates the results of the requests for each chunk."""
+        results = []
+        for chunk, resp in zip(chunks, responses):
+            if len(chunk) == 1 and not isinstance(resp, list):
+                resp = [resp]
+            if not isinstance(resp, list) or len(resp) != len(chunk):
+                raise ServerError('Unable to combine the metrics returned for '
+                                  'a vector split into several requests.')
+            results.extend(resp)
+        return results
+
+    def _fetch_vector_metrics(self, kind, values, vectorizer, params=None,
+                              auto_retry=True):
+        """
+        Requests the ``kind`` metrics for a value or list of values. A list
+        whose URL would exceed `analyzere.max_url_length` is split into
+        several requests, sent concurrently and joined into one list.
+        """
+        chunks = (self._split_vector(kind, values, vectorizer, params)
+                  if isinstance(values, list) else [])
+
+        def fetch(values):
+            return request('get', self._vector_path(kind, values, vectorizer),
+                           params=params, auto_retry=auto_retry,
+                           client=self._client)
+
+        if len(chunks) <= 1:
+            return fetch(values)
+        max_workers = min(analyzere.max_concurrent_requests, len(chunks))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(fetch, chunks))
+        return self._join_vector_metrics(chunks, responses)
+
+    def _get_vector_metrics(self, kind, values, vectorizer, params=None,
+                            auto_retry=True):
+        """
+        Returns the ``kind`` metrics for a value or list of values, which
+        ``vectorizer`` encodes into the path.
+
+        With `analyzere.metrics_cache` set, results are cached per value, and
+        only the values not cached yet are requested and then merged with the
+        cached ones in the requested order.
+        """
+        cache = analyzere.metrics_cache
+        if cache is None:
+            resp = self._fetch_vector_metrics(kind, values, vectorizer, params,
+                                              auto_retry)
+            return convert_to_analyzere_object(resp, client=self._client)
+
+        items = values if isinstance(values, list) else [values]
+        keys, found, missing = self._lookup_vector_metrics(
+            kind, items, vectorizer, params, cache)
+        resp = None
+        if missing:
+            resp = self._fetch_vector_metrics(kind, list(missing.values()),
+                                              vectorizer, params, auto_retry)
+        merged = self._merge_vector_metrics(values, keys, found, missing, resp,
+                                            cache)
+        if merged is None:
+            # Results that can't be told apart per value aren't cached
+            if len(missing) < len(items):
+                resp = self._fetch_vector_metrics(kind, values, vectorizer,
+                                                  params, auto_retry)
+            merged = resp
+        return convert_to_analyzere_object(merged, client=self._client)
 
     def tail_metrics(self, probabilities, auto_retry=True, **params):
-        probabilities = vectorize(probabilities)
-        path = '{}/tail_metrics/{}'.format(self._get_path(self.id), probabilities)
-        return self._get_metrics(path, params, auto_retry=auto_retry)
+        return self._get_vector_metrics('tail_metrics', probabilities, vectorize, params,
+                                        auto_retry=auto_retry)
 
     def window_metrics(self, probabilities, auto_retry=True, **params):
-        probabilities = vectorize_range(probabilities)
-        path = '{}/window_metrics/{}'.format(self._get_path(self.id), probabilities)
-        return self._get_metrics(path, params, auto_retry=auto_retry)
+        return self._get_vector_metrics('window_metrics', probabilities, vectorize_range, params,
+                                        auto_retry=auto_retry)
 
     def co_metrics(self, probabilities, auto_retry=True, **params):
-        probabilities = vectorize(probabilities)
-        path = '{}/co_metrics/{}'.format(self._get_path(self.id), probabilities)
-        return self._get_metrics(path, params, auto_retry=auto_retry)
+        return self._get_vector_metrics('co_metrics', probabilities, vectorize, params,
+                                        auto_retry=auto_retry)
 
     def window_co_metrics(self, probabilities, auto_retry=True, **params):
-        probabilities = vectorize_range(probabilities)
-        path = '{}/window_co_metrics/{}'.format(self._get_path(self.id), probabilities)
-        return self._get_metrics(path, params, auto_retry=auto_retry)
+        return self._get_vector_metrics('window_co_metrics', probabilities, vectorize_range, params,
+                                        auto_retry=auto_retry)
+
+    def submit(self, metric, *args, **params):
+        """
+        Requests ``metric`` (the name of a metrics method, e.g.
+        ``'tail_metrics'``) with ``args`` and ``params`` in the background and
+        returns a ``concurrent.futures.Future`` for its result.
+
+        A 503 Retry-After response is retried after the interval by the shared
+        scheduler of `analyzere.polling` without holding a thread, so any
+        number of computations can be pending at once.
+        """
+        method = functools.partial(getattr(self, metric), *args,
+                                   auto_retry=False, **params)
+        return polling.submit_retrying(method)
 
     def el(self, auto_retry=True, **params):
         path = '{}/el'.format(self._get_path(self.id))
-        return float(
-            request('get', path, params=params, auto_retry=auto_retry))
+        return float(self._request_metrics(path, params, auto_retry))
 
     def ep(self, thresholds, auto_retry=True, **params):
-        thresholds = vectorize(thresholds)
-        path = '{}/exceedance_probabilities/{}'.format(self._get_path(self.id), thresholds)
-        return self._get_metrics(path, params, auto_retry=auto_retry)
+        return self._get_vector_metrics('exceedance_probabilities', thresholds, vectorize, params,
+                                        auto_retry=auto_retry)
 
     def tvar(self, probabilities, auto_retry=True, **params):
-        probabilities = vectorize(probabilities)
-        path = '{}/tvar/{}'.format(self._get_path(self.id), probabilities)
-        return self._get_metrics(path, params, auto_retry=auto_retry)
+        return self._get_vector_metrics('tvar', probabilities, vectorize, params,
+                                        auto_retry=auto_retry)
 
     def window_var(self, probabilities, auto_retry=True, **params):
-        probabilities = vectorize_range(probabilities)
-        path = '{}/window_var/{}'.format(self._get_path(self.id), probabilities)
-        return self._get_metrics(path, params, auto_retry=auto_retry)
+        return self._get_vector_metrics('window_var', probabilities, vectorize_range, params,
+                                        auto_retry=auto_retry)
+
+    def download_ylt(self, auto_retry=True, file_or_path=None,
+                     chunk_size=None, **params):
+        """
+        Returns the YLT as bytes, or streams it into ``file_or_path`` and
+        returns the number of bytes written.
+        """
+        path = '{}/ylt'.format(self._get_path(self.id))
+        return download(path, file_or_path, chunk_size, params=params,
+                        auto_retry=auto_retry, client=self._client)
+
+    def download_yelt(self, auto_retry=True, file_or_path=None,
+                      chunk_size=None, **params):
+        """
+        Returns the YELT as bytes, or streams it into ``file_or_path`` and
+        returns the number of bytes written.
+        """
+        path = '{}/yelt'.format(self._get_path(self.id))
+        return download(path, file_or_path, chunk_size, params=params,
+                        auto_retry=auto_retry, client=self._client)
 
-    def download_ylt(self, auto_retry=True, **params):
+    def iter_ylt(self, chunk_size=None, lines=False, auto_retry=True,
+                 **params):
+        """Streams the YLT as byte chunks, or as lines if ``lines`` is set."""
         path = '{}/ylt'.format(self._get_path(self.id))
-        return request_raw(
-            'get', path, params=params, auto_retry=auto_retry).content
+        resp = request_raw('get', path, params=params, auto_retry=auto_retry,
+                           stream=True, client=self._client)
+        return iter_response(resp, chunk_size or analyzere.download_chunk_size,
+                             lines)
+
+    def iter_yelt(self, chunk_size=None, lines=False, auto_retry=True,
+                  **params):
+        """Streams the YELT as byte chunks, or as lines if ``lines`` is set."""
+        path = '{}/yelt'.format(self._get_path(self.id))
+        resp = request_raw('get', path, params=params, auto_retry=auto_retry,
+                           stream=True, client=self._client)
+        return iter_response(resp, chunk_size or analyzere.download_chunk_size,
+                             lines)
 
-    def download_yelt(self, auto_retry=True, **params):
+    def download_ylt_array(self, auto_retry=True, **params):
+        """
+        Streams the YLT into a NumPy structured array with one field per
+        column (e.g. ``trial``, ``loss``). Requires numpy.
+        """
+        path = '{}/ylt'.format(self._get_path(self.id))
+        resp = request_raw('get', path, params=params, auto_retry=auto_retry,
+                           stream=True, client=self._client)
+        try:
+            return tables.parse_loss_table(resp)
+        finally:
+            resp.close()
+
+    def download_yelt_array(self, auto_retry=True, **params):
+        """
+        Streams the YELT into a NumPy structured array with one field per
+        column (e.g. ``trial``, ``event``, ``sequence``, ``loss``). Requires
+        numpy.
+        """
         path = '{}/yelt'.format(self._get_path(self.id))
-        return request_raw(
-            'get', path, params=params, auto_retry=auto_retry).content
+        resp = request_raw('get', path, params=params, auto_retry=auto_retry,
+                           stream=True, client=self._client)
+        try:
+            return tables.parse_loss_table(resp)
+        finally:
+            resp.close()
 
     def back_allocation(self, source_id, auto_retry=True, **params):
         params['source_id'] = source_id
         path = '{}/back_allocations'.format(self._get_path(self.id))
-        data = request('get', path, auto_retry=auto_retry, params=params)
-        return convert_to_analyzere_object(data)
+        return self._get_metrics(path, params, auto_retry)
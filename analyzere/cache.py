@@ -0,0 +1,229 @@
+"""
+Client-side caches. Enable the identity map for retrieved resources with::
+
+    analyzere.resource_cache = ResourceCache(maxsize=4096, ttls={LossSet: 3600})
+
+and caching of metrics results with::
+
+    analyzere.metrics_cache = MemoryMetricsCache(maxsize=10000)
+"""
+from collections import OrderedDict
+import hashlib
+from inspect import isclass
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+
+class ResourceCache(object):
+    """
+    Identity map for resources, keyed by client, collection name and id, so
+    resources retrieved through different ``Client`` objects never mix.
+
+    While enabled, ``Resource.retrieve`` and reference resolution return the
+    cached object instead of issuing a GET, so every lookup of the same
+    resource yields the same instance. ``save()`` and ``reload()`` replace the
+    cached entry with the freshly returned server state.
+
+    At most ``maxsize`` resources are kept, evicting the least recently used.
+    Entries expire after ``ttl`` seconds (``None`` never expires), which can
+    be overridden per resource class or collection name through ``ttls``,
+    e.g. ``{LossSet: 3600, 'layer_views': None}``.
+    """
+    def __init__(self, maxsize=1024, ttl=None, ttls=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def _key(cls, id_):
+        return cls._client, cls._get_collection_name(), id_
+
+    def _ttl_for(self, cls):
+        for base in cls.__mro__:
+            if base in self.ttls:
+                return self.ttls[base]
+        return self.ttls.get(cls._get_collection_name(), self.ttl)
+
+    def get(self, cls, id_):
+        """
+        Returns the cached instance of ``cls`` with the given id, or None.
+        Only instances of exactly ``cls`` are returned, e.g. never an
+        ``analyzere.aio`` resource to a synchronous class.
+        """
+        key = self._key(cls, id_)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                obj, expires = entry
+                if expires is not None and expires <= time.monotonic():
+                    del self._items[key]
+                elif type(obj) is cls:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return obj
+            self.misses += 1
+            return None
+
+    def set(self, obj, id_=None):
+        """Caches ``obj`` under its class's collection name and its id."""
+        id_ = id_ or getattr(obj, 'id', None)
+        if not id_:
+            return
+        cls = type(obj)
+        ttl = self._ttl_for(cls)
+        expires = time.monotonic() + ttl if ttl is not None else None
+        key = self._key(cls, id_)
+        with self._lock:
+            self._items[key] = (obj, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, cls_or_collection, id_=None):
+        """
+        Removes one resource, or every resource of a class or collection if
+        ``id_`` is omitted. A class only matches resources of the client it is
+        bound to, a collection name matches those of every client.
+        """
+        with self._lock:
+            if isclass(cls_or_collection):
+                if id_ is not None:
+                    self._items.pop(self._key(cls_or_collection, id_), None)
+                    return
+                prefix = self._key(cls_or_collection, id_)[:2]
+
+                def matches(key):
+                    return key[:2] == prefix
+            else:
+                def matches(key):
+                    return (key[1] == cls_or_collection and
+                            (id_ is None or key[2] == id_))
+            for key in [k for k in self._items if matches(k)]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def metrics_key(base_url, path, params=None):
+    """
+    Returns the cache key of a metrics request: the server, the path (which
+    holds the view id, metric kind and probabilities) and the query params.
+    """
+    return json.dumps([base_url, path, params or {}], sort_keys=True,
+                      default=str)
+
+
+class MetricsCache(object):
+    """
+    Base class for caches of metrics responses, keyed by `metrics_key`.
+
+    A view id identifies an immutable computation, so its metrics never
+    change and entries don't expire. Subclasses implement ``_load`` (raising
+    KeyError on a miss), ``_store``, ``clear`` and ``__len__``.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        try:
+            value = self._load(key)
+        except KeyError:
+            with self._lock:
+                self.misses += 1
+            return default
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._store(key, value)
+
+
+class MemoryMetricsCache(MetricsCache):
+    """Keeps up to ``maxsize`` responses, evicting the least recently used."""
+    def __init__(self, maxsize=4096):
+        super(MemoryMetricsCache, self).__init__()
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _load(self, key):
+        with self._lock:
+            value = self._items[key]
+            self._items.move_to_end(key)
+            return value
+
+    def _store(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class DiskMetricsCache(MetricsCache):
+    """
+    Stores responses as pickle files in ``directory``, so they outlive the
+    process and can be shared by processes on one machine. Only point it at
+    a directory no untrusted user can write to.
+    """
+    suffix = '.metrics'
+
+    def __init__(self, directory):
+        super(DiskMetricsCache, self).__init__()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len([f for f in os.listdir(self.directory) if f.endswith(self.suffix)])
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + self.suffix)
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            raise KeyError(key)
+        if stored_key != key:
+            raise KeyError(key)
+        return value
+
+    def _store(self, key, value):
+        # Written to a temporary file first so readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,111 @@
+"""
+Per-tenant connection settings, credentials and connection pools.
+"""
+from inspect import isclass
+import threading
+
+import analyzere
+from analyzere import requestor
+from analyzere.base_resources import AnalyzeReObject
+
+
+class Client(object):
+    """
+    Holds its own configuration, credentials and session (and with it its
+    own authentication state and connection pools), so several servers or
+    tenants can be used concurrently from one process::
+
+        tenant = analyzere.Client('https://tenant.example.com/',
+                                  oauth_token_url='...', oauth_client_id='...',
+                                  oauth_client_secret='...')
+        lv = tenant.LayerView.retrieve('abc123')
+        lv.tail_metrics(0.01)
+
+    Resource classes accessed as attributes of the client (or passed to
+    ``bind``) send every request through it, as do the resources and
+    references they return. Settings that aren't given default to the
+    module-level values of `analyzere` at construction time; credentials
+    don't. Classes of `analyzere.aio` can be bound as well and get their own
+    httpx session, closed with ``await aio.close(client)``.
+    """
+    def __init__(self, base_url, username='', password='', bearer_auth_token='',
+                 oauth_token_url='', oauth_client_id='', oauth_client_secret='',
+                 oauth_scope='', tls_verify=None, user_agent=None,
+                 connection_pool_maxsize=None, connection_pool_block=None,
+                 connection_pool_maxsize_per_host=None,
+                 retry_strategy_total=None, retry_strategy_backoff_factor=None):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.bearer_auth_token = bearer_auth_token
+        self.oauth_token_url = oauth_token_url
+        self.oauth_client_id = oauth_client_id
+        self.oauth_client_secret = oauth_client_secret
+        self.oauth_scope = oauth_scope
+
+        def default(value, name):
+            return getattr(analyzere, name) if value is None else value
+
+        self.tls_verify = default(tls_verify, 'tls_verify')
+        self.user_agent = default(user_agent, 'user_agent')
+        self.connection_pool_maxsize = default(connection_pool_maxsize, 'connection_pool_maxsize')
+        self.connection_pool_block = default(connection_pool_block, 'connection_pool_block')
+        self.connection_pool_maxsize_per_host = dict(
+            default(connection_pool_maxsize_per_host, 'connection_pool_maxsize_per_host'))
+        self.retry_strategy_total = default(retry_strategy_total, 'retry_strategy_total')
+        self.retry_strategy_backoff_factor = default(retry_strategy_backoff_factor,
+                                                     'retry_strategy_backoff_factor')
+
+        self.session = None
+        self.session_lock = threading.RLock()
+        self._bound = {}
+        self._bind_lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Client base_url={!r} at {}>'.format(self.base_url, hex(id(self)))
+
+    def __getattr__(self, name):
+        # Only called for names that aren't attributes, e.g. client.LayerView
+        cls = getattr(analyzere, name, None) if not name.startswith('_') else None
+        if isclass(cls) and issubclass(cls, AnalyzeReObject):
+            return self.bind(cls)
+        raise AttributeError("'Client' object has no attribute '{}'".format(name))
+
+    def bind(self, cls):
+        """
+        Returns a subclass of the resource class ``cls`` whose requests are
+        sent through this client. The subclass is created once per class.
+        """
+        # Rebinding a class bound to another client binds its original
+        while cls._client is not None:
+            cls = cls.__bases__[0]
+        with self._bind_lock:
+            bound = self._bound.get(cls)
+            if bound is None:
+                attrs = {'_client': self, '__module__': cls.__module__,
+                         '__qualname__': cls.__qualname__}
+                if hasattr(cls, '_get_collection_name'):
+                    attrs['_collection_name'] = cls._get_collection_name()
+                bound = type(cls.__name__, (cls,), attrs)
+                self._bound[cls] = bound
+        return bound
+
+    def request(self, method, path, params=None, data=None, auto_retry=True):
+        """Sends a request through this client, see `requestor.request`."""
+        return requestor.request(method, path, params=params, data=data,
+                                 auto_retry=auto_retry, client=self)
+
+    def request_raw(self, method, path, **kwargs):
+        """Sends a request through this client, see `requestor.request_raw`."""
+        return requestor.request_raw(method, path, client=self, **kwargs)
+
+    def pool_stats(self):
+        """Returns the connection pool statistics of this client's session."""
+        return requestor.pool_stats(client=self)
+
+    def close(self):
+        """Closes the session and its pooled connections."""
+        with self.session_lock:
+            session, self.session = self.session, None
+        if session is not None:
+            session.close()
@@ -20,7 +20,12 @@ class AuthenticationError(AnalyzeReError):
 
 
 class RetryAfter(AnalyzeReError):
-    pass
+    def __init__(self, message=None, http_body=None, http_status=None,
+                 json_body=None, retry_after=None):
+        super(RetryAfter, self).__init__(message, http_body, http_status,
+                                         json_body)
+        # Seconds to wait before retrying, from the Retry-After header
+        self.retry_after = retry_after
 
 
 class MissingIdError(AnalyzeReError):
@@ -0,0 +1,155 @@
+"""
+Background scheduling of requests, so waiting on the server costs no thread.
+
+A single timer thread keeps the calls due at a later time and hands each to
+a small pool of worker threads once due, e.g. to retry a metrics request
+after its 503 ``Retry-After`` interval or to poll the status of an upload
+being processed::
+
+    future = layer_view.submit('tail_metrics', [0.01, 0.004])
+    commit = loss_set.upload_data(data, wait=False)
+    ...
+    metrics = future.result()
+    status = commit.result()
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import heapq
+import itertools
+import threading
+import time
+
+import analyzere
+from analyzere.errors import RetryAfter
+
+
+class Scheduler(object):
+    """
+    Calls functions after a delay. One daemon thread waits for the earliest
+    due call; the calls themselves run on up to ``max_workers`` (default
+    `analyzere.max_concurrent_requests`) worker threads.
+    """
+    def __init__(self, max_workers=None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or analyzere.max_concurrent_requests,
+            thread_name_prefix='analyzere-scheduler')
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._shutdown = False
+
+    def __len__(self):
+        """Number of calls waiting to become due."""
+        return len(self._heap)
+
+    def call_later(self, delay, fn, *args):
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule calls after shutdown')
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), fn, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='analyzere-scheduler-timer',
+                                                daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def call_soon(self, fn, *args):
+        self.call_later(0, fn, *args)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._shutdown:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._condition.wait(self._heap[0][0] - now if self._heap else None)
+                if self._shutdown:
+                    return
+                _, _, fn, args = heapq.heappop(self._heap)
+            self._executor.submit(fn, *args)
+
+    def shutdown(self, wait=True):
+        """Drops the calls not due yet and stops the threads."""
+        with self._condition:
+            self._shutdown = True
+            self._heap = []
+            self._condition.notify()
+        self._executor.shutdown(wait=wait)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the shared Scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
+
+
+def poll(check, interval=None, max_interval=None, backoff=2.0,
+         scheduler=None):
+    """
+    Calls ``check()`` in the background until it reports completion, and
+    returns a ``Future`` for its final value. ``check`` returns a
+    ``(done, value)`` pair.
+
+    The first check is made right away, the next after ``interval`` (default
+    `analyzere.upload_poll_interval`) seconds; every further interval is
+    ``backoff`` times longer, up to ``max_interval`` (default
+    `analyzere.max_poll_interval`). A RetryAfter raised by ``check`` delays
+    the next check by its Retry-After interval instead. Any other exception
+    fails the future, and cancelling the future stops polling.
+
+    Polls are made from the shared scheduler, so any number of operations
+    can be polled without a thread each.
+    """
+    if scheduler is None:
+        scheduler = get_scheduler()
+    if interval is None:
+        interval = analyzere.upload_poll_interval
+    if max_interval is None:
+        max_interval = analyzere.max_poll_interval
+    future = Future()
+    delays = [interval]
+
+    def attempt():
+        if future.cancelled():
+            return
+        try:
+            done, value = check()
+        except RetryAfter as e:
+            if e.retry_after is not None:
+                scheduler.call_later(e.retry_after, attempt)
+            elif future.set_running_or_notify_cancel():
+                future.set_exception(e)
+            return
+        except Exception as e:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(e)
+            return
+        if done:
+            if future.set_running_or_notify_cancel():
+                future.set_result(value)
+            return
+        scheduler.call_later(delays[0], attempt)
+        delays[0] = min(delays[0] * backoff, max(max_interval, interval))
+
+    scheduler.call_soon(attempt)
+    return future
+
+
+def submit_retrying(fn, scheduler=None):
+    """
+    Calls ``fn`` in the background and returns a ``Future`` for its result.
+
+    ``fn`` must send its request without retrying, i.e. raise RetryAfter on
+    503; it is then called again once the Retry-After interval has passed,
+    without holding a thread in the meantime. Cancelling the future stops
+    further attempts.
+    """
+    return poll(lambda: (True, fn()), scheduler=scheduler)
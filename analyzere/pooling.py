@@ -0,0 +1,100 @@
+"""
+Connection pool adapter used by the requestor session, with per-pool usage
+counters exposed through :func:`analyzere.requestor.pool_stats`.
+"""
+import threading
+import time
+
+import requests.adapters
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class InstrumentedPoolMixin(object):
+    """
+    Counts connections checked out of and returned to a urllib3 pool.
+
+    ``full_waits`` counts checkouts that found no idle connection while
+    ``maxsize`` connections were already in use: in blocking mode the caller
+    waited (for ``wait_time`` seconds in total), otherwise an extra connection
+    was opened and ``discarded`` is incremented when it can't be returned.
+    """
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedPoolMixin, self).__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.in_use = 0
+        self.full_waits = 0
+        self.wait_time = 0.0
+        self.discarded = 0
+
+    def _get_conn(self, timeout=None):
+        pool = self.pool
+        full = pool is not None and pool.empty()
+        start = time.monotonic()
+        conn = super(InstrumentedPoolMixin, self)._get_conn(timeout=timeout)
+        with self._stats_lock:
+            self.in_use += 1
+            if full:
+                self.full_waits += 1
+                self.wait_time += time.monotonic() - start
+        return conn
+
+    def _put_conn(self, conn):
+        pool = self.pool
+        with self._stats_lock:
+            self.in_use -= 1
+            if pool is not None and pool.full():
+                self.discarded += 1
+        super(InstrumentedPoolMixin, self)._put_conn(conn)
+
+    def stats(self):
+        pool = self.pool
+        idle = 0
+        if pool is not None:
+            with pool.mutex:
+                idle = sum(1 for conn in pool.queue if conn is not None)
+        return {
+            'scheme': self.scheme,
+            'host': self.host,
+            'port': self.port,
+            'maxsize': pool.maxsize if pool is not None else 0,
+            'block': self.block,
+            'in_use': self.in_use,
+            'idle': idle,
+            'connections_opened': self.num_connections,
+            'requests': self.num_requests,
+            'full_waits': self.full_waits,
+            'wait_time': self.wait_time,
+            'discarded': self.discarded,
+        }
+
+
+class InstrumentedHTTPConnectionPool(InstrumentedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class InstrumentedHTTPSConnectionPool(InstrumentedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter whose connection pools keep usage statistics."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': InstrumentedHTTPConnectionPool,
+            'https': InstrumentedHTTPSConnectionPool,
+        }
+
+    def pool_stats(self):
+        pools = self.poolmanager.pools
+        stats = []
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:
+                # Evicted since keys() was taken
+                continue
+            if isinstance(pool, InstrumentedPoolMixin):
+                stats.append(pool.stats())
+        return stats
@@ -1,4 +1,5 @@
 import json
+import threading
 import time
 
 import requests
@@ -9,9 +10,12 @@ from six.moves.urllib.parse import urljoin
 
 import analyzere
 from analyzere import errors, utils
+from analyzere.pooling import PooledHTTPAdapter
 
 
 session = None
+# Serializes creation of the module-level session and its token refreshes.
+session_lock = threading.RLock()
 
 
 def handle_api_error(resp, code):
@@ -34,17 +38,33 @@ def handle_api_error(resp, code):
             'Failed to authenticate. Please check the credentials '
             'you provided.', body, code, json_body)
     elif code == 503:
-        raise errors.RetryAfter(message, body, code, json_body)
+        try:
+            retry_after = float(resp.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            retry_after = None
+        raise errors.RetryAfter(message, body, code, json_body,
+                                retry_after=retry_after)
     else:
         raise errors.ServerError(message, body, code, json_body)
 
 
-def request(method, path, params=None, data=None, auto_retry=True):
+def get_config(client=None):
+    """
+    Returns the object holding the connection settings: ``client`` or, if it
+    is None, the module-level configuration of `analyzere`.
+    """
+    return analyzere if client is None else client
+
+
+def request(method, path, params=None, data=None, auto_retry=True,
+            client=None):
     """
     method - HTTP method. e.g. get, put, post, etc.
     path - Path to resource. e.g. /loss_sets/1234
     params - Parameter to pass in the query string
     data - Dictionary of parameters to pass in the request body
+    client - analyzere.Client to send the request with, instead of the
+             module-level configuration
     """
     body = None
     if data is not None:
@@ -53,10 +73,10 @@ def request(method, path, params=None, data=None, auto_retry=True):
     headers = {
         'accept': 'application/json',
         'content-type': 'application/json',
-        'user-agent': analyzere.user_agent,
+        'user-agent': get_config(client).user_agent,
     }
     resp = request_raw(method, path, params=params, body=body, headers=headers,
-                       auto_retry=auto_retry)
+                       auto_retry=auto_retry, client=client)
     content = resp.text
     if content:
         try:
@@ -67,85 +87,175 @@ def request(method, path, params=None, data=None, auto_retry=True):
     return content
 
 
-def ensure_session_exists(token_retrieval_kwargs):
+def get_session_lock(client=None):
+    """Returns the lock guarding the session of ``client``."""
+    return session_lock if client is None else client.session_lock
+
+
+def _session_is_current(current, config):
+    if config.oauth_client_id:
+        return getattr(current, 'client_id', None) == config.oauth_client_id
+    return current is not None
+
+
+def ensure_session_exists(token_retrieval_kwargs, client=None):
+    """
+    Creates the session of ``client`` (or the module-level session) if it
+    doesn't exist yet, and returns it.
+
+    Safe to call from any number of threads: the session is created, and its
+    first token fetched, by one thread while the others wait for it. A session
+    is only published once its adapters are mounted.
+    """
     global session
 
-    initializing_session = False
+    config = get_config(client)
+    current = session if client is None else client.session
+    if _session_is_current(current, config):
+        return current
 
-    if analyzere.oauth_client_id:
-        # Ensure OAuth Session
-        if not session or (not hasattr(session, 'client_id')) or session.client_id != analyzere.oauth_client_id:
-            initializing_session = True
-            session = OAuth2Session(client=BackendApplicationClient(client_id=analyzere.oauth_client_id,
-                                                                    scope=analyzere.oauth_scope))
+    with get_session_lock(client):
+        current = session if client is None else client.session
+        if _session_is_current(current, config):
+            return current
+
+        if config.oauth_client_id:
+            # Ensure OAuth Session
+            current = OAuth2Session(client=BackendApplicationClient(client_id=config.oauth_client_id,
+                                                                    scope=config.oauth_scope))
             # Fetch first token
-            session.fetch_token(analyzere.oauth_token_url, **token_retrieval_kwargs)
+            current.fetch_token(config.oauth_token_url, **token_retrieval_kwargs)
+        else:
+            current = requests.Session()
 
-    elif not session:
-        initializing_session = True
-        session = requests.Session()
+        mount_adapters(current, config)
+        if client is None:
+            session = current
+        else:
+            client.session = current
+    return current
 
-    if initializing_session:
-        # Set connection pool and retry strategy
-        retries = requests.adapters.Retry(total=analyzere.retry_strategy_total,
-                                          backoff_factor=analyzere.retry_strategy_backoff_factor)
-        session.mount(
-            "https://",
-            requests.adapters.HTTPAdapter(pool_maxsize=analyzere.connection_pool_maxsize, max_retries=retries))
+
+def refresh_token(session, stale_token, token_retrieval_kwargs, client=None):
+    """
+    Fetches a new Client Credentials token for ``session`` unless another
+    thread has already replaced ``stale_token``, the token a failed request
+    was sent with. Threads that hit an expired or revoked token at the same
+    time thus share a single refresh.
+    """
+    with get_session_lock(client):
+        if session.token is stale_token:
+            session.fetch_token(get_config(client).oauth_token_url,
+                                **token_retrieval_kwargs)
+
+
+def mount_adapters(session, config=analyzere):
+    """
+    Mounts pooled adapters with the configured pool size, blocking mode and
+    retry strategy for both http and https, plus one adapter per entry of
+    ``connection_pool_maxsize_per_host``. Settings are read from ``config``,
+    a Client or the `analyzere` module.
+    """
+    retries = requests.adapters.Retry(total=config.retry_strategy_total,
+                                      backoff_factor=config.retry_strategy_backoff_factor)
+
+    def adapter(maxsize):
+        return PooledHTTPAdapter(pool_maxsize=maxsize,
+                                 pool_block=config.connection_pool_block,
+                                 max_retries=retries)
+
+    for prefix in ('https://', 'http://'):
+        session.mount(prefix, adapter(config.connection_pool_maxsize))
+    # requests picks the adapter with the longest matching prefix
+    for prefix, maxsize in config.connection_pool_maxsize_per_host.items():
+        session.mount(prefix, adapter(maxsize))
+
+
+def pool_stats(client=None):
+    """
+    Returns usage statistics for every connection pool of the session, one
+    dict per host with ``in_use`` and ``idle`` connection counts, the number
+    of ``full_waits`` (checkouts made while every pooled connection was busy)
+    and their total ``wait_time``, connections ``discarded`` because the pool
+    was full, and totals of ``connections_opened`` and ``requests``.
+    """
+    current = session if client is None else client.session
+    if current is None:
+        return []
+    stats = []
+    for adapter in set(current.adapters.values()):
+        if isinstance(adapter, PooledHTTPAdapter):
+            stats.extend(adapter.pool_stats())
+    return stats
 
 
 def request_raw(method, path, params=None, body=None, headers=None,
-                handle_errors=True, auto_retry=True):
+                handle_errors=True, auto_retry=True, stream=False,
+                client=None):
+    """
+    Sends a request and returns the ``requests.Response``. With
+    ``stream=True`` the response body is not read up front; the caller must
+    consume it (e.g. with ``iter_content``) or close the response.
+
+    May be called concurrently from several threads, which share the session,
+    its connection pools and its Client Credentials token.
+    """
+    config = get_config(client)
     kwargs = {
         'params': params,
         'data': body,
         'headers': headers,
-        'verify': analyzere.tls_verify,
+        'verify': config.tls_verify,
+        'stream': stream,
     }
     token_retrieval_kwargs = {}
 
-    url = urljoin(analyzere.base_url, path)
+    url = urljoin(config.base_url, path)
 
     # Basic Auth
-    if analyzere.username and analyzere.password:
-        kwargs['auth'] = (analyzere.username, analyzere.password)
+    if config.username and config.password:
+        kwargs['auth'] = (config.username, config.password)
 
     # Direct token
-    elif analyzere.bearer_auth_token:
+    elif config.bearer_auth_token:
         if headers is None:
             headers = {}
 
-        headers['Authorization'] = f'Bearer {analyzere.bearer_auth_token}'
+        headers['Authorization'] = f'Bearer {config.bearer_auth_token}'
         kwargs['headers'] = headers
 
     # Client Credentials
-    elif analyzere.oauth_client_id:
+    elif config.oauth_client_id:
         token_retrieval_kwargs = {
             "include_client_id": True,
-            "client_secret": analyzere.oauth_client_secret
+            "client_secret": config.oauth_client_secret
         }
 
-    ensure_session_exists(token_retrieval_kwargs)
+    session = ensure_session_exists(token_retrieval_kwargs, client)
 
+    # Token the request is sent with, compared by identity when refreshing
+    token = getattr(session, 'token', None)
     try:
         resp = session.request(method, url, **kwargs)
     except TokenExpiredError:
         # Raised by Client Credentials flow if the token expired
         # Not using auto-refresh because that sends a request of grant type `refresh_token`, and
         # Client Credentials doesn't support refresh tokens.
-        session.fetch_token(analyzere.oauth_token_url, **token_retrieval_kwargs)
+        refresh_token(session, token, token_retrieval_kwargs, client)
+        token = session.token
         resp = session.request(method, url, **kwargs)
 
     # Handle HTTP 401 for Client Credentials
     # The token could have been invalidated before expiry, refresh and retry in that case
-    if resp.status_code == 401 and analyzere.oauth_client_id:
-        session.fetch_token(analyzere.oauth_token_url, **token_retrieval_kwargs)
+    if resp.status_code == 401 and config.oauth_client_id:
+        refresh_token(session, token, token_retrieval_kwargs, client)
         resp = session.request(method, url, **kwargs)
 
     # Handle HTTP 503 with the Retry-After header by automatically retrying
     # request after sleeping for the recommended amount of time
     retry_after = resp.headers.get('Retry-After')
     while auto_retry and (resp.status_code == 503 and retry_after):
+        resp.close()
         time.sleep(float(retry_after))
         # Repeat original request after Retry-After time has elapsed.
         resp = session.request(method, url, **kwargs)
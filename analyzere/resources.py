@@ -1,13 +1,17 @@
+from concurrent.futures import TimeoutError
 import warnings
 
+from analyzere import polling
 from analyzere.base_resources import (
     DataResource,
     EmbeddedResource,
     MetricsResource,
     Resource,
+    iter_pages,
     load_reference,
     to_dict,
     convert_to_analyzere_object, NestedResource)
+from analyzere.errors import RetryAfter
 from analyzere.requestor import request
 
 
@@ -24,8 +28,8 @@ class MonetaryUnit(EmbeddedResource):
 class EventCatalog(DataResource):
     def profile(self):
         path = '%s/profile' % self._get_path(self.id)
-        resp = request('get', path)
-        return convert_to_analyzere_object(resp)
+        resp = request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
 
 
 # Exchange rate tables
@@ -33,13 +37,13 @@ class EventCatalog(DataResource):
 class ExchangeRateTable(DataResource):
     def currencies(self):
         path = '{}/currencies'.format(self._get_path(self.id))
-        resp = request('get', path)
+        resp = request('get', path, client=self._client)
         # response will be an embedded object with currencies list
         # each element of the currencies list is again an embedded object with the structure like:
         #   {
         #       "code": "CAD"
         #   }
-        return convert_to_analyzere_object(resp)
+        return convert_to_analyzere_object(resp, client=self._client)
 
 
 class ExchangeRateSelectionRule(EmbeddedResource):
@@ -150,12 +154,13 @@ class AnalysisProfile(Resource):
 class PortfolioView(MetricsResource):
     def marginal(self, layer_views_to_add, layer_views_to_remove):
         path = 'portfolio_view_marginals'
-        data = request('post', path, data={
+        data = request('post', path, client=self._client, data={
             'portfolio_view_id': to_dict(self.reference()),
             'add_layer_view_ids': [to_dict(lv.reference()) for lv in layer_views_to_add],
             'remove_layer_view_ids': [to_dict(lv.reference()) for lv in layer_views_to_remove]
         })
-        return load_reference('portfolio_views', data['portfolio_view']['ref_id'])
+        return load_reference('portfolio_views', data['portfolio_view']['ref_id'],
+                              client=self._client)
 
 
 class DynamicPortfolioView(MetricsResource):
@@ -171,8 +176,8 @@ class OptimizationView(Resource):
             DeprecationWarning
         )
         path = '{}/result'.format(self._get_path(self.id))
-        resp = request('get', path)
-        return convert_to_analyzere_object(resp)
+        resp = request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
 
     def initial_metrics(self):
         """
@@ -180,10 +185,14 @@ class OptimizationView(Resource):
         OptimizationView
         """
         path = '{}/initial_portfolio_metrics'.format(self._get_path(self.id))
-        resp = request('get', path)
-        return convert_to_analyzere_object(resp)
+        resp = request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
 
-    def candidates(self, index=None):
+    def candidates(self, index=None, **params):
+        """
+        Returns a page of candidates, selected with the ``offset`` and
+        ``limit`` params, or the single candidate at ``index``.
+        """
         if index is None:
             path = '{}/candidates'.format(self._get_path(self.id))
         else:
@@ -192,8 +201,53 @@ class OptimizationView(Resource):
             except ValueError:
                 raise Exception('index argument provided to OptimizationView.candidates() must be an integer')
             path = '{}/candidates/{}'.format(self._get_path(self.id), index)
-        resp = request('get', path)
-        return convert_to_analyzere_object(resp, Candidate, optimization_view_id=self.id)
+        resp = request('get', path, params=params or None, client=self._client)
+        return convert_to_analyzere_object(resp, Candidate, self._client,
+                                           optimization_view_id=self.id)
+
+    def iter_candidates(self, **params):
+        """
+        Generator over every candidate, requesting page after page (of
+        ``limit`` candidates, if given) and prefetching the next page while
+        the current one is consumed.
+        """
+        params = dict(params)
+        offset = params.pop('offset', 0)
+        return iter_pages(lambda offset: self.candidates(offset=offset, **params),
+                          offset)
+
+    def wait(self, block=True, timeout=None, poll_interval=None):
+        """
+        Waits until the optimization has finished running and returns this
+        view or, unless ``block`` is set, returns a ``Future`` for it right
+        away. The server answers 503 while the optimization runs; the shared
+        poller of `analyzere.polling` checks again after its Retry-After
+        interval without holding a thread. Without a Retry-After, the first
+        interval is ``poll_interval`` (default
+        `analyzere.upload_poll_interval`), doubling with every check up to
+        `analyzere.max_poll_interval`. ``timeout`` limits how long to block.
+        """
+        path = '{}/candidates'.format(self._get_path(self.id))
+
+        def check():
+            try:
+                request('get', path, params={'limit': 1}, auto_retry=False,
+                        client=self._client)
+            except RetryAfter as e:
+                if e.retry_after is not None:
+                    raise
+                # Still running, check again after the next poll interval
+                return False, self
+            return True, self
+
+        future = polling.poll(check, interval=poll_interval)
+        if not block:
+            return future
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
 
     def candidate_parameters(self, index=None):
         if index is None:
@@ -204,13 +258,14 @@ class OptimizationView(Resource):
             except ValueError:
                 raise Exception('index argument provided to OptimizationView.candidate_parameters() must be an integer')
             path = '{}/candidate_parameters/{}'.format(self._get_path(self.id), index)
-        resp = request('get', path)
-        return convert_to_analyzere_object(resp, Candidate, optimization_view_id=self.id)
+        resp = request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, Candidate, self._client,
+                                           optimization_view_id=self.id)
 
     def candidate_metrics(self):
         path = '{}/candidate_metrics'.format(self._get_path(self.id))
-        resp = request('get', path)
-        return convert_to_analyzere_object(resp)
+        resp = request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
 
     def sensitivity_analysis(self, candidates=[]):
         # candidates can be only non negative integers
@@ -220,8 +275,8 @@ class OptimizationView(Resource):
         else:
             path = '{}/sensitivity_analysis?candidates={}'.format(self._get_path(self.id),
                                                                   ','.join(str(c) for c in candidates))
-        resp = request('get', path)
-        return convert_to_analyzere_object(resp)
+        resp = request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, client=self._client)
 
 
 class OptimizationDomain(EmbeddedResource):
@@ -237,5 +292,5 @@ class Candidate(NestedResource):
     def portfolio_view(self):
         path = '{}/candidates/{}/portfolio_view'.format(OptimizationView._get_path(self.optimization_view_id),
                                                         self.index)
-        resp = request('get', path)
-        return convert_to_analyzere_object(resp, PortfolioView)
+        resp = request('get', path, client=self._client)
+        return convert_to_analyzere_object(resp, PortfolioView, self._client)
@@ -0,0 +1,124 @@
+"""
+Columnar parsing of YLT/YELT tables into NumPy structured arrays, and
+rendering of column arrays as CSV for upload.
+
+Parsing requires the optional ``numpy`` package (``pip install analyzere[tables]``).
+"""
+import io
+import warnings
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from analyzere import utils
+
+
+# Columns parsed as integers; every other column is parsed as float64.
+INTEGER_COLUMNS = ('trial', 'trial_id', 'event', 'event_id')
+
+# Rows rendered to CSV at a time by iter_csv.
+CSV_BATCH_ROWS = 65536
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('numpy is required to parse loss tables into arrays')
+
+
+def column_name(header):
+    """Normalises a CSV header such as ``EventId`` to ``event_id``."""
+    return utils.to_snake_case(header.strip().replace(' ', ''))
+
+
+def header_name(column):
+    """Turns a column name such as ``event_id`` into the CSV header ``EventId``."""
+    return utils.to_camel_case(column)
+
+
+def table_dtype(header):
+    """
+    Returns the structured dtype for a YLT/YELT CSV header line, e.g.
+    ``Trial,Event,Sequence,Loss`` gives int64 ``trial`` and ``event`` fields
+    and float64 ``sequence`` and ``loss`` fields.
+    """
+    _require_numpy()
+    fields = []
+    for name in (column_name(h) for h in header.split(',')):
+        fields.append((name, np.int64 if name in INTEGER_COLUMNS else np.float64))
+    return np.dtype(fields)
+
+
+def parse_loss_table(source, dtype=None):
+    """
+    Parses a YLT or YELT CSV into a NumPy structured array with one field per
+    column, in a single vectorized pass.
+
+    ``source`` may be ``bytes``/``str``, a text or binary file object, or a
+    streamed ``requests.Response``, in which case rows are parsed as they
+    arrive without buffering the whole body. ``dtype`` overrides the dtype
+    derived from the header line.
+    """
+    _require_numpy()
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    elif isinstance(source, str):
+        source = io.StringIO(source)
+    elif hasattr(source, 'raw') and hasattr(source, 'iter_content'):
+        # Streamed response: read the (decompressed) socket stream directly.
+        # auto_close is disabled so io.TextIOWrapper can detect EOF.
+        source.raw.decode_content = True
+        source.raw.auto_close = False
+        source = source.raw
+
+    if not isinstance(source, io.TextIOBase):
+        source = io.TextIOWrapper(source, encoding='utf-8')
+
+    header = source.readline()
+    if dtype is None:
+        dtype = table_dtype(header)
+
+    with warnings.catch_warnings():
+        # A header without rows is a valid, empty table.
+        warnings.filterwarnings('ignore', message='.*[Ee]mpty input.*')
+        warnings.filterwarnings('ignore', message='.*no data.*')
+        return np.loadtxt(source, delimiter=',', dtype=dtype, ndmin=1)
+
+
+def iter_csv(table, header=None, batch_rows=None):
+    """
+    Renders a table of numeric columns as CSV, yielding a header line and
+    then ``batch_rows`` (default `CSV_BATCH_ROWS`) rows at a time, so the
+    whole CSV is never held in memory.
+
+    ``table`` is a NumPy structured array (e.g. one returned by
+    `parse_loss_table`) or a mapping of column names to equally long arrays
+    or sequences. ``header`` overrides the CSV header names, which default
+    to the column names in CamelCase, e.g. ``Trial,Event,Sequence,Loss``.
+    Floats are written in their shortest exact representation.
+    """
+    if hasattr(table, 'dtype') and table.dtype.names:
+        names = table.dtype.names
+    else:
+        names = list(table)
+    columns = [table[name] for name in names]
+    if not columns:
+        raise ValueError('table has no columns')
+    rows = len(columns[0])
+    if any(len(c) != rows for c in columns):
+        raise ValueError('table columns differ in length')
+    if header is None:
+        header = [header_name(name) for name in names]
+    if len(header) != len(columns):
+        raise ValueError('expected {} header names, got {}'.format(len(columns), len(header)))
+
+    yield ','.join(header) + '\n'
+    batch_rows = batch_rows or CSV_BATCH_ROWS
+    for start in range(0, rows, batch_rows):
+        # Each column slice is converted to Python numbers (tolist) and then
+        # to strings (str, the shortest exact form of floats) in bulk, and
+        # the rows are only assembled by joining those strings
+        batch = [c[start:start + batch_rows] for c in columns]
+        batch = [list(map(str, c.tolist() if hasattr(c, 'tolist') else c)) for c in batch]
+        yield '\n'.join(map(','.join, zip(*batch))) + '\n'
@@ -0,0 +1,407 @@
+"""
+Helpers for sending tus upload chunks for :class:`DataResource`, and an
+UploadManager for uploading many resources' data concurrently.
+"""
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import gzip
+import json
+import os
+from queue import Empty, Full, Queue
+import tempfile
+import threading
+import time
+
+import analyzere
+
+from analyzere.requestor import request_raw
+
+
+class ChunkSizer(object):
+    """
+    Chooses upload chunk sizes from the throughput measured for the chunks
+    sent so far, for use as the ``chunk_size`` of ``upload_data``.
+
+    Each chunk is sized to take about ``target_seconds`` (default
+    `analyzere.upload_chunk_seconds`) to send: on high-latency links small
+    chunks are dominated by the round trip and grow, while on slow links
+    chunks shrink so a failed PATCH costs little to repeat. Sizes at most
+    double or halve from one chunk to the next, and stay between ``minimum``
+    and ``maximum`` (default `analyzere.min_upload_chunk_size` and
+    `analyzere.max_upload_chunk_size`).
+    """
+    def __init__(self, initial=None, minimum=None, maximum=None,
+                 target_seconds=None):
+        self.minimum = minimum or analyzere.min_upload_chunk_size
+        self.maximum = maximum or analyzere.max_upload_chunk_size
+        self.target_seconds = target_seconds or analyzere.upload_chunk_seconds
+        self.size = min(max(initial or analyzere.upload_chunk_size, self.minimum),
+                        self.maximum)
+        self.throughput = None
+        self.history = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self.size
+
+    def record(self, size, seconds):
+        """Adapts the chunk size to a chunk of ``size`` sent in ``seconds``."""
+        with self._lock:
+            self.history.append((size, seconds))
+            throughput = size / max(seconds, 1e-6)
+            # Smoothed, so a single slow or fast request doesn't swing it
+            if self.throughput is None:
+                self.throughput = throughput
+            else:
+                self.throughput = 0.5 * self.throughput + 0.5 * throughput
+            ideal = self.throughput * self.target_seconds
+            ideal = min(max(ideal, self.size / 2), self.size * 2)
+            self.size = int(min(max(ideal, self.minimum), self.maximum))
+
+    def stats(self):
+        """
+        Returns the number of chunks and bytes sent, the time spent sending
+        them, the smoothed throughput in bytes per second, and the size of
+        each chunk.
+        """
+        with self._lock:
+            return {
+                'chunks': len(self.history),
+                'bytes': sum(size for size, _ in self.history),
+                'seconds': sum(seconds for _, seconds in self.history),
+                'throughput': self.throughput,
+                'sizes': [size for size, _ in self.history],
+            }
+
+
+class UploadProgress(object):
+    """
+    Records the progress of an upload in a local JSON file, so a process
+    started after a crash can resume it instead of starting over.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def load(self):
+        """Returns the recorded progress as a dict, or None."""
+        try:
+            with open(self.file_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def matches(self, url, length):
+        """Whether the recorded upload is of ``length`` bytes to ``url``."""
+        record = self.load()
+        return record is not None and record.get('url') == url and \
+            record.get('length') == length
+
+    def save(self, url, length, offset):
+        record = {'url': url, 'length': length, 'offset': offset}
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        # Replaced atomically, so a crash never leaves a partial record
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.file_path)
+
+    def clear(self):
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
+
+
+def get_offset(path, client=None, length=None):
+    """
+    Returns the number of bytes the server has stored for the upload
+    session at ``path``, from the Offset header of a tus HEAD request, or
+    None if its Entity-Length shows the session was started for data of
+    another length than ``length``.
+    """
+    resp = request_raw('head', path, client=client)
+    entity_length = resp.headers.get('Entity-Length')
+    if entity_length is not None and length is not None and int(entity_length) != length:
+        return None
+    return int(resp.headers['Offset'])
+
+
+class GzipChunk(object):
+    """
+    A chunk of upload data compressed with gzip for sending. Its length is
+    that of the uncompressed data, which is what tus offsets count.
+    """
+    def __init__(self, data, level=6):
+        # Counted like uncompressed chunks, which are read from the same file
+        self.size = len(data)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.body = gzip.compress(data, level)
+
+    def __len__(self):
+        return self.size
+
+
+def compress_chunks(chunks, level=6, ahead=1):
+    """
+    Turns the ``(chunk, offset)`` pairs produced by ``chunks`` into pairs of
+    GzipChunk and offset. Up to ``ahead`` chunks are compressed in background
+    threads while the previous ones are being sent, or each as it is
+    requested if ``ahead`` is 0.
+    """
+    if ahead < 1:
+        for chunk, offset in chunks:
+            yield GzipChunk(chunk, level), offset
+        return
+    with ThreadPoolExecutor(max_workers=ahead,
+                            thread_name_prefix='analyzere-gzip') as executor:
+        queue = deque()
+        for chunk, offset in chunks:
+            queue.append((executor.submit(GzipChunk, chunk, level), offset))
+            if len(queue) > ahead:
+                future, offset = queue.popleft()
+                yield future.result(), offset
+        while queue:
+            future, offset = queue.popleft()
+            yield future.result(), offset
+
+
+def prefetch(chunks, depth=2):
+    """
+    Produces the items of ``chunks`` on a background thread, up to ``depth``
+    ahead of the consumer, so reading or generating the data of an upload
+    overlaps with sending it. An exception raised while producing is raised
+    to the consumer; closing the generator stops the producer.
+    """
+    queue = Queue(maxsize=depth)
+    stopped = threading.Event()
+    end = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in chunks:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((end, e))
+        else:
+            put((end, None))
+
+    thread = threading.Thread(target=produce, name='analyzere-upload-producer',
+                              daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+        # Unblock a producer waiting for space in the queue
+        try:
+            queue.get_nowait()
+        except Empty:
+            pass
+
+
+def send_chunk(path, chunk, offset, client=None):
+    headers = {'Offset': str(offset),
+               'Content-Type': 'application/offset+octet-stream'}
+    if isinstance(chunk, GzipChunk):
+        headers['Content-Encoding'] = 'gzip'
+        chunk = chunk.body
+    request_raw('patch', path, headers=headers, body=chunk, client=client)
+
+
+def send_chunks(path, chunks, length=None, upload_callback=lambda x: None,
+                client=None, offset_callback=None, sizer=None, throttle=None):
+    """
+    Sends the ``(chunk, offset)`` pairs produced by ``chunks`` as tus PATCH
+    requests to ``path``, one after another in offset order as the tus
+    protocol requires. ``offset_callback`` is called with the offset up to
+    which every byte has been acknowledged after each chunk. The time taken
+    to send each chunk is recorded with the ChunkSizer ``sizer``, if given,
+    and ``throttle`` is called with the number of bytes each chunk puts on
+    the wire (compressed, for a GzipChunk) before sending it.
+    """
+    for chunk, offset in chunks:
+        if throttle is not None:
+            throttle(len(chunk.body) if isinstance(chunk, GzipChunk) else len(chunk))
+        start = time.monotonic()
+        send_chunk(path, chunk, offset, client)
+        if sizer is not None:
+            sizer.record(len(chunk), time.monotonic() - start)
+        # if there is a known size, and an upload callback, call it
+        if length:
+            upload_callback(offset * 100.0 / length)
+        if offset_callback:
+            offset_callback(offset + len(chunk))
+
+
+class RateLimiter(object):
+    """
+    Limits the number of bytes sent per second by any number of threads,
+    with a token bucket holding up to ``burst`` (default one second's worth)
+    bytes. Calling it with a number of bytes blocks until they may be sent.
+    """
+    def __init__(self, bytes_per_second, burst=None):
+        self.bytes_per_second = float(bytes_per_second)
+        self.burst = burst or self.bytes_per_second
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, size):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens +
+                               (now - self._updated) * self.bytes_per_second)
+            self._updated = now
+            # Taken in advance, so later callers wait for this one's bytes too
+            self._tokens -= size
+            delay = -self._tokens / self.bytes_per_second
+        if delay > 0:
+            time.sleep(delay)
+
+
+class UploadManager(object):
+    """
+    Uploads the data of many resources concurrently::
+
+        with UploadManager(max_concurrent=8, max_bytes_per_second=50e6) as manager:
+            for loss_set, path in sources:
+                manager.submit(loss_set, open(path, 'rb'))
+        print(manager.stats())
+
+    At most ``max_concurrent`` (default `analyzere.max_concurrent_requests`)
+    uploads transfer data at a time, together sending at most
+    ``max_bytes_per_second``, if given. Once an upload is committed, its
+    worker moves on to the next while the commit is polled by the shared
+    poller of `analyzere.polling`, so processing of one upload overlaps with
+    the transfer of others. ``progress_callback`` is called with ``stats()``
+    whenever an upload progresses.
+    """
+    def __init__(self, max_concurrent=None, max_bytes_per_second=None,
+                 progress_callback=None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent or analyzere.max_concurrent_requests,
+            thread_name_prefix='analyzere-upload')
+        self._limiter = RateLimiter(max_bytes_per_second) if max_bytes_per_second else None
+        self._progress_callback = progress_callback
+        self._uploads = []
+        self._bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, resource, source, **kwargs):
+        """
+        Queues the upload of ``source`` to the DataResource ``resource``,
+        with further arguments passed to its ``upload_data``. Returns a
+        ``Future`` for the final upload status.
+        """
+        upload = {'resource': resource, 'future': Future(), 'state': 'queued',
+                  'progress': 0.0, 'error': None}
+        with self._lock:
+            self._uploads.append(upload)
+        self._executor.submit(self._transfer, upload, source, kwargs)
+        return upload['future']
+
+    def _throttle(self, size):
+        if self._limiter is not None:
+            self._limiter(size)
+        with self._lock:
+            self._bytes_sent += size
+
+    def _update(self, upload, **changes):
+        with self._lock:
+            upload.update(changes)
+        if self._progress_callback is not None:
+            self._progress_callback(self.stats())
+
+    def _transfer(self, upload, source, kwargs):
+        future = upload['future']
+        if not future.set_running_or_notify_cancel():
+            self._update(upload, state='cancelled')
+            return
+        upload_callback = kwargs.pop('upload_callback', None)
+
+        def progress(percent):
+            if upload_callback is not None:
+                upload_callback(percent)
+            self._update(upload, progress=percent)
+
+        try:
+            self._update(upload, state='uploading')
+            commit = upload['resource'].upload_data(
+                source, upload_callback=progress, throttle=self._throttle,
+                wait=False, **kwargs)
+        except Exception as e:
+            self._update(upload, state='failed', error=e)
+            future.set_exception(e)
+            return
+        self._update(upload, state='committing')
+        commit.add_done_callback(lambda f: self._committed(upload, f))
+
+    def _committed(self, upload, commit):
+        error = commit.exception()
+        if error is not None:
+            self._update(upload, state='failed', error=error)
+            upload['future'].set_exception(error)
+        elif commit.result().status == 'Processing Successful':
+            self._update(upload, state='succeeded')
+            upload['future'].set_result(commit.result())
+        else:
+            self._update(upload, state='failed')
+            upload['future'].set_result(commit.result())
+
+    def stats(self):
+        """
+        Returns the number of uploads in each state (queued, uploading,
+        committing, succeeded, failed, cancelled), their total, the overall
+        percentage of data transferred and the number of bytes sent.
+        """
+        with self._lock:
+            states = [u['state'] for u in self._uploads]
+            stats = {state: states.count(state) for state in (
+                'queued', 'uploading', 'committing', 'succeeded', 'failed', 'cancelled')}
+            stats['total'] = len(states)
+            stats['progress'] = (sum(100.0 if u['state'] in ('committing', 'succeeded') else u['progress']
+                                     for u in self._uploads) / len(states)) if states else 100.0
+            stats['bytes_sent'] = self._bytes_sent
+            return stats
+
+    def failures(self):
+        """
+        Returns ``(resource, error)`` pairs for the failed uploads, with
+        error None for those whose data failed processing.
+        """
+        with self._lock:
+            return [(u['resource'], u['error']) for u in self._uploads if u['state'] == 'failed']
+
+    def wait(self, timeout=None):
+        """Waits for every upload submitted so far to finish processing."""
+        with self._lock:
+            futures = [u['future'] for u in self._uploads]
+        wait(futures, timeout=timeout)
+
+    def close(self):
+        """Waits for every upload to finish, then stops the workers."""
+        self.wait()
+        self._executor.shutdown()
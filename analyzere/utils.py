@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta, tzinfo
 import json
+import mmap
+import os
 import re
 
-import six
 from six.moves.urllib.parse import urlparse
 
 
@@ -24,17 +25,46 @@ class DateTimeDecoder(json.JSONDecoder):
         super(DateTimeDecoder, self).__init__(*args, **kwargs)
 
     def dict_to_object(self, d):
-        for k, v in six.iteritems(d):
-            # Dates from Analyze Re API currently come back in one of these two
-            # formats. TODO: Loosen this restriction to be more forward
-            # compatible.
-            formats = ['%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ']
-            parsed = parse_datetime(v, formats)
-            if parsed:
-                d[k] = parsed
+        for k, v in d.items():
+            # Only strings ending in "Z" can be timestamps, which rules out
+            # most values without running a regex.
+            if isinstance(v, str) and v.endswith(('Z', 'z')):
+                parsed = parse_api_datetime(v)
+                if parsed:
+                    d[k] = parsed
         return d
 
 
+# Dates from Analyze Re API currently come back in one of two formats,
+# '%Y-%m-%dT%H:%M:%SZ' or '%Y-%m-%dT%H:%M:%S.%fZ'. This pattern accepts exactly
+# what datetime.strptime accepts for those formats (the field patterns are
+# those used by the _strptime module), without its per-call overhead. TODO:
+# Loosen this restriction to be more forward compatible.
+API_DATETIME_RE = re.compile(
+    r'(?P<Y>\d\d\d\d)-(?P<m>1[0-2]|0[1-9]|[1-9])-(?P<d>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])'
+    r'T(?P<H>2[0-3]|[0-1]\d|\d):(?P<M>[0-5]\d|\d):(?P<S>6[0-1]|[0-5]\d|\d)'
+    r'(?:\.(?P<f>[0-9]{1,6}))?Z',
+    re.IGNORECASE)
+
+_utc = UTC()
+
+
+def parse_api_datetime(value):
+    """
+    Parses a timestamp in one of the Analyze Re API formats into a UTC
+    datetime. Returns None if ``value`` is not such a timestamp.
+    """
+    found = API_DATETIME_RE.match(value)
+    if not found or found.end() != len(value):
+        return None
+    Y, m, d, H, M, S, f = found.groups()
+    try:
+        return datetime(int(Y), int(m), int(d), int(H), int(M), int(S),
+                        int(f.ljust(6, '0')) if f else 0, tzinfo=_utc)
+    except ValueError:
+        return None
+
+
 def parse_datetime(value, formats):
     for f in formats:
         try:
@@ -64,17 +94,118 @@ def file_length(file_obj):
     return length
 
 
-def read_in_chunks(file_obj, chunk_size):
-    """Generator to read a file piece by piece."""
-    offset = 0
+def _next_chunk_size(chunk_size):
+    # Either a size or a callable returning the size of the next chunk
+    return chunk_size() if callable(chunk_size) else chunk_size
+
+
+def read_in_chunks(file_obj, chunk_size, offset=0):
+    """
+    Generator to read a file piece by piece, yielding each piece with its
+    offset. ``offset`` is the position the file has been read from.
+    ``chunk_size`` may also be a callable returning the size of each next
+    piece, e.g. a ChunkSizer.
+    """
     while True:
-        data = file_obj.read(chunk_size)
+        data = file_obj.read(_next_chunk_size(chunk_size))
         if not data:
             break
         yield data, offset
         offset += len(data)
 
 
+def skip_bytes(file_obj, size, chunk_size):
+    """
+    Reads and discards the next ``size`` bytes of a stream that can't seek,
+    ``chunk_size`` (a size or callable, as for read_in_chunks) at a time, so
+    they are never held in memory at once.
+    """
+    while size > 0:
+        data = file_obj.read(min(size, _next_chunk_size(chunk_size)))
+        if not data:
+            break
+        size -= len(data)
+
+
+def iter_in_chunks(iterable, chunk_size, offset=0):
+    """
+    Generator like read_in_chunks for an iterable of bytes or str pieces of
+    any length (e.g. CSV rows), yielding bytes of ``chunk_size`` with their
+    offsets. str pieces are encoded as UTF-8. The first ``offset`` bytes are
+    skipped.
+    """
+    buf = bytearray()
+    position = 0
+    for piece in iterable:
+        if isinstance(piece, str):
+            piece = piece.encode('utf-8')
+        if position < offset:
+            skip = min(offset - position, len(piece))
+            piece = piece[skip:]
+            position += skip
+        buf += piece
+        size = _next_chunk_size(chunk_size)
+        while size > 0 and len(buf) >= size:
+            yield bytes(buf[:size]), position
+            del buf[:size]
+            position += size
+            size = _next_chunk_size(chunk_size)
+    if buf:
+        yield bytes(buf), position
+
+
+def slice_in_chunks(buffer, chunk_size, offset=0):
+    """
+    Generator like read_in_chunks for a bytes-like object, yielding
+    memoryview slices of it instead of copies.
+    """
+    view = memoryview(buffer).cast('B')
+    while offset < view.nbytes:
+        size = _next_chunk_size(chunk_size)
+        if size <= 0:
+            break
+        yield view[offset:offset + size], offset
+        offset += size
+
+
+def map_in_chunks(file_obj, chunk_size, offset=0):
+    """
+    Generator like read_in_chunks for a file on disk, yielding memoryviews of
+    pieces of the file mapped into memory instead of copies read from it.
+    Each piece is mapped separately and unmapped once no longer referenced,
+    so memory use doesn't grow with the size of the file.
+    """
+    fileno = file_obj.fileno()
+    length = os.fstat(fileno).st_size
+    while offset < length:
+        size = min(_next_chunk_size(chunk_size), length - offset)
+        if size <= 0:
+            break
+        # Mappings must start at a multiple of the allocation granularity
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        mapped = mmap.mmap(fileno, offset + size - start, offset=start,
+                           access=mmap.ACCESS_READ)
+        yield memoryview(mapped)[offset - start:], offset
+        del mapped
+        offset += size
+
+
+def write_chunks(chunks, file_or_path):
+    """
+    Writes an iterable of byte strings to a writable file object, or to a
+    file at the given path. Returns the number of bytes written.
+    """
+    if not hasattr(file_or_path, 'write'):
+        with open(file_or_path, 'wb') as file_obj:
+            return write_chunks(chunks, file_obj)
+
+    written = 0
+    for chunk in chunks:
+        file_or_path.write(chunk)
+        written += len(chunk)
+    return written
+
+
 def parse_href(href):
     """Parses an Analyze Re href into collection name and ID"""
     url = urlparse(href)
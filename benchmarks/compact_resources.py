@@ -0,0 +1,65 @@
+"""
+Memory held by the objects ``convert_to_analyzere_object`` builds from large
+metrics and candidate responses, as plain EmbeddedResources and with
+``analyzere.compact_resources`` set, measured with tracemalloc, and the time
+taken to build them (in a separate, untraced run).
+
+    python benchmarks/compact_resources.py [--rows 200000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import analyzere  # noqa: E402
+from analyzere.base_resources import convert_to_analyzere_object  # noqa: E402
+from analyzere.resources import Candidate  # noqa: E402
+
+
+def tail_metrics(rows):
+    return [{'probability': i / float(rows), 'min': 0.0, 'max': 1e9 * i, 'mean': 1e6 * i,
+             'variance': 1e3 * i, 'skewness': 0.5, 'kurtosis': 3.0,
+             'context': {'currency': 'USD', 'perspective': 'NetLoss'}}
+            for i in range(rows)]
+
+
+def candidates(rows):
+    return {'items': [{'id': str(i), 'index': i, 'parameters': {'layer_a': 0.5, 'layer_b': 0.25},
+                       'objectives': {'tvar': 1e6 * i}, 'constraints': {'premium': 1e5},
+                       'feasible': True}
+                      for i in range(rows)],
+            'meta': {'total_count': rows}}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    responses = [('tail metrics', tail_metrics(args.rows), None),
+                 ('candidates', candidates(args.rows), Candidate)]
+
+    print('{:>14} {:>8} {:>10} {:>10}'.format('', 'compact', 'MiB', 'seconds'))
+    for name, response, cls in responses:
+        # Parsed anew each time, so only the converted objects are measured
+        body = json.dumps(response)
+        for compact in (False, True):
+            analyzere.compact_resources = compact
+            value = json.loads(body)
+            start = time.time()
+            convert_to_analyzere_object(value, cls)
+            elapsed = time.time() - start
+            tracemalloc.start()
+            objs = convert_to_analyzere_object(value, cls)
+            size = tracemalloc.get_traced_memory()[0] / float(analyzere.one_megabyte)
+            tracemalloc.stop()
+            del objs
+            print('{:>14} {:>8} {:>10.1f} {:>10.2f}'.format(name, str(compact), size, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Decode time of a multi-MB candidates-style JSON response with the previous
+strptime-based DateTimeDecoder and the current one, checking that both produce
+identical output.
+
+    python benchmarks/datetime_decoder.py [--candidates 20000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from analyzere import utils  # noqa: E402
+
+
+class StrptimeDateTimeDecoder(json.JSONDecoder):
+    """The decoder as it was before the fast path."""
+    def __init__(self, *args, **kwargs):
+        kwargs['object_hook'] = self.dict_to_object
+        super(StrptimeDateTimeDecoder, self).__init__(*args, **kwargs)
+
+    def dict_to_object(self, d):
+        for k, v in d.items():
+            formats = ['%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ']
+            parsed = utils.parse_datetime(v, formats)
+            if parsed:
+                d[k] = parsed
+        return d
+
+
+def make_response(candidates):
+    rng = random.Random(0)
+    items = []
+    for i in range(candidates):
+        items.append({
+            'index': i,
+            'created': '2023-06-{:02d}T12:{:02d}:00.{:06d}Z'.format(
+                rng.randint(1, 28), rng.randint(0, 59), rng.randint(0, 999999)),
+            'status': 'Completed',
+            'portfolio_view': {'ref_id': 'a0f3c1e2-{:04d}'.format(i)},
+            'parameters': [{'layer_id': 'l{}'.format(j), 'share': rng.random()}
+                           for j in range(5)],
+            'objectives': {'tvar': rng.random() * 1e7, 'el': rng.random() * 1e6},
+        })
+    return json.dumps({'items': items, 'meta': {'total_count': candidates}})
+
+
+def bench(body, cls, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = json.loads(body, cls=cls)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candidates', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    body = make_response(args.candidates)
+    plain, _ = bench(body, json.JSONDecoder, args.repeat)
+    old, old_result = bench(body, StrptimeDateTimeDecoder, args.repeat)
+    new, new_result = bench(body, utils.DateTimeDecoder, args.repeat)
+    assert old_result == new_result
+
+    print('response size: {:.1f} MB'.format(len(body) / 1e6))
+    print('json (no hook):       {:.3f}s'.format(plain))
+    print('strptime decoder:     {:.3f}s'.format(old))
+    print('DateTimeDecoder:      {:.3f}s  ({:.1f}x faster)'.format(new, old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Minimal local stand-in for the Analyze Re tus upload endpoints, used by the
+upload benchmarks. Each PATCH is delayed by a fixed round-trip ``latency`` and,
+optionally, by the time a single connection would need to transfer the body at
+``bandwidth`` bytes per second.
+
+Like a tus server, it rejects a PATCH whose Offset isn't the number of bytes
+stored when the request starts with 409 Conflict, after receiving its body.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import json
+import threading
+import time
+
+
+class TusHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, code, body=b'', headers=None):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        self._read_body()
+        if self.path.endswith('/data'):
+            with self.server.lock:
+                self.server.offset = 0
+                self.server.received = 0
+                self.server.rejected = 0
+                self.server.entity_length = self.headers.get('Entity-Length')
+            self._respond(201)
+        else:
+            self._respond(204)
+
+    def do_PATCH(self):
+        offset = int(self.headers['Offset'])
+        # Checked as the request starts, like a tus server does: a chunk sent
+        # while its predecessor is still being received is out of order
+        with self.server.lock:
+            accepted = offset == self.server.offset
+        body = self._read_body()
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        delay = self.server.latency
+        if self.server.bandwidth:
+            delay += int(self.headers['Content-Length']) / float(self.server.bandwidth)
+        time.sleep(delay)
+        with self.server.lock:
+            if not accepted or offset != self.server.offset:
+                self.server.rejected += 1
+                self._respond(409)
+                return
+            self.server.offset += len(body)
+            self.server.received += len(body)
+        self._respond(204)
+
+    def do_HEAD(self):
+        headers = {'Offset': str(self.server.offset)}
+        if self.server.entity_length is not None:
+            headers['Entity-Length'] = self.server.entity_length
+        self._respond(200, headers=headers)
+
+    def do_GET(self):
+        body = json.dumps({'status': 'Processing Successful'}).encode()
+        self._respond(200, body, {'Content-Type': 'application/json'})
+
+
+class TusServer(object):
+    def __init__(self, latency=0.02, bandwidth=None):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), TusHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.bandwidth = bandwidth
+        self.httpd.rejected = 0
+        self.httpd.lock = threading.Lock()
+        self.httpd.offset = 0
+        self.httpd.received = 0
+        self.httpd.entity_length = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{}/'.format(self.httpd.server_address[1])
+
+    @property
+    def received(self):
+        return self.httpd.received
+
+    @property
+    def rejected(self):
+        """Number of PATCHes of the last upload rejected as out of order."""
+        return self.httpd.rejected
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,67 @@
+"""
+Effective upload throughput and client CPU cost of
+``DataResource.upload_data(compression=...)`` at different gzip levels,
+against a local tus stand-in with limited bandwidth. The data is a synthetic
+YELT-like CSV, which compresses about as well as real loss set data.
+
+    python benchmarks/upload_compression.py [--size-mb 64] [--bandwidth-mb 5]
+"""
+import argparse
+from io import BytesIO
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import analyzere  # noqa: E402
+from analyzere import LossSet  # noqa: E402
+from tus_server import TusServer  # noqa: E402
+
+
+def yelt_csv(size):
+    rng = random.Random(0)
+    rows = ['Trial,Event,Sequence,Loss\n']
+    length = len(rows[0])
+    trial = 1
+    while length < size:
+        trial += rng.random() < 0.1
+        row = '{},{},{:.6f},{:.2f}\n'.format(
+            trial, rng.randint(1, 100000), rng.random(), rng.lognormvariate(10, 2))
+        rows.append(row)
+        length += len(row)
+    return ''.join(rows).encode()[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='per-PATCH round trip latency in seconds')
+    parser.add_argument('--bandwidth-mb', type=float, default=5,
+                        help='per-connection bandwidth in MiB/s')
+    parser.add_argument('--read-ahead', type=int, default=1)
+    args = parser.parse_args()
+
+    data = yelt_csv(args.size_mb * analyzere.one_megabyte)
+
+    print('{:>6} {:>10} {:>10} {:>12}'.format('level', 'seconds', 'MiB/s', 'CPU seconds'))
+    with TusServer(latency=args.latency,
+                   bandwidth=args.bandwidth_mb * analyzere.one_megabyte) as server:
+        analyzere.base_url = server.base_url
+        for level in (None, 1, 3, 6, 9):
+            start, cpu_start = time.time(), time.process_time()
+            LossSet(id='bench').upload_data(
+                BytesIO(data), compression=level, read_ahead=args.read_ahead,
+                poll_interval=0)
+            elapsed = time.time() - start
+            # Includes the stand-in server's decompression, which runs in-process
+            cpu = time.process_time() - cpu_start
+            assert server.received == len(data)
+            print('{:>6} {:>10.2f} {:>10.1f} {:>12.2f}'.format(
+                level or 'off', elapsed, args.size_mb / elapsed, cpu))
+
+
+if __name__ == '__main__':
+    main()
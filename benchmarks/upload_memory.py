@@ -0,0 +1,72 @@
+"""
+Peak resident memory of ``DataResource.upload_data`` for files of different
+sizes, reading the file into a copy per chunk, memory mapping it
+(``memory_map=True``) and passing its contents as bytes. Each upload runs
+in a fresh process against a local tus stand-in.
+
+    python benchmarks/upload_memory.py [--sizes-mb 64 256 1024] [--chunk-mb 16]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import analyzere  # noqa: E402
+from analyzere import LossSet  # noqa: E402
+from tus_server import TusServer  # noqa: E402
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def upload(mode, path, chunk_size):
+    """Uploads the file at path and prints the peak RSS increase in MiB."""
+    baseline = peak_rss_mb()
+    with TusServer(latency=0) as server:
+        analyzere.base_url = server.base_url
+        with open(path, 'rb') as f:
+            if mode == 'bytes':
+                source = f.read()
+            else:
+                source = f
+            LossSet(id='bench').upload_data(source, chunk_size=chunk_size,
+                                            memory_map=mode == 'mmap',
+                                            poll_interval=0)
+        assert server.received == os.path.getsize(path)
+    print(peak_rss_mb() - baseline)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--chunk-mb', type=int, default=16)
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, path, chunk_size = args.child
+        upload(mode, path, int(chunk_size))
+        return
+
+    chunk_size = args.chunk_mb * analyzere.one_megabyte
+    print('{:>8} {:>12} {:>12} {:>12}'.format('file MiB', 'read MiB', 'mmap MiB', 'bytes MiB'))
+    for size_mb in args.sizes_mb:
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(analyzere.one_megabyte))
+            f.flush()
+            peaks = [
+                float(subprocess.check_output(
+                    [sys.executable, __file__, '--child', mode, f.name, str(chunk_size)]))
+                for mode in ('read', 'mmap', 'bytes')]
+        print('{:>8} {:>12.1f} {:>12.1f} {:>12.1f}'.format(size_mb, *peaks))
+
+
+if __name__ == '__main__':
+    main()
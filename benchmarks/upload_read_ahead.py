@@ -0,0 +1,82 @@
+"""
+Upload throughput against a local tus stand-in for different chunk sizes,
+including adaptive ones chosen by ``analyzere.uploads.ChunkSizer``, and
+``DataResource.upload_data(read_ahead=...)`` settings, for sources that
+cost time to produce: a generator rendering YELT-like CSV rows, and a file
+compressed with gzip while uploading.
+
+Chunks are always sent in offset order, so the stand-in, which rejects
+chunks ahead of the stored offset like a strict tus server, should report
+none rejected. Read-ahead pays off by preparing the next chunks while the
+current one is in flight.
+
+    python benchmarks/upload_read_ahead.py [--size-mb 32] [--latency 0.02] [--bandwidth-mb 20]
+"""
+import argparse
+from io import BytesIO
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import analyzere  # noqa: E402
+from analyzere import LossSet  # noqa: E402
+from analyzere.uploads import ChunkSizer  # noqa: E402
+from tus_server import TusServer  # noqa: E402
+
+
+def rows(size):
+    rng = random.Random(0)
+    yield 'Trial,Event,Sequence,Loss\n'
+    length = 0
+    trial = 1
+    while length < size:
+        trial += rng.random() < 0.1
+        row = '{},{},{:.6f},{:.2f}\n'.format(
+            trial, rng.randint(1, 100000), rng.random(), rng.lognormvariate(10, 2))
+        length += len(row)
+        yield row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='per-PATCH round trip latency in seconds')
+    parser.add_argument('--bandwidth-mb', type=float, default=20,
+                        help='bandwidth in MiB/s')
+    args = parser.parse_args()
+
+    size = args.size_mb * analyzere.one_megabyte
+    data = ''.join(rows(size)).encode()
+    sources = [
+        ('generator', lambda: rows(size), {}),
+        ('gzip 6', lambda: BytesIO(data), {'compression': 6}),
+    ]
+
+    print('{:>10} {:>10} {:>10} {:>10} {:>10} {:>9}'.format(
+        'source', 'chunk MiB', 'read_ahead', 'seconds', 'MiB/s', 'rejected'))
+    with TusServer(latency=args.latency,
+                   bandwidth=args.bandwidth_mb * analyzere.one_megabyte) as server:
+        analyzere.base_url = server.base_url
+        for name, source, kwargs in sources:
+            for chunk_mb in (1, 4, 'adaptive'):
+                for read_ahead in (0, 1, 2, 4):
+                    if chunk_mb == 'adaptive':
+                        chunk_size = ChunkSizer(initial=analyzere.one_megabyte)
+                    else:
+                        chunk_size = chunk_mb * analyzere.one_megabyte
+                    start = time.time()
+                    LossSet(id='bench').upload_data(
+                        source(), chunk_size=chunk_size, read_ahead=read_ahead,
+                        poll_interval=0, **kwargs)
+                    elapsed = time.time() - start
+                    print('{:>10} {:>10} {:>10} {:>10.2f} {:>10.1f} {:>9}'.format(
+                        name, chunk_mb, read_ahead, elapsed, server.received / elapsed /
+                        analyzere.one_megabyte, server.rejected))
+
+
+if __name__ == '__main__':
+    main()
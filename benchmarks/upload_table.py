@@ -0,0 +1,70 @@
+"""
+Time and peak traced memory (measured in a second, traced run) of uploading
+a YELT held as a NumPy structured array, rendering it into a CSV string for
+``upload_data`` versus streaming it with ``DataResource.upload_table``,
+against a local tus stand-in.
+
+    python benchmarks/upload_table.py [--rows 2000000] [--read-ahead 1]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import analyzere  # noqa: E402
+from analyzere import LossSet  # noqa: E402
+from tus_server import TusServer  # noqa: E402
+
+
+def yelt(rows):
+    rng = np.random.default_rng(0)
+    a = np.zeros(rows, dtype=[('trial', np.int64), ('event', np.int64),
+                              ('sequence', np.float64), ('loss', np.float64)])
+    a['trial'] = np.arange(rows) // 10 + 1
+    a['event'] = rng.integers(1, 100000, rows)
+    a['sequence'] = rng.random(rows)
+    a['loss'] = rng.lognormal(10, 2, rows)
+    return a
+
+
+def csv_string(a):
+    lines = ['Trial,Event,Sequence,Loss\n']
+    lines.extend('{},{},{},{}\n'.format(*row) for row in a.tolist())
+    return ''.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--read-ahead', type=int, default=1)
+    args = parser.parse_args()
+
+    a = yelt(args.rows)
+    uploads = [
+        ('csv string', lambda: LossSet(id='bench').upload_data(
+            csv_string(a), read_ahead=args.read_ahead, poll_interval=0)),
+        ('upload_table', lambda: LossSet(id='bench').upload_table(
+            a, read_ahead=args.read_ahead, poll_interval=0)),
+    ]
+
+    print('{:>14} {:>10} {:>14}'.format('', 'seconds', 'peak MiB'))
+    with TusServer(latency=0) as server:
+        analyzere.base_url = server.base_url
+        for name, upload in uploads:
+            start = time.time()
+            upload()
+            elapsed = time.time() - start
+            tracemalloc.start()
+            upload()
+            peak = tracemalloc.get_traced_memory()[1] / float(analyzere.one_megabyte)
+            tracemalloc.stop()
+            print('{:>14} {:>10.2f} {:>14.1f}'.format(name, elapsed, peak))
+
+
+if __name__ == '__main__':
+    main()
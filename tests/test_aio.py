@@ -0,0 +1,410 @@
+import asyncio
+import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+import pytest
+import mock
+
+import analyzere
+from analyzere import InvalidRequestError, LayerView
+from analyzere.cache import MemoryMetricsCache, ResourceCache
+from analyzere.errors import RetryAfter
+
+httpx = pytest.importorskip('httpx')
+from analyzere import aio  # noqa: E402
+
+
+class MockServer(object):
+    """
+    Records requests and replays queued responses per (method, url).
+    """
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+
+    def add(self, method, url, *responses):
+        self.routes.setdefault((method, url), []).extend(responses)
+
+    def __call__(self, request):
+        self.requests.append(request)
+        key = (request.method, str(request.url).split('?')[0])
+        responses = self.routes[key]
+        kwargs = responses.pop(0) if len(responses) > 1 else responses[0]
+        return httpx.Response(**kwargs)
+
+
+@pytest.fixture
+def server():
+    s = MockServer()
+    aio.session = None
+    aio.oauth_client = None
+    aio.transport = httpx.MockTransport(s)
+    analyzere.base_url = 'https://api'
+    yield s
+    aio.session = None
+    aio.oauth_client = None
+    aio.transport = None
+    analyzere.base_url = ''
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestAsyncRequest:
+    def test_response_deserialized(self, server):
+        server.add('GET', 'https://api/bar', {'status_code': 200, 'text': '{"foo": "bar"}'})
+        assert run(aio.request('get', 'bar')) == {'foo': 'bar'}
+        assert server.requests[0].headers['User-Agent'] == analyzere.user_agent
+
+    def test_request_serialized(self, server):
+        server.add('POST', 'https://api/bar', {'status_code': 201})
+        run(aio.request('post', 'bar', data={'foo': 'bar'}))
+        assert server.requests[0].content == b'{"foo": "bar"}'
+
+    def test_errors_handled(self, server):
+        server.add('GET', 'https://api/bar', {'status_code': 400})
+        with pytest.raises(InvalidRequestError):
+            run(aio.request_raw('get', 'bar'))
+
+    def test_request_retrying(self, server):
+        server.add('GET', 'https://api/bar',
+                   {'status_code': 503, 'headers': {'Retry-After': '1.0'}},
+                   {'status_code': 200, 'text': 'foo'})
+        with mock.patch('asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            resp = run(aio.request_raw('get', 'bar'))
+        assert resp.text == 'foo'
+        sleep.assert_called_once_with(1.0)
+
+    def test_no_auto_retry(self, server):
+        server.add('GET', 'https://api/bar',
+                   {'status_code': 503, 'headers': {'Retry-After': '1.0'}})
+        with pytest.raises(RetryAfter):
+            run(aio.request_raw('get', 'bar', auto_retry=False))
+
+    def test_basic_authentication(self, server):
+        server.add('GET', 'https://api/bar', {'status_code': 200})
+        analyzere.username = 'user'
+        analyzere.password = 'pa55'
+        try:
+            run(aio.request_raw('get', 'bar'))
+        finally:
+            analyzere.username = ''
+            analyzere.password = ''
+        expected = f"Basic {base64.b64encode(b'user:pa55').decode('ascii')}"
+        assert server.requests[0].headers['Authorization'] == expected
+
+    def test_bearer_authentication(self, server):
+        server.add('GET', 'https://api/bar', {'status_code': 200})
+        analyzere.bearer_auth_token = 's1234567890'
+        try:
+            run(aio.request_raw('get', 'bar'))
+        finally:
+            analyzere.bearer_auth_token = ''
+        assert server.requests[0].headers['Authorization'] == 'Bearer s1234567890'
+
+
+class OKHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+
+class TestAsyncSession:
+    def test_session_per_event_loop(self, server):
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), OKHandler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        aio.transport = None
+        analyzere.base_url = 'http://127.0.0.1:{}/'.format(httpd.server_address[1])
+        try:
+            # The second run's loop can't use connections pooled in the first
+            assert run(aio.request('get', 'foo')) == {}
+            first = aio.session
+            assert run(aio.request('get', 'foo')) == {}
+            assert aio.session is not first
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+
+class TestAsyncClient:
+    def test_bound_class(self, server):
+        tenant = analyzere.Client('https://tenant/', bearer_auth_token='TENANT')
+        analyzere.bearer_auth_token = 'MODULE'
+        server.add('GET', 'https://tenant/layer_views/abc', {'status_code': 200, 'text': '{"id": "abc"}'})
+        server.add('GET', 'https://api/layer_views/abc', {'status_code': 200, 'text': '{"id": "abc"}'})
+        try:
+            async def go():
+                lv = await tenant.bind(aio.LayerView).retrieve('abc')
+                await aio.LayerView.retrieve('abc')
+                return lv
+            lv = run(go())
+        finally:
+            analyzere.bearer_auth_token = ''
+
+        assert isinstance(lv, aio.LayerView)
+        assert lv._client is tenant
+        assert [(str(r.url), r.headers['Authorization']) for r in server.requests] == [
+            ('https://tenant/layer_views/abc', 'Bearer TENANT'),
+            ('https://api/layer_views/abc', 'Bearer MODULE')]
+        assert aio.get_state(tenant).session is not aio.session
+
+
+class TestAsyncClientCredentials:
+    @pytest.fixture(autouse=True)
+    def oauth_config(self, server):
+        analyzere.oauth_token_url = 'https://token/'
+        analyzere.oauth_client_id = 'client-id'
+        analyzere.oauth_client_secret = 'secret'
+        analyzere.oauth_scope = 'scope'
+        yield
+        analyzere.oauth_token_url = ''
+        analyzere.oauth_client_id = ''
+        analyzere.oauth_client_secret = ''
+        analyzere.oauth_scope = ''
+
+    def test_token_fetched_once(self, server):
+        server.add('POST', 'https://token/',
+                   {'status_code': 200, 'text': '{"access_token": "t1", "expires_in": 3600}'})
+        server.add('GET', 'https://api/bar', {'status_code': 200})
+
+        async def go():
+            await asyncio.gather(*[aio.request_raw('get', 'bar') for _ in range(5)])
+        run(go())
+
+        token_requests = [r for r in server.requests if r.url == 'https://token/']
+        assert len(token_requests) == 1
+        body = token_requests[0].content.decode()
+        assert 'grant_type=client_credentials' in body
+        assert 'client_id=client-id' in body
+        assert 'client_secret=secret' in body
+        assert 'scope=scope' in body
+        api_requests = [r for r in server.requests if r.url == 'https://api/bar']
+        assert len(api_requests) == 5
+        assert all(r.headers['Authorization'] == 'Bearer t1' for r in api_requests)
+
+    def test_retry_on_401(self, server):
+        server.add('POST', 'https://token/',
+                   {'status_code': 200, 'text': '{"access_token": "t1", "expires_in": 3600}'},
+                   {'status_code': 200, 'text': '{"access_token": "t2", "expires_in": 3600}'})
+        server.add('GET', 'https://api/bar', {'status_code': 401}, {'status_code': 200})
+
+        run(aio.request_raw('get', 'bar'))
+
+        assert [str(r.url) for r in server.requests] == [
+            'https://token/', 'https://api/bar', 'https://token/', 'https://api/bar']
+        assert server.requests[1].headers['Authorization'] == 'Bearer t1'
+        assert server.requests[3].headers['Authorization'] == 'Bearer t2'
+
+    def test_401_after_refresh_uses_new_token(self, server):
+        tokens = []
+
+        async def handler(request):
+            if request.url == 'https://token/':
+                tokens.append('t{}'.format(len(tokens) + 1))
+                return httpx.Response(200, json={'access_token': tokens[-1], 'expires_in': 3600})
+            if request.headers['Authorization'] == 'Bearer t1':
+                # Staggered, so most 401s arrive after the first refresh has finished
+                await asyncio.sleep(0.01 * int(request.url.path.rsplit('/', 1)[-1]))
+                return httpx.Response(401)
+            return httpx.Response(200)
+        aio.transport = httpx.MockTransport(handler)
+
+        async def go():
+            aio.ensure_session_exists()
+            await aio.fetch_token()
+            await asyncio.gather(*[aio.request_raw('get', 'bar/{}'.format(i)) for i in range(5)])
+        run(go())
+
+        assert tokens == ['t1', 't2']
+
+    def test_refresh_on_expiry(self, server):
+        server.add('POST', 'https://token/',
+                   {'status_code': 200, 'text': '{"access_token": "t1", "expires_in": -1}'},
+                   {'status_code': 200, 'text': '{"access_token": "t2", "expires_in": 3600}'})
+        server.add('GET', 'https://api/bar', {'status_code': 200})
+
+        run(aio.request_raw('get', 'bar'))
+
+        assert [str(r.url) for r in server.requests] == [
+            'https://token/', 'https://token/', 'https://api/bar']
+        assert server.requests[2].headers['Authorization'] == 'Bearer t2'
+
+
+class TestAsyncResources:
+    def test_retrieve(self, server):
+        server.add('GET', 'https://api/layer_views/abc123',
+                   {'status_code': 200, 'text': '{"id": "abc123", "foo": "bar"}'})
+        lv = run(aio.LayerView.retrieve('abc123'))
+        assert isinstance(lv, LayerView)
+        assert lv.foo == 'bar'
+
+    def test_list(self, server):
+        body = json.dumps({'items': [{'id': 'a'}, {'id': 'b'}],
+                           'meta': {'limit': 2, 'offset': 0, 'total_count': 2}})
+        server.add('GET', 'https://api/layers/', {'status_code': 200, 'text': body})
+        layers = run(aio.Layer.list(limit=2))
+        assert [layer.id for layer in layers] == ['a', 'b']
+        assert server.requests[0].url.params['limit'] == '2'
+
+    def test_iter_all(self, server):
+        for offset, ids in ((0, ['a', 'b']), (2, ['c'])):
+            body = json.dumps({'items': [{'id': i} for i in ids],
+                               'meta': {'limit': 2, 'offset': offset, 'total_count': 3}})
+            server.add('GET', 'https://api/layers/', {'status_code': 200, 'text': body})
+
+        async def go():
+            return [layer.id async for layer in aio.Layer.iter_all(limit=2)]
+        assert run(go()) == ['a', 'b', 'c']
+        assert [r.url.params['offset'] for r in server.requests] == ['0', '2']
+
+    def test_save(self, server):
+        server.add('POST', 'https://api/layers/',
+                   {'status_code': 200, 'text': '{"id": "abc123", "server_generated": "foo"}'})
+        layer = aio.Layer(foo='bar')
+        assert run(layer.save()) is layer
+        assert json.loads(server.requests[0].content) == {'foo': 'bar'}
+        assert layer.server_generated == 'foo'
+        assert not hasattr(layer, 'foo')
+
+    def test_save_compact_resources(self, server, monkeypatch):
+        monkeypatch.setattr(analyzere, 'compact_resources', True)
+        server.add('POST', 'https://api/layers/',
+                   {'status_code': 200, 'text': '{"id": "abc123", "meta": {"a": 1}}'})
+        layer = run(aio.Layer(foo='bar').save())
+        assert layer.id == 'abc123'
+        assert layer.meta.a == 1
+
+    def test_resource_cache_not_shared_with_sync_classes(self, server, reqmock, monkeypatch):
+        monkeypatch.setattr(analyzere, 'resource_cache', ResourceCache())
+        server.add('GET', 'https://api/layer_views/lv1',
+                   {'status_code': 200, 'text': '{"id": "lv1"}'})
+        reqmock.get('https://api/layer_views/lv1', text='{"id": "lv1"}')
+
+        async_lv = run(aio.LayerView.retrieve('lv1'))
+        lv = LayerView.retrieve('lv1')
+        assert type(lv) is LayerView
+        assert type(async_lv) is aio.LayerView
+        assert LayerView.retrieve('lv1') is lv
+
+    def test_metrics(self, server):
+        server.add('GET', 'https://api/layer_views/abc123/tail_metrics/0.5,1.0',
+                   {'status_code': 200, 'text': '[{"num": 1.0}, {"num": 2.0}]'})
+        server.add('GET', 'https://api/layer_views/abc123/el',
+                   {'status_code': 200, 'text': '3.0'})
+        lv = aio.LayerView(id='abc123')
+
+        tm = run(lv.tail_metrics([0.5, 1.0]))
+        assert [m.num for m in tm] == [1.0, 2.0]
+        assert run(lv.el()) == 3.0
+
+    def test_submit(self, server):
+        server.add('GET', 'https://api/layer_views/abc123/tail_metrics/0.5',
+                   {'status_code': 503, 'headers': {'Retry-After': '2.0'}},
+                   {'status_code': 200, 'text': '{"num": 1.0}'})
+        lv = aio.LayerView(id='abc123')
+
+        async def submit():
+            task = lv.submit('tail_metrics', 0.5)
+            assert isinstance(task, asyncio.Task)
+            return await task
+
+        with mock.patch('asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            tm = run(submit())
+        assert tm.num == 1.0
+        sleep.assert_called_once_with(2.0)
+        assert len(server.requests) == 2
+
+    def test_metrics_cached_per_probability(self, server):
+        server.add('GET', 'https://api/layer_views/abc123/tail_metrics/0.5,1.0',
+                   {'status_code': 200, 'text': '[{"num": 1.0}, {"num": 2.0}]'})
+        server.add('GET', 'https://api/layer_views/abc123/tail_metrics/0.1',
+                   {'status_code': 200, 'text': '{"num": 3.0}'})
+        lv = aio.LayerView(id='abc123')
+        analyzere.metrics_cache = MemoryMetricsCache()
+        try:
+            run(lv.tail_metrics([0.5, 1.0]))
+            tm = run(lv.tail_metrics([1.0, 0.1]))
+        finally:
+            analyzere.metrics_cache = None
+        assert [m.num for m in tm] == [2.0, 3.0]
+        assert len(server.requests) == 2
+
+    def test_long_vector_split(self, server):
+        server.add('GET', 'https://api/layer_views/abc123/tail_metrics/0.1,0.2',
+                   {'status_code': 200, 'text': '[{"num": 1.0}, {"num": 2.0}]'})
+        server.add('GET', 'https://api/layer_views/abc123/tail_metrics/0.3',
+                   {'status_code': 200, 'text': '{"num": 3.0}'})
+        url = 'https://api/layer_views/abc123/tail_metrics/0.1,0.2'
+        analyzere.max_url_length = len(url)
+        try:
+            tm = run(aio.LayerView(id='abc123').tail_metrics([0.1, 0.2, 0.3]))
+        finally:
+            analyzere.max_url_length = 2000
+        assert [m.num for m in tm] == [1.0, 2.0, 3.0]
+        assert len(server.requests) == 2
+
+    def test_download_yelt(self, server):
+        server.add('GET', 'https://api/layer_views/abc123/yelt',
+                   {'status_code': 200, 'text': 'yelt-data'})
+        assert run(aio.LayerView(id='abc123').download_yelt()) == b'yelt-data'
+
+    def test_upload_data(self, server):
+        server.add('POST', 'https://api/loss_sets/abc123/data', {'status_code': 201})
+        server.add('PATCH', 'https://api/loss_sets/abc123/data', {'status_code': 204})
+        server.add('POST', 'https://api/loss_sets/abc123/data/commit', {'status_code': 204})
+        server.add('GET', 'https://api/loss_sets/abc123/data/status',
+                   {'status_code': 200, 'text': '{"status": "Processing", "commit_progress": 50}'},
+                   {'status_code': 200, 'text': '{"status": "Processing Successful"}'})
+        commit_callback = mock.Mock()
+
+        with mock.patch('asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            status = run(aio.LossSet(id='abc123').upload_data(
+                'data', chunk_size=3, commit_callback=commit_callback))
+
+        assert status.status == 'Processing Successful'
+        assert sleep.call_count == 1
+        patches = [r for r in server.requests if r.method == 'PATCH']
+        assert [(r.headers['Offset'], r.content) for r in patches] == [('0', b'dat'), ('3', b'a')]
+        assert server.requests[0].headers['Entity-Length'] == '4'
+        assert [c[0][0] for c in commit_callback.call_args_list] == [50.0, 100.0]
+
+    def test_upload_table(self, server):
+        server.add('POST', 'https://api/loss_sets/abc123/data', {'status_code': 201})
+        server.add('PATCH', 'https://api/loss_sets/abc123/data', {'status_code': 204})
+        server.add('POST', 'https://api/loss_sets/abc123/data/commit', {'status_code': 204})
+        server.add('GET', 'https://api/loss_sets/abc123/data/status',
+                   {'status_code': 200, 'text': '{"status": "Processing Successful"}'})
+        table = {'trial': [1, 2, 3], 'loss': [0.5, 1.0, 2e-07]}
+
+        status = run(aio.LossSet(id='abc123').upload_table(table, chunk_size=8))
+
+        assert status.status == 'Processing Successful'
+        assert 'Entity-Length' not in server.requests[0].headers
+        patches = [r for r in server.requests if r.method == 'PATCH']
+        assert len(patches) > 1
+        assert [int(r.headers['Offset']) for r in patches] == list(range(0, 8 * len(patches), 8))
+        assert b''.join(r.content for r in patches) == b'Trial,Loss\n1,0.5\n2,1.0\n3,2e-07\n'
+
+    def test_upload_data_bytes(self, server):
+        server.add('POST', 'https://api/loss_sets/abc123/data', {'status_code': 201})
+        server.add('PATCH', 'https://api/loss_sets/abc123/data', {'status_code': 204})
+        server.add('POST', 'https://api/loss_sets/abc123/data/commit', {'status_code': 204})
+        server.add('GET', 'https://api/loss_sets/abc123/data/status',
+                   {'status_code': 200, 'text': '{"status": "Processing Successful"}'})
+
+        run(aio.LossSet(id='abc123').upload_data(b'12345', chunk_size=3))
+
+        assert server.requests[0].headers['Entity-Length'] == '5'
+        patches = [r for r in server.requests if r.method == 'PATCH']
+        assert [(r.headers['Offset'], r.content) for r in patches] == [('0', b'123'), ('3', b'45')]
@@ -1,24 +1,34 @@
 import copy
 from datetime import datetime
+import gzip
+from io import BytesIO
 import json
+import os
+import pickle
+import re
+import threading
 
 import pytest
 import mock
 from six import StringIO
 
 import analyzere
-from analyzere import MissingIdError
+from analyzere import MissingIdError, uploads
 from analyzere.resources import Layer, OptimizationView, Candidate
 from analyzere.base_resources import (
     AnalyzeReObject,
+    CompactResource,
     DataResource,
     EmbeddedResource,
     MetricsResource,
     Reference,
     Resource,
+    batch_metrics,
     convert_to_analyzere_object,
+    resolve_references,
     NestedResource)
-from analyzere.errors import RetryAfter
+from analyzere.cache import MemoryMetricsCache
+from analyzere.errors import InvalidRequestError, RetryAfter, ServerError
 import uuid
 
 
@@ -108,6 +118,58 @@ class TestReferences(SetBaseUrl):
         assert reqmock.call_count == 1
 
 
+class TestResolveReferences(SetBaseUrl):
+    def test_collection(self, reqmock):
+        for i in range(5):
+            reqmock.get('https://api/layers/l{}'.format(i), status_code=200,
+                        text='{{"id": "l{}", "foo": {}}}'.format(i, i))
+        refs = [Reference('https://api/layers/l{}'.format(i)) for i in range(5)]
+
+        assert resolve_references(refs, max_workers=3) is refs
+        assert reqmock.call_count == 5
+
+        # Each reference was populated in place
+        assert [r.foo for r in refs] == [0, 1, 2, 3, 4]
+        assert all(isinstance(r, Layer) for r in refs)
+        assert reqmock.call_count == 5
+
+    def test_resource_attributes(self, reqmock):
+        reqmock.get('https://api/portfolios/p1', status_code=200,
+                    text='{"id": "p1", "layers": [{"href": "https://api/layers/l1"}, '
+                         '{"href": "https://api/layers/l2"}, {"href": "https://api/layers/l1"}]}')
+        reqmock.get('https://api/layers/l1', status_code=200,
+                    text='{"id": "l1", "loss_sets": [{"href": "https://api/loss_sets/ls1"}]}')
+        reqmock.get('https://api/layers/l2', status_code=200, text='{"id": "l2"}')
+
+        portfolio = Reference('https://api/portfolios/p1')
+        assert portfolio.id == 'p1'
+        resolve_references(portfolio)
+
+        # Duplicate references are fetched once but not shared
+        assert reqmock.call_count == 3
+        layers = portfolio.layers
+        assert [layer.id for layer in layers] == ['l1', 'l2', 'l1']
+        assert layers[0] is not layers[2]
+        assert layers[0].__wrapped__ is not layers[2].__wrapped__
+        assert layers[2]._resolved
+
+        # Nested references stay lazy
+        assert not layers[0].loss_sets[0]._resolved
+        assert reqmock.call_count == 3
+
+    def test_resolved_references_skipped(self, reqmock):
+        reqmock.get('https://api/layers/l1', status_code=200, text='{"id": "l1"}')
+        ref = Reference('https://api/layers/l1')
+        ref.id
+        resolve_references([ref, 'foo', None])
+        assert reqmock.call_count == 1
+
+    def test_error_raised(self, reqmock):
+        reqmock.get('https://api/layers/l1', status_code=404)
+        with pytest.raises(InvalidRequestError):
+            resolve_references([Reference('https://api/layers/l1')])
+
+
 class TestAnalyzeReObject:
     def test_initialize_from_kwargs(self):
         a = AnalyzeReObject(_type='sometype', foo='bar', baz='qux')
@@ -373,6 +435,30 @@ class TestResource(SetBaseUrl):
         assert reqmock.last_request.qs['foo'] == ['bar']
         assert reqmock.last_request.qs['quux'] == ['baz,qux']
 
+    def test_iter_all(self, reqmock):
+        def page(request, context):
+            offset = int(request.qs['offset'][0])
+            limit = int(request.qs['limit'][0])
+            ids = range(offset, min(offset + limit, 5))
+            return json.dumps({
+                'items': [{'id': str(i)} for i in ids],
+                'meta': {'limit': limit, 'offset': offset, 'total_count': 5},
+            })
+        reqmock.get('https://api/foos/', text=page)
+
+        foos = Foo.iter_all(limit=2, ordering='id')
+        assert next(foos) == Foo(id='0')
+        assert [f.id for f in foos] == ['1', '2', '3', '4']
+        assert [r.qs['offset'] for r in reqmock.request_history] == [['0'], ['2'], ['4']]
+        assert all(r.qs['ordering'] == ['id'] for r in reqmock.request_history)
+
+    def test_iter_all_offset_and_empty(self, reqmock):
+        reqmock.get('https://api/foos/', text=json.dumps({
+            'items': [], 'meta': {'limit': 2, 'offset': 10, 'total_count': 3}}))
+        assert list(Foo.iter_all(offset=10)) == []
+        assert reqmock.call_count == 1
+        assert reqmock.last_request.qs['offset'] == ['10']
+
     def test_save_new(self, reqmock):
         reqmock.post('https://api/foos/', status_code=200,
                      text='{"id": "abc123", "server_generated": "foo"}')
@@ -482,6 +568,27 @@ class TestDataResource(SetBaseUrl):
         f = Bar(id='abc123')
         assert f.download_data() == b'data'
 
+    def test_download_to_file(self, reqmock, tmp_path):
+        reqmock.get('https://api/bars/abc123/data', status_code=200,
+                    text='data')
+        f = Bar(id='abc123')
+
+        file_obj = BytesIO()
+        assert f.download_data(file_obj, chunk_size=3) == 4
+        assert file_obj.getvalue() == b'data'
+
+        path = str(tmp_path / 'data.csv')
+        assert f.download_data(path) == 4
+        with open(path, 'rb') as fp:
+            assert fp.read() == b'data'
+
+    def test_iter_data(self, reqmock):
+        reqmock.get('https://api/bars/abc123/data', status_code=200,
+                    text='a,b\n1,2\n')
+        f = Bar(id='abc123')
+        assert list(f.iter_data(chunk_size=4)) == [b'a,b\n', b'1,2\n']
+        assert list(f.iter_data(lines=True)) == [b'a,b', b'1,2']
+
     def test_upload_data(self, mock_bar_request):
         reqmock = mock_bar_request
 
@@ -667,12 +774,312 @@ class TestDataResource(SetBaseUrl):
         actual_calls = [c[0][0] for c in commit_callback.call_args_list]
         assert expected_calls == actual_calls
 
+    @pytest.mark.parametrize('data', ['1234567890', BytesIO(b'1234567890'), iter(['12345', '67890'])])
+    def test_upload_data_read_ahead(self, mock_bar_request, data):
+        reqmock = mock_bar_request
+        upload_callback = mock.Mock()
+
+        Bar(id='abc123').upload_data(data, chunk_size=3, read_ahead=3,
+                                     upload_callback=upload_callback)
+
+        # Chunks are read ahead, but sent in offset order
+        patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+        assert [(r.headers['Offset'], r.text) for r in patches] == [
+            ('0', '123'), ('3', '456'), ('6', '789'), ('9', '0')]
+        assert reqmock.request_history[-2].url.endswith('/data/commit')
+        assert upload_callback.call_args_list[-1][0][0] == 100.0
+
+    def test_upload_data_compressed(self, mock_bar_request):
+        reqmock = mock_bar_request
+        upload_callback = mock.Mock()
+
+        for read_ahead in (0, 1, 3):
+            reqmock.reset_mock()
+            Bar(id='abc123').upload_data('1234567890', chunk_size=4, compression=1,
+                                         read_ahead=read_ahead, upload_callback=upload_callback)
+
+            patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+            assert all(r.headers['Content-Encoding'] == 'gzip' for r in patches)
+            assert [(int(r.headers['Offset']), gzip.decompress(r.body)) for r in patches] == [
+                (0, b'1234'), (4, b'5678'), (8, b'90')]
+        assert upload_callback.call_args_list[-1][0][0] == 100.0
+
+    @pytest.mark.parametrize('data', [b'1234567890', bytearray(b'1234567890'),
+                                      memoryview(b'1234567890')])
+    def test_upload_data_bytes(self, mock_bar_request, data):
+        reqmock = mock_bar_request
+        Bar(id='abc123').upload_data(data, chunk_size=4)
+
+        assert reqmock.request_history[0].headers['Entity-Length'] == '10'
+        patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+        assert [(r.headers['Offset'], r.headers['Content-Length'], bytes(r.body))
+                for r in patches] == [('0', '4', b'1234'), ('4', '4', b'5678'), ('8', '2', b'90')]
+
+    def test_upload_data_memory_map(self, mock_bar_request, tmp_path):
+        reqmock = mock_bar_request
+        path = tmp_path / 'data.csv'
+        path.write_bytes(b'1234567890')
+        reqmock.head('https://api/bars/abc123/data', headers={'Offset': '4'})
+
+        with open(str(path), 'rb') as f:
+            Bar(id='abc123').upload_data(f, chunk_size=4, memory_map=True)
+            assert reqmock.request_history[0].headers['Entity-Length'] == '10'
+            patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+            assert [bytes(r.body) for r in patches] == [b'1234', b'5678', b'90']
+
+            reqmock.reset_mock()
+            Bar(id='abc123').upload_data(f, chunk_size=4, memory_map=True, resume=True)
+            patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+            assert [(r.headers['Offset'], bytes(r.body)) for r in patches] == [
+                ('4', b'5678'), ('8', b'90')]
+
+    @pytest.mark.parametrize('data', ['x' * 30, b'x' * 30])
+    def test_upload_data_adaptive_chunk_size(self, mock_bar_request, data):
+        reqmock = mock_bar_request
+        sizer = uploads.ChunkSizer(initial=2, minimum=2, maximum=8, target_seconds=60)
+
+        # Without read-ahead, each size applies to the very next chunk
+        Bar(id='abc123').upload_data(data, chunk_size=sizer, read_ahead=0)
+
+        patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+        assert [(int(r.headers['Offset']), int(r.headers['Content-Length'])) for r in patches] == [
+            (0, 2), (2, 4), (6, 8), (14, 8), (22, 8)]
+        assert sizer.stats()['sizes'] == [2, 4, 8, 8, 8]
+
+    @pytest.mark.parametrize('read_ahead', [0, 1, 3])
+    def test_upload_data_iterable(self, mock_bar_request, read_ahead):
+        reqmock = mock_bar_request
+
+        def rows():
+            yield 'a,b\n'
+            for i in range(5):
+                yield '{},{}\n'.format(i, i * 2).encode()
+
+        Bar(id='abc123').upload_data(rows(), chunk_size=6, read_ahead=read_ahead)
+
+        assert 'Entity-Length' not in reqmock.request_history[0].headers
+        patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+        assert [(int(r.headers['Offset']), r.body) for r in patches] == [
+            (0, b'a,b\n0,'), (6, b'0\n1,2\n'), (12, b'2,4\n3,'), (18, b'6\n4,8\n')]
+        assert reqmock.request_history[-2].url.endswith('/data/commit')
+
+    def test_upload_data_iterable_error(self, mock_bar_request):
+        reqmock = mock_bar_request
+
+        def rows():
+            yield 'a,b\n'
+            raise ValueError('bad row')
+
+        with pytest.raises(ValueError):
+            Bar(id='abc123').upload_data(rows(), chunk_size=2)
+        assert not any(r.url.endswith('/commit') for r in reqmock.request_history)
+
+    def test_upload_data_iterable_resume(self, mock_bar_request):
+        reqmock = mock_bar_request
+        reqmock.head('https://api/bars/abc123/data', headers={'Offset': '4'})
+
+        Bar(id='abc123').upload_data(iter(['12', '345', '678']), chunk_size=4, resume=True)
+        patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+        assert [(r.headers['Offset'], r.body) for r in patches] == [('4', b'5678')]
+
+    def test_upload_data_read_ahead_error(self, reqmock):
+        # A strict tus server rejects every chunk after one that failed
+        def patch(request, context):
+            context.status_code = 500 if request.headers['Offset'] == '0' else 409
+            return ''
+
+        reqmock.post('https://api/bars/abc123/data', status_code=201)
+        reqmock.patch('https://api/bars/abc123/data', text=patch)
+        errors = []
+
+        def upload():
+            try:
+                Bar(id='abc123').upload_data('123456', chunk_size=2, read_ahead=4)
+            except ServerError as e:
+                errors.append(e)
+        thread = threading.Thread(target=upload, daemon=True)
+        thread.start()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert len(errors) == 1
+        # No further chunks are sent after the failed one
+        assert [r.method for r in reqmock.request_history] == ['POST', 'PATCH']
+
+    def test_upload_data_resume(self, mock_bar_request):
+        reqmock = mock_bar_request
+        reqmock.head('https://api/bars/abc123/data', headers={'Offset': '6'})
+        upload_callback = mock.Mock()
+
+        Bar(id='abc123').upload_data('1234567890', chunk_size=3, resume=True,
+                                     upload_callback=upload_callback)
+
+        assert [r.method for r in reqmock.request_history] == ['HEAD', 'PATCH', 'PATCH', 'POST', 'GET']
+        assert [(r.headers['Offset'], r.text) for r in reqmock.request_history[1:3]] == [
+            ('6', '789'), ('9', '0')]
+        assert [c[0][0] for c in upload_callback.call_args_list] == [60.0, 90.0, 100.0]
+
+    def test_upload_data_resume_stream(self, mock_bar_request):
+        reqmock = mock_bar_request
+        reqmock.head('https://api/bars/abc123/data', headers={'Offset': '6'})
+        stream = SequentialStreamWrapper(StringIO('1234567890'))
+        reads = []
+        read = stream.read
+        stream.read = lambda size=None: reads.append(size) or read(size)
+
+        Bar(id='abc123').upload_data(stream, chunk_size=3, resume=True)
+
+        # The bytes already sent are skipped without reading them at once
+        assert max(reads) == 3
+        patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+        assert [(r.headers['Offset'], r.text) for r in patches] == [('6', '789'), ('9', '0')]
+
+    def test_upload_data_resume_same_length(self, mock_bar_request):
+        reqmock = mock_bar_request
+        reqmock.head('https://api/bars/abc123/data', headers={'Offset': '6', 'Entity-Length': '10'})
+
+        Bar(id='abc123').upload_data('1234567890', chunk_size=4, resume=True)
+        assert [r.method for r in reqmock.request_history] == ['HEAD', 'PATCH', 'POST', 'GET']
+        assert reqmock.request_history[1].headers['Offset'] == '6'
+
+    def test_upload_data_resume_other_length(self, mock_bar_request):
+        reqmock = mock_bar_request
+        reqmock.head('https://api/bars/abc123/data', headers={'Offset': '6', 'Entity-Length': '20'})
+
+        Bar(id='abc123').upload_data('1234567890', chunk_size=4, resume=True)
+        assert [r.method for r in reqmock.request_history][:3] == ['HEAD', 'POST', 'PATCH']
+        assert reqmock.request_history[1].headers['Entity-Length'] == '10'
+        patches = [r for r in reqmock.request_history if r.method == 'PATCH']
+        assert [r.headers['Offset'] for r in patches] == ['0', '4', '8']
+
+    def test_upload_data_resume_without_session(self, mock_bar_request):
+        reqmock = mock_bar_request
+        reqmock.head('https://api/bars/abc123/data', status_code=404)
+
+        Bar(id='abc123').upload_data('data', resume=True)
+        assert [r.method for r in reqmock.request_history] == ['HEAD', 'POST', 'PATCH', 'POST', 'GET']
+        assert reqmock.request_history[2].headers['Offset'] == '0'
+
+    def test_upload_data_progress_file(self, reqmock, tmp_path):
+        progress_file = str(tmp_path / 'progress.json')
+        reqmock.post('https://api/bars/abc123/data', status_code=201)
+        reqmock.head('https://api/bars/abc123/data', headers={'Offset': '4'})
+        reqmock.patch('https://api/bars/abc123/data', [
+            {'status_code': 204}, {'status_code': 204}, {'status_code': 500},
+            {'status_code': 204}])
+        reqmock.post('https://api/bars/abc123/data/commit', status_code=204)
+        reqmock.get('https://api/bars/abc123/data/status', status_code=200,
+                    text='{"status": "Processing Successful"}')
+
+        # Fails after two chunks, with the acknowledged offset recorded
+        with pytest.raises(ServerError):
+            Bar(id='abc123').upload_data('123456', chunk_size=2,
+                                         progress_file=progress_file)
+        record = uploads.UploadProgress(progress_file).load()
+        assert record == {'url': 'https://api/bars/abc123/data', 'length': 6,
+                          'offset': 4}
+
+        # A second attempt resumes from the server's offset
+        reqmock.reset_mock()
+        Bar(id='abc123').upload_data('123456', chunk_size=2,
+                                     progress_file=progress_file)
+        assert [r.method for r in reqmock.request_history] == ['HEAD', 'PATCH', 'POST', 'GET']
+        assert reqmock.request_history[1].text == '56'
+        assert not os.path.exists(progress_file)
+
+    def test_upload_data_progress_file_other_upload(self, mock_bar_request, tmp_path):
+        reqmock = mock_bar_request
+        progress = uploads.UploadProgress(str(tmp_path / 'progress.json'))
+        progress.save('https://api/bars/abc123/data', 10, 4)
+
+        Bar(id='abc123').upload_data('data', progress_file=progress.file_path)
+        assert reqmock.request_history[0].method == 'POST'
+
     def test_delete_data(self, reqmock):
         reqmock.delete('https://api/bars/abc123/data', status_code=201)
         Bar(id='abc123').delete_data()
         assert reqmock.call_count == 1
 
 
+@pytest.fixture
+def compact_resources():
+    analyzere.compact_resources = True
+    yield
+    analyzere.compact_resources = False
+
+
+class TestCompactResources(SetBaseUrl):
+    rows = [{'probability': 0.01, 'mean': 1.5, '_type': 'Row', 'context': {'currency': 'USD'}},
+            {'probability': 0.02, 'mean': 2.5, '_type': 'Row', 'context': {'currency': 'EUR'}}]
+
+    def test_shared_class(self, compact_resources):
+        a, b = convert_to_analyzere_object(self.rows)
+        assert isinstance(a, CompactResource)
+        assert isinstance(a, EmbeddedResource)
+        assert type(a) is type(b)
+        assert type(a.context) is type(b.context)
+        assert a.probability == 0.01
+        assert a.type == 'Row'
+        assert b['mean'] == 2.5
+        assert a['missing'] is None
+        with pytest.raises(AttributeError):
+            a.missing
+
+    def test_same_as_embedded_resource(self, compact_resources):
+        compact = convert_to_analyzere_object(self.rows[0])
+        analyzere.compact_resources = False
+        plain = convert_to_analyzere_object(self.rows[0])
+        assert type(plain) is EmbeddedResource
+
+        assert compact == plain
+        assert plain == compact
+        assert not compact != plain
+        assert compact.to_dict() == plain.to_dict() == self.rows[0]
+        assert str(compact) == str(plain)
+        assert compact != convert_to_analyzere_object(self.rows[1])
+
+    def test_attributes_not_in_slots(self, compact_resources):
+        a, b = convert_to_analyzere_object(self.rows)
+        a.note = 'x'
+        assert a.note == 'x'
+        assert a.to_dict()['note'] == 'x'
+        assert not hasattr(b, 'note')
+        del a.note
+        del a.mean
+        assert a.to_dict() == {'probability': 0.01, '_type': 'Row', 'context': {'currency': 'USD'}}
+
+        a.update(b)
+        assert a == b
+        a.clear()
+        assert a.to_dict() == {}
+
+    def test_copy_and_pickle(self, compact_resources):
+        a = convert_to_analyzere_object(self.rows[0])
+        assert pickle.loads(pickle.dumps(a)) == a
+        assert copy.deepcopy(a) == a
+        assert copy.copy(a).context is a.context
+
+    def test_fallback(self, compact_resources):
+        # Names that can't be slots, or would shadow methods
+        for value in ({'1st': 1}, {'to_dict': 1}, {'_private': 1}):
+            obj = convert_to_analyzere_object(value)
+            assert type(obj) is EmbeddedResource
+            assert obj.__dict__ == value
+
+    def test_save(self, compact_resources, reqmock):
+        reqmock.post('https://api/layers/',
+                     text='{"id": "abc", "description": "x", "meta": {"a": 1}}')
+        layer = Layer(description='x').save()
+        assert layer.id == 'abc'
+        assert layer.description == 'x'
+        assert isinstance(layer.meta, CompactResource)
+        assert layer.meta.a == 1
+
+    def test_resources_not_compacted(self, compact_resources):
+        obj = convert_to_analyzere_object({'id': 'abc', 'meta': {'x': 1}}, Layer)
+        assert type(obj) is Layer
+        assert isinstance(obj.meta, CompactResource)
+
+
 class FooView(MetricsResource):
     pass
 
@@ -812,6 +1219,27 @@ class TestMetricsResource(SetBaseUrl):
         f = FooView(id='abc123')
         assert f.download_yelt() == b'yelt-data'
 
+    def test_download_ylt_to_file(self, reqmock):
+        reqmock.get('https://api/foo_views/abc123/ylt?currency=USD',
+                    status_code=200, text='ylt-data')
+        f = FooView(id='abc123')
+        file_obj = BytesIO()
+        assert f.download_ylt(file_or_path=file_obj, currency='USD') == 8
+        assert file_obj.getvalue() == b'ylt-data'
+        assert reqmock.last_request.qs == {'currency': ['usd']}
+
+    def test_iter_yelt(self, reqmock):
+        reqmock.get('https://api/foo_views/abc123/yelt', status_code=200,
+                    text='Trial,Event\n1,2\n2,3\n')
+        f = FooView(id='abc123')
+        assert list(f.iter_yelt(lines=True)) == [b'Trial,Event', b'1,2', b'2,3']
+
+    def test_iter_ylt(self, reqmock):
+        reqmock.get('https://api/foo_views/abc123/ylt', status_code=200,
+                    text='ylt-data')
+        f = FooView(id='abc123')
+        assert list(f.iter_ylt(chunk_size=4)) == [b'ylt-', b'data']
+
     def test_download_yelt_auto_retry_true(self, reqmock):
         responses = [
             {'status_code': 503, 'headers': {'Retry-After': '0.01'}},
@@ -852,9 +1280,124 @@ class TestMetricsResource(SetBaseUrl):
         response = f.back_allocation("321cba")
         assert response == "response_object"
 
+    def _echo_vector(self, request, context):
+        # One result per value of the path's vector, echoing the value
+        values = request.path.rsplit('/', 1)[1].split(',')
+        return json.dumps([{'value': v} for v in values])
+
+    @pytest.fixture
+    def max_url_length(self):
+        analyzere.max_url_length = 100
+        yield
+        analyzere.max_url_length = 2000
+
+    def test_long_vector_split(self, reqmock, max_url_length):
+        reqmock.get(re.compile('https://api/foo_views/abc123/tail_metrics/'),
+                    text=self._echo_vector)
+        probabilities = [round(0.001 * i, 3) for i in range(1, 41)]
+        tm = FooView(id='abc123').tail_metrics(probabilities, perspective='NetLoss')
+
+        assert [float(m.value) for m in tm] == probabilities
+        assert reqmock.call_count > 1
+        assert all(len(r.url) <= 100 for r in reqmock.request_history)
+        assert all(r.qs == {'perspective': ['netloss']} for r in reqmock.request_history)
+
+    def test_long_window_vector_split(self, reqmock, max_url_length):
+        reqmock.get(re.compile('https://api/foo_views/abc123/window_metrics/'),
+                    text=self._echo_vector)
+        windows = [(0.0, round(0.01 * i, 2)) for i in range(1, 21)]
+        wm = FooView(id='abc123').window_metrics(windows)
+        assert [m.value for m in wm] == ['{}_{}'.format(*w) for w in windows]
+        assert reqmock.call_count > 1
+
+    def test_short_vector_not_split(self, reqmock, max_url_length):
+        reqmock.get('https://api/foo_views/abc123/tvar/0.1,0.2',
+                    text='[{"num": 1}, {"num": 2}]')
+        assert [m.num for m in FooView(id='abc123').tvar([0.1, 0.2])] == [1, 2]
+        assert reqmock.call_count == 1
+
+    def test_split_vector_unexpected_response(self, reqmock, max_url_length):
+        reqmock.get(re.compile('https://api/foo_views/abc123/tail_metrics/'),
+                    text='{"num": 1}')
+        with pytest.raises(ServerError):
+            FooView(id='abc123').tail_metrics([0.001 * i for i in range(1, 41)])
+
+    def test_split_vector_cached(self, reqmock, max_url_length):
+        reqmock.get(re.compile('https://api/foo_views/abc123/tail_metrics/'),
+                    text=self._echo_vector)
+        analyzere.metrics_cache = MemoryMetricsCache()
+        try:
+            f = FooView(id='abc123')
+            f.tail_metrics([0.001 * i for i in range(1, 21)])
+            calls = reqmock.call_count
+            tm = f.tail_metrics([0.001 * i for i in range(1, 41)])
+        finally:
+            analyzere.metrics_cache = None
+        assert len(tm) == 40
+        # Only the 20 new probabilities were requested
+        requested = sum(len(r.path.rsplit('/', 1)[1].split(','))
+                        for r in reqmock.request_history[calls:])
+        assert requested == 20
+
     # TODO: Add tests for id: None
 
 
+class TestBatchMetrics(SetBaseUrl):
+    def test_results_in_input_order(self, reqmock):
+        for i in range(5):
+            reqmock.get('https://api/foo_views/v{}/tail_metrics/0.5,1.0'.format(i),
+                        status_code=200, text='[{{"num": {}}}]'.format(i))
+        views = [FooView(id='v{}'.format(i)) for i in range(5)]
+
+        results = batch_metrics(views, 'tail_metrics', [0.5, 1.0], max_workers=3)
+        assert [r[0].num for r in results] == [0, 1, 2, 3, 4]
+        assert reqmock.call_count == 5
+
+    def test_params_and_callable_metric(self, reqmock):
+        reqmock.get('https://api/foo_views/v1/el?perspective=NetLoss',
+                    status_code=200, text='1.5')
+        results = batch_metrics([FooView(id='v1')], MetricsResource.el,
+                                perspective='NetLoss')
+        assert results == [1.5]
+
+    def test_per_item_errors(self, reqmock):
+        reqmock.get('https://api/foo_views/v1/el', status_code=200, text='1.0')
+        reqmock.get('https://api/foo_views/v2/el', status_code=400)
+        reqmock.get('https://api/foo_views/v3/el', status_code=200, text='3.0')
+        views = [FooView(id='v{}'.format(i)) for i in (1, 2, 3)]
+
+        results = batch_metrics(views, 'el')
+        assert results[0] == 1.0
+        assert isinstance(results[1], InvalidRequestError)
+        assert results[2] == 3.0
+
+    def test_retry_after_rescheduled(self, reqmock):
+        reqmock.get('https://api/foo_views/v1/el', status_code=200, text='1.0')
+        reqmock.get('https://api/foo_views/v2/el', [
+            {'status_code': 503, 'headers': {'Retry-After': '0.05'}},
+            {'status_code': 200, 'text': '2.0'},
+        ])
+        reqmock.get('https://api/foo_views/v3/el', status_code=200, text='3.0')
+        views = [FooView(id='v{}'.format(i)) for i in (1, 2, 3)]
+
+        with mock.patch('time.sleep') as sleep:
+            results = batch_metrics(views, 'el', max_workers=1)
+
+        assert results == [1.0, 2.0, 3.0]
+        # v3 was requested while v2 waited out its Retry-After
+        assert [r.path for r in reqmock.request_history] == [
+            '/foo_views/v1/el', '/foo_views/v2/el', '/foo_views/v3/el', '/foo_views/v2/el']
+        assert all(0 <= c[0][0] <= 0.05 for c in sleep.call_args_list)
+
+    def test_no_auto_retry(self, reqmock):
+        reqmock.get('https://api/foo_views/v1/el', status_code=503,
+                    headers={'Retry-After': '1.0'})
+        results = batch_metrics([FooView(id='v1')], 'el', auto_retry=False)
+        assert isinstance(results[0], RetryAfter)
+        assert results[0].retry_after == 1.0
+        assert reqmock.call_count == 1
+
+
 class TestOptimizationResource(SetBaseUrl):
     def test_retrieve(self, reqmock):
         reqmock.get('https://api/optimization_views/abc123',
@@ -884,6 +1427,20 @@ class TestOptimizationResource(SetBaseUrl):
         assert type(r[0]) == Candidate
         assert r[0].foo == 'bar'
 
+    def test_iter_candidates(self, reqmock):
+        def page(request, context):
+            offset = int(request.qs['offset'][0])
+            items = [{'index': i} for i in range(offset, min(offset + 2, 3))]
+            return json.dumps({'items': items,
+                               'meta': {'limit': 2, 'offset': offset, 'total_count': 3}})
+        reqmock.get('https://api/optimization_views/abc123/candidates', text=page)
+
+        candidates = list(OptimizationView(id='abc123').iter_candidates(limit=2))
+        assert [c.index for c in candidates] == [0, 1, 2]
+        assert all(type(c) == Candidate for c in candidates)
+        assert candidates[0].optimization_view_id == 'abc123'
+        assert reqmock.call_count == 2
+
     def test_candidate_parameters(self, reqmock):
         candidate_parameters_response = ('{'
                                          ' "items": [{"foo": "bar"}],'
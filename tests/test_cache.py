@@ -0,0 +1,258 @@
+import mock
+import pytest
+
+import analyzere
+from analyzere import InvalidRequestError, Layer, LayerView, LossSet
+from analyzere.base_resources import Reference, resolve_references
+from analyzere.cache import (
+    DiskMetricsCache,
+    MemoryMetricsCache,
+    ResourceCache,
+    metrics_key,
+)
+
+
+class TestResourceCache:
+    def test_get_set(self):
+        cache = ResourceCache()
+        layer = Layer(id='abc123')
+        assert cache.get(Layer, 'abc123') is None
+        cache.set(layer)
+        assert cache.get(Layer, 'abc123') is layer
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_class_mismatch(self):
+        cache = ResourceCache()
+        cache.set(Layer(id='abc123'))
+
+        class SpecialLayer(Layer):
+            pass
+        assert cache.get(SpecialLayer, 'abc123') is None
+
+    def test_without_id_not_cached(self):
+        cache = ResourceCache()
+        cache.set(Layer())
+        assert len(cache) == 0
+
+    def test_lru_eviction(self):
+        cache = ResourceCache(maxsize=2)
+        a, b, c = Layer(id='a'), Layer(id='b'), Layer(id='c')
+        cache.set(a)
+        cache.set(b)
+        cache.get(Layer, 'a')
+        cache.set(c)
+        assert len(cache) == 2
+        assert cache.get(Layer, 'b') is None
+        assert cache.get(Layer, 'a') is a
+        assert cache.get(Layer, 'c') is c
+
+    def test_ttls(self):
+        cache = ResourceCache(ttl=10, ttls={LossSet: 100, 'layer_views': None})
+        with mock.patch('time.monotonic', return_value=0):
+            cache.set(Layer(id='a'))
+            cache.set(LossSet(id='b'))
+            cache.set(analyzere.LayerView(id='c'))
+        with mock.patch('time.monotonic', return_value=50):
+            assert cache.get(Layer, 'a') is None
+            assert cache.get(LossSet, 'b') is not None
+        with mock.patch('time.monotonic', return_value=10 ** 9):
+            assert cache.get(LossSet, 'b') is None
+            assert cache.get(analyzere.LayerView, 'c') is not None
+
+    def test_invalidate(self):
+        cache = ResourceCache()
+        cache.set(Layer(id='a'))
+        cache.set(Layer(id='b'))
+        cache.set(LossSet(id='a'))
+        cache.invalidate(Layer, 'a')
+        assert cache.get(Layer, 'a') is None
+        assert cache.get(Layer, 'b') is not None
+        cache.invalidate('layers')
+        assert cache.get(Layer, 'b') is None
+        assert cache.get(LossSet, 'a') is not None
+        cache.clear()
+        assert len(cache) == 0
+
+
+class TestIdentityMap:
+    @pytest.fixture(autouse=True)
+    def cache(self):
+        analyzere.base_url = 'https://api'
+        analyzere.resource_cache = ResourceCache()
+        yield analyzere.resource_cache
+        analyzere.resource_cache = None
+        analyzere.base_url = ''
+
+    def test_retrieve(self, reqmock):
+        reqmock.get('https://api/layers/abc123', status_code=200,
+                    text='{"id": "abc123", "foo": "bar"}')
+        a = Layer.retrieve('abc123')
+        b = Layer.retrieve('abc123')
+        assert a is b
+        assert reqmock.call_count == 1
+
+    def test_references_share_instance(self, reqmock):
+        reqmock.get('https://api/loss_sets/ls1', status_code=200,
+                    text='{"id": "ls1", "foo": "bar"}')
+        r1 = Reference('https://api/loss_sets/ls1')
+        r2 = Reference('https://api/loss_sets/ls1')
+        assert r1.foo == r2.foo == 'bar'
+        assert r1.__wrapped__ is r2.__wrapped__
+        assert r1.__wrapped__ is LossSet.retrieve('ls1')
+        assert reqmock.call_count == 1
+
+    def test_resolve_references_shares_duplicates(self, reqmock):
+        reqmock.get('https://api/loss_sets/ls1', status_code=200, text='{"id": "ls1"}')
+        refs = [Reference('https://api/loss_sets/ls1') for _ in range(3)]
+        resolve_references(refs)
+        assert refs[0].__wrapped__ is refs[2].__wrapped__
+        assert reqmock.call_count == 1
+
+    def test_save_refreshes_entry(self, reqmock, cache):
+        reqmock.get('https://api/layers/abc123', status_code=200,
+                    text='{"id": "abc123", "foo": "bar"}')
+        reqmock.put('https://api/layers/abc123', status_code=200,
+                    text='{"id": "abc123", "foo": "baz"}')
+        cached = Layer.retrieve('abc123')
+        updated = Layer(id='abc123', foo='baz')
+        updated.save()
+        assert Layer.retrieve('abc123') is updated
+        assert cached.foo == 'bar'
+        assert reqmock.call_count == 2
+
+    def test_save_new_cached(self, reqmock, cache):
+        reqmock.post('https://api/layers/', status_code=200,
+                     text='{"id": "abc123"}')
+        layer = Layer().save()
+        assert Layer.retrieve('abc123') is layer
+        assert reqmock.call_count == 1
+
+    def test_reload_refetches(self, reqmock):
+        reqmock.get('https://api/layers/abc123', [
+            {'status_code': 200, 'text': '{"id": "abc123", "foo": "bar"}'},
+            {'status_code': 200, 'text': '{"id": "abc123", "foo": "baz"}'},
+        ])
+        layer = Layer.retrieve('abc123')
+        layer.reload()
+        assert layer.foo == 'baz'
+        assert reqmock.call_count == 2
+        assert Layer.retrieve('abc123') is layer
+
+
+class TestMetricsCaches:
+    def test_metrics_key(self):
+        assert metrics_key('https://api', 'a', {'x': 1, 'y': 2}) == \
+            metrics_key('https://api', 'a', {'y': 2, 'x': 1})
+        assert metrics_key('https://api', 'a') == metrics_key('https://api', 'a', {})
+        assert metrics_key('https://api', 'a') != metrics_key('https://other', 'a')
+
+    def test_memory(self):
+        cache = MemoryMetricsCache(maxsize=2)
+        assert cache.get('a') is None
+        cache.set('a', [1])
+        cache.set('b', 0.0)
+        assert cache.get('a') == [1]
+        cache.set('c', 3)
+        assert cache.get('b', 'missing') == 'missing'
+        assert len(cache) == 2
+        assert (cache.hits, cache.misses) == (1, 2)
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_disk(self, tmp_path):
+        cache = DiskMetricsCache(str(tmp_path / 'metrics'))
+        cache.set('a', [{'num': 1.0}])
+        assert cache.get('a') == [{'num': 1.0}]
+        assert cache.get('b') is None
+        assert len(cache) == 1
+
+        # Shared between instances
+        other = DiskMetricsCache(str(tmp_path / 'metrics'))
+        assert other.get('a') == [{'num': 1.0}]
+        assert (cache.hits, cache.misses) == (1, 1)
+        other.clear()
+        assert cache.get('a') is None
+
+
+class TestMetricsResultCache:
+    @pytest.fixture(autouse=True, params=['memory', 'disk'])
+    def cache(self, request, tmp_path):
+        analyzere.base_url = 'https://api'
+        if request.param == 'memory':
+            analyzere.metrics_cache = MemoryMetricsCache()
+        else:
+            analyzere.metrics_cache = DiskMetricsCache(str(tmp_path))
+        yield analyzere.metrics_cache
+        analyzere.metrics_cache = None
+        analyzere.base_url = ''
+
+    def test_tail_metrics(self, reqmock, cache):
+        reqmock.get('https://api/layer_views/abc123/tail_metrics/0.5,1.0',
+                    status_code=200, text='[{"num": 1.0}, {"num": 2.0}]')
+        lv = LayerView(id='abc123')
+        first = lv.tail_metrics([0.5, 1.0])
+        second = lv.tail_metrics([0.5, 1.0])
+        assert [m.num for m in second] == [1.0, 2.0]
+        assert first is not second
+        assert reqmock.call_count == 1
+        # Counted per probability
+        assert (cache.hits, cache.misses) == (2, 2)
+
+    def test_partial_fetch(self, reqmock):
+        reqmock.get('https://api/layer_views/abc123/tail_metrics/0.01,0.004,0.002',
+                    status_code=200, text='[{"p": 0.01}, {"p": 0.004}, {"p": 0.002}]')
+        reqmock.get('https://api/layer_views/abc123/tail_metrics/0.001',
+                    status_code=200, text='{"p": 0.001}')
+        lv = LayerView(id='abc123')
+        lv.tail_metrics([0.01, 0.004, 0.002])
+
+        merged = lv.tail_metrics([0.001, 0.01, 0.001])
+        assert [m.p for m in merged] == [0.001, 0.01, 0.001]
+        assert lv.tail_metrics(0.004).p == 0.004
+        assert [m.p for m in lv.tail_metrics([0.002])] == [0.002]
+        assert [r.path.rsplit('/', 1)[1] for r in reqmock.request_history] == [
+            '0.01,0.004,0.002', '0.001']
+
+    def test_windows_cached_per_window(self, reqmock):
+        reqmock.get('https://api/layer_views/abc123/window_metrics/0.0_0.5,0.0_1.0',
+                    status_code=200, text='[{"num": 1}, {"num": 2}]')
+        lv = LayerView(id='abc123')
+        lv.window_metrics([(0.0, 0.5), (0.0, 1.0)])
+        assert lv.window_metrics((0.0, 1.0)).num == 2
+        assert reqmock.call_count == 1
+
+    def test_unmergeable_response_not_cached(self, reqmock):
+        reqmock.get('https://api/layer_views/abc123/exceedance_probabilities/1,2',
+                    status_code=200, text='{"curve": [0.5, 0.1]}')
+        lv = LayerView(id='abc123')
+        assert lv.ep([1, 2]).curve == [0.5, 0.1]
+        assert lv.ep([1, 2]).curve == [0.5, 0.1]
+        assert reqmock.call_count == 2
+
+    def test_keyed_on_params(self, reqmock):
+        reqmock.get('https://api/layer_views/abc123/el', status_code=200, text='0.0')
+        lv = LayerView(id='abc123')
+        assert lv.el() == 0.0
+        assert lv.el() == 0.0
+        lv.el(perspective='NetLoss')
+        assert lv.el(perspective='NetLoss') == 0.0
+        assert reqmock.call_count == 2
+
+    def test_back_allocation(self, reqmock):
+        reqmock.get('https://api/layer_views/abc123/back_allocations', status_code=200,
+                    text='{"value": 1}')
+        lv = LayerView(id='abc123')
+        assert lv.back_allocation('s1').value == 1
+        assert lv.back_allocation('s1').value == 1
+        lv.back_allocation('s2')
+        assert reqmock.call_count == 2
+
+    def test_errors_not_cached(self, reqmock):
+        reqmock.get('https://api/layer_views/abc123/el', [
+            {'status_code': 400},
+            {'status_code': 200, 'text': '1.0'},
+        ])
+        lv = LayerView(id='abc123')
+        with pytest.raises(InvalidRequestError):
+            lv.el()
+        assert lv.el() == 1.0
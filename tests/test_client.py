@@ -0,0 +1,125 @@
+import pytest
+
+import analyzere
+from analyzere import Client, LayerView, LossSet, Portfolio
+from analyzere.base_resources import Reference
+from analyzere.cache import ResourceCache
+
+
+@pytest.fixture
+def clients():
+    a = Client('https://a/', bearer_auth_token='token-a')
+    b = Client('https://b/', username='user', password='pass')
+    yield a, b
+    a.close()
+    b.close()
+
+
+class TestClient:
+    def test_settings_default_to_module_config(self):
+        client = Client('https://a/')
+        assert client.user_agent == analyzere.user_agent
+        assert client.connection_pool_maxsize == analyzere.connection_pool_maxsize
+        assert client.tls_verify is True
+        assert client.username == ''
+        assert Client('https://a/', tls_verify=False).tls_verify is False
+
+    def test_bind(self, clients):
+        a, b = clients
+        assert a.LayerView is a.bind(LayerView)
+        assert issubclass(a.LayerView, LayerView)
+        assert a.LayerView._client is a
+        assert a.LayerView._get_path('x') == 'layer_views/x'
+        # Rebinding a bound class binds the original
+        assert b.bind(a.LayerView) is b.LayerView
+        assert LayerView._client is None
+
+    def test_unknown_attribute(self, clients):
+        with pytest.raises(AttributeError):
+            clients[0].Foo
+
+    def test_requests_use_client_config(self, clients, reqmock):
+        a, b = clients
+        reqmock.get('https://a/layer_views/abc123', text='{"id": "abc123"}')
+        reqmock.get('https://b/layer_views/abc123', text='{"id": "abc123"}')
+
+        lv_a = a.LayerView.retrieve('abc123')
+        lv_b = b.LayerView.retrieve('abc123')
+
+        assert isinstance(lv_a, LayerView)
+        assert lv_a._client is a
+        assert lv_b._client is b
+        assert reqmock.request_history[0].headers['Authorization'] == 'Bearer token-a'
+        assert reqmock.request_history[1].headers['Authorization'].startswith('Basic ')
+        assert a.session is not b.session
+        assert analyzere.requestor.session not in (a.session, b.session)
+
+    def test_instance_methods(self, clients, reqmock):
+        a, _ = clients
+        reqmock.get('https://a/layer_views/abc123/el', text='1.5')
+        reqmock.post('https://a/loss_sets/', text='{"id": "ls1"}')
+
+        assert a.LayerView(id='abc123').el() == 1.5
+        loss_set = a.LossSet(foo='bar').save()
+        assert loss_set.id == 'ls1'
+        assert loss_set.reference()._href == 'https://a/loss_sets/ls1'
+
+    def test_references_resolve_through_client(self, clients, reqmock):
+        a, _ = clients
+        reqmock.get('https://a/portfolios/p1',
+                    text='{"id": "p1", "layers": [{"href": "https://a/layers/l1"}]}')
+        reqmock.get('https://a/layers/l1', text='{"id": "l1", "premium": 1}')
+
+        portfolio = a.Portfolio.retrieve('p1')
+        layer = portfolio.layers[0]
+        assert isinstance(layer, Reference)
+        assert layer._client is a
+        assert layer.premium == 1
+        assert layer.__wrapped__._client is a
+        assert reqmock.request_history[1].headers['Authorization'] == 'Bearer token-a'
+
+    def test_upload_data(self, clients, reqmock):
+        a, _ = clients
+        reqmock.post('https://a/loss_sets/abc123/data', status_code=201)
+        reqmock.patch('https://a/loss_sets/abc123/data', status_code=204)
+        reqmock.post('https://a/loss_sets/abc123/data/commit', status_code=204)
+        reqmock.get('https://a/loss_sets/abc123/data/status',
+                    text='{"status": "Processing Successful"}')
+
+        a.LossSet(id='abc123').upload_data('data', read_ahead=2)
+        assert all(r.headers['Authorization'] == 'Bearer token-a'
+                   for r in reqmock.request_history)
+
+    def test_cache_keyed_by_client(self, clients, reqmock):
+        a, b = clients
+        reqmock.get('https://a/loss_sets/ls1', text='{"id": "ls1", "tenant": "a"}')
+        reqmock.get('https://b/loss_sets/ls1', text='{"id": "ls1", "tenant": "b"}')
+        analyzere.resource_cache = ResourceCache()
+        try:
+            assert a.LossSet.retrieve('ls1').tenant == 'a'
+            assert b.LossSet.retrieve('ls1').tenant == 'b'
+            assert a.LossSet.retrieve('ls1').tenant == 'a'
+            assert len(analyzere.resource_cache) == 2
+
+            analyzere.resource_cache.invalidate(a.LossSet)
+            assert len(analyzere.resource_cache) == 1
+            analyzere.resource_cache.invalidate(LossSet._get_collection_name())
+            assert len(analyzere.resource_cache) == 0
+        finally:
+            analyzere.resource_cache = None
+        assert reqmock.call_count == 2
+
+    def test_request(self, clients, reqmock):
+        a, _ = clients
+        reqmock.get('https://a/foo', text='{"bar": 1}')
+        assert a.request('get', 'foo') == {'bar': 1}
+        assert a.request_raw('get', 'foo').status_code == 200
+
+    def test_close(self, clients, reqmock):
+        a, _ = clients
+        reqmock.get('https://a/portfolios/p1', text='{"id": "p1"}')
+        assert isinstance(a.Portfolio.retrieve('p1'), Portfolio)
+        assert a.session is not None
+        a.close()
+        assert a.session is None
+        assert a.pool_stats() == []
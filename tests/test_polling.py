@@ -0,0 +1,217 @@
+from concurrent.futures import Future, TimeoutError, wait
+import threading
+import time
+
+import mock
+import pytest
+
+import analyzere
+from analyzere import InvalidRequestError, LayerView, LossSet, OptimizationView
+from analyzere.errors import RetryAfter
+from analyzere.polling import Scheduler, poll, submit_retrying
+
+
+@pytest.fixture
+def scheduler():
+    s = Scheduler(max_workers=2)
+    yield s
+    s.shutdown()
+
+
+def flaky(results, retries, retry_after=0.01):
+    """Returns a function raising RetryAfter ``retries`` times, then returning 'ok'."""
+    calls = []
+
+    def fn():
+        calls.append(time.monotonic())
+        if len(calls) <= retries:
+            raise RetryAfter('busy', retry_after=retry_after)
+        results.append(len(calls))
+        return 'ok'
+    fn.calls = calls
+    return fn
+
+
+class TestScheduler:
+    def test_call_order(self, scheduler):
+        done = threading.Event()
+        calls = []
+        scheduler.call_later(0.05, lambda: (calls.append('late'), done.set()))
+        scheduler.call_soon(calls.append, 'soon')
+        assert done.wait(1)
+        assert calls == ['soon', 'late']
+        assert len(scheduler) == 0
+
+    def test_shutdown_drops_pending(self, scheduler):
+        calls = []
+        scheduler.call_later(60, calls.append, 'never')
+        assert len(scheduler) == 1
+        scheduler.shutdown()
+        assert len(scheduler) == 0
+        with pytest.raises(RuntimeError):
+            scheduler.call_soon(calls.append, 'never')
+
+
+class TestPoll:
+    def test_backoff(self, scheduler):
+        calls = []
+
+        def check():
+            calls.append(time.monotonic())
+            return len(calls) == 5, len(calls)
+
+        assert poll(check, interval=0.02, max_interval=0.06, scheduler=scheduler).result(2) == 5
+        gaps = [b - a for a, b in zip(calls, calls[1:])]
+        # 0.02, 0.04, then capped at 0.06
+        for gap, expected in zip(gaps, [0.02, 0.04, 0.06, 0.06]):
+            assert expected <= gap < expected + 0.1
+
+    def test_retry_after_sets_next_poll(self, scheduler):
+        calls = []
+
+        def check():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter('busy', retry_after=0.05)
+            return True, 'done'
+
+        assert poll(check, interval=0.001, scheduler=scheduler).result(2) == 'done'
+        assert calls[1] - calls[0] >= 0.05
+
+    def test_cancel(self, scheduler):
+        calls = []
+
+        def check():
+            calls.append(1)
+            return False, None
+
+        future = poll(check, interval=0.02, scheduler=scheduler)
+        time.sleep(0.01)
+        future.cancel()
+        time.sleep(0.05)
+        assert len(calls) == 1
+
+
+class TestSubmitRetrying:
+    def test_result(self, scheduler):
+        assert submit_retrying(lambda: 42, scheduler).result(1) == 42
+
+    def test_retry_after(self, scheduler):
+        fn = flaky([], retries=2, retry_after=0.02)
+        assert submit_retrying(fn, scheduler).result(1) == 'ok'
+        assert len(fn.calls) == 3
+        assert fn.calls[2] - fn.calls[1] >= 0.02
+
+    def test_exception(self, scheduler):
+        def fn():
+            raise InvalidRequestError('bad')
+        with pytest.raises(InvalidRequestError):
+            submit_retrying(fn, scheduler).result(1)
+
+    def test_retry_after_without_interval(self, scheduler):
+        fn = flaky([], retries=1, retry_after=None)
+        with pytest.raises(RetryAfter):
+            submit_retrying(fn, scheduler).result(1)
+
+    def test_cancel_while_waiting(self, scheduler):
+        fn = flaky([], retries=1, retry_after=0.05)
+        future = submit_retrying(fn, scheduler)
+        time.sleep(0.02)
+        assert future.cancel()
+        time.sleep(0.08)
+        assert len(fn.calls) == 1
+
+    def test_many_pending_on_few_threads(self, scheduler):
+        results = []
+        threads = threading.active_count()
+        futures = [submit_retrying(flaky(results, retries=1, retry_after=0.05), scheduler)
+                   for _ in range(1000)]
+        done, not_done = wait(futures, timeout=10)
+        assert not not_done
+        assert all(f.result() == 'ok' for f in done)
+        # Timer thread plus two workers, however many are waiting
+        assert threading.active_count() <= threads + 3
+
+
+class TestMetricsSubmit:
+    def setup_method(self, _):
+        analyzere.base_url = 'https://api'
+
+    def teardown_method(self, _):
+        analyzere.base_url = ''
+
+    def test_submit(self, reqmock):
+        reqmock.get('https://api/layer_views/abc123/tail_metrics/0.5,1.0', [
+            {'status_code': 503, 'headers': {'Retry-After': '0.01'}},
+            {'status_code': 200, 'text': '[{"num": 1.0}, {"num": 2.0}]'},
+        ])
+        future = LayerView(id='abc123').submit('tail_metrics', [0.5, 1.0], perspective='NetLoss')
+        assert [m.num for m in future.result(5)] == [1.0, 2.0]
+        assert reqmock.call_count == 2
+        assert reqmock.last_request.qs == {'perspective': ['netloss']}
+
+    def test_submit_error(self, reqmock):
+        reqmock.get('https://api/layer_views/abc123/el', status_code=400)
+        with pytest.raises(InvalidRequestError):
+            LayerView(id='abc123').submit('el').result(5)
+
+
+class TestWaiting:
+    def setup_method(self, _):
+        analyzere.base_url = 'https://api'
+
+    def teardown_method(self, _):
+        analyzere.base_url = ''
+
+    def test_upload_without_waiting(self, reqmock):
+        reqmock.post('https://api/loss_sets/abc123/data', status_code=201)
+        reqmock.patch('https://api/loss_sets/abc123/data', status_code=204)
+        reqmock.post('https://api/loss_sets/abc123/data/commit', status_code=204)
+        reqmock.get('https://api/loss_sets/abc123/data/status', [
+            {'status_code': 200, 'text': '{"status": "Processing", "commit_progress": 25}'},
+            {'status_code': 200, 'text': '{"status": "Processing", "commit_progress": 75}'},
+            {'status_code': 200, 'text': '{"status": "Processing Successful"}'},
+        ])
+        commit_callback = mock.Mock()
+
+        commit = LossSet(id='abc123').upload_data('data', poll_interval=0.001,
+                                                  commit_callback=commit_callback, wait=False)
+        assert isinstance(commit, Future)
+        assert commit.result(2).status == 'Processing Successful'
+        assert [c[0][0] for c in commit_callback.call_args_list] == [25.0, 75.0, 100.0]
+
+    def test_optimization_wait(self, reqmock):
+        reqmock.get('https://api/optimization_views/ov1/candidates', [
+            {'status_code': 503, 'headers': {'Retry-After': '0.01'}},
+            {'status_code': 200, 'text': '{"items": [], "meta": {}}'},
+        ])
+        view = OptimizationView(id='ov1')
+        assert view.wait() is view
+        assert reqmock.call_count == 2
+        assert reqmock.last_request.qs == {'limit': ['1']}
+
+        future = view.wait(block=False)
+        assert future.result(2) is view
+
+    def test_optimization_wait_poll_interval(self, reqmock):
+        # Without Retry-After the view is checked again after poll_interval
+        reqmock.get('https://api/optimization_views/ov1/candidates', [
+            {'status_code': 503},
+            {'status_code': 503},
+            {'status_code': 200, 'text': '{"items": [], "meta": {}}'},
+        ])
+        view = OptimizationView(id='ov1')
+        start = time.time()
+        assert view.wait(poll_interval=0.02) is view
+        assert reqmock.call_count == 3
+        # 0.02s, then 0.04s after backing off
+        assert time.time() - start >= 0.05
+
+    def test_optimization_wait_timeout(self, reqmock):
+        reqmock.get('https://api/optimization_views/ov1/candidates', status_code=503,
+                    headers={'Retry-After': '0.02'})
+        with pytest.raises(TimeoutError):
+            OptimizationView(id='ov1').wait(timeout=0.05)
+        calls = reqmock.call_count
+        time.sleep(0.05)
+        assert reqmock.call_count == calls
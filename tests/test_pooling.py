@@ -0,0 +1,96 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+import analyzere
+from analyzere import requestor
+from analyzere.pooling import PooledHTTPAdapter
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(float(self.path.rsplit('/', 1)[-1] or 0))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    analyzere.base_url = 'http://127.0.0.1:{}/'.format(httpd.server_address[1])
+    requestor.session = None
+    yield httpd
+    requestor.session = None
+    analyzere.base_url = ''
+    analyzere.connection_pool_maxsize = 10
+    analyzere.connection_pool_block = False
+    analyzere.connection_pool_maxsize_per_host = {}
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _concurrent_gets(n, delay):
+    threads = [threading.Thread(target=requestor.request_raw, args=('get', 'sleep/{}'.format(delay)))
+               for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+class TestPooling:
+    def test_adapters_mounted_for_all_schemes(self, server):
+        analyzere.connection_pool_maxsize_per_host = {'https://big.example.com': 50}
+        requestor.request_raw('get', 'sleep/0')
+        adapters = requestor.session.adapters
+        assert isinstance(adapters['http://'], PooledHTTPAdapter)
+        assert isinstance(adapters['https://'], PooledHTTPAdapter)
+        assert adapters['https://big.example.com']._pool_maxsize == 50
+        assert requestor.session.get_adapter('https://big.example.com/foo') is \
+            adapters['https://big.example.com']
+        assert adapters['http://']._pool_maxsize == analyzere.connection_pool_maxsize
+
+    def test_stats(self, server):
+        assert requestor.pool_stats() == []
+        requestor.request_raw('get', 'sleep/0')
+        requestor.request_raw('get', 'sleep/0')
+        stats, = requestor.pool_stats()
+        assert stats['scheme'] == 'http'
+        assert stats['host'] == '127.0.0.1'
+        assert stats['in_use'] == 0
+        assert stats['idle'] == 1
+        assert stats['connections_opened'] == 1
+        assert stats['requests'] == 2
+        assert stats['full_waits'] == 0
+
+    def test_block(self, server):
+        analyzere.connection_pool_maxsize = 2
+        analyzere.connection_pool_block = True
+        _concurrent_gets(4, 0.1)
+        stats, = requestor.pool_stats()
+        assert stats['block'] is True
+        assert stats['connections_opened'] == 2
+        assert stats['full_waits'] >= 1
+        assert stats['wait_time'] > 0
+        assert stats['discarded'] == 0
+        assert stats['idle'] == 2
+
+    def test_non_blocking_overflow_discarded(self, server):
+        analyzere.connection_pool_maxsize = 1
+        _concurrent_gets(3, 0.1)
+        stats, = requestor.pool_stats()
+        assert stats['connections_opened'] == 3
+        assert stats['full_waits'] >= 1
+        assert stats['discarded'] == 2
+        assert stats['idle'] == 1
@@ -1,11 +1,16 @@
 import base64
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
 
 import pytest
 import mock
 import time
 
 import analyzere
-from analyzere import AuthenticationError, InvalidRequestError, ServerError
+from analyzere import AuthenticationError, Client, InvalidRequestError, ServerError
+from analyzere import requestor
+from analyzere.errors import RetryAfter
 from analyzere.requestor import handle_api_error, request, request_raw
 
 
@@ -56,6 +61,17 @@ class TestErrorHandling:
         with pytest.raises(ServerError):
             handle_api_error(resp, 500)
 
+    def test_retry_after(self):
+        resp = mock.Mock(text='', headers={'Retry-After': '2.5'})
+        with pytest.raises(RetryAfter) as e:
+            handle_api_error(resp, 503)
+        assert e.value.retry_after == 2.5
+
+        resp = mock.Mock(text='', headers={})
+        with pytest.raises(RetryAfter) as e:
+            handle_api_error(resp, 503)
+        assert e.value.retry_after is None
+
 
 class TestRequest:
     def setup_method(self, _):
@@ -278,3 +294,131 @@ class TestRequestRaw:
             resp = request_raw('get', 'bar')
         assert resp.text == 'foo'
         sleep.assert_called_once_with(1.0)
+
+
+class TokenServerHandler(BaseHTTPRequestHandler):
+    """
+    Issues a new token per POST to /token, slowly enough for concurrent
+    requests to pile up, and only accepts the latest token on other paths.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, code, body=b''):
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        time.sleep(0.05)
+        with self.server.lock:
+            token = 't{}'.format(len(self.server.tokens) + 1)
+            self.server.tokens.append(token)
+            self.server.valid_token = token
+        body = json.dumps({'access_token': token, 'token_type': 'Bearer',
+                           'expires_in': 3600})
+        self._respond(200, body.encode())
+
+    def do_GET(self):
+        time.sleep(0.01)
+        valid = 'Bearer {}'.format(self.server.valid_token)
+        self._respond(200 if self.headers['Authorization'] == valid else 401)
+
+
+class TokenServer(ThreadingHTTPServer):
+    # Accept a burst of connections without dropping SYNs
+    request_queue_size = 64
+    daemon_threads = True
+
+
+class TestThreadSafety:
+    threads = 32
+
+    @pytest.fixture
+    def server(self, monkeypatch):
+        # The stand-in server doesn't use TLS
+        monkeypatch.setenv('OAUTHLIB_INSECURE_TRANSPORT', '1')
+        httpd = TokenServer(('127.0.0.1', 0), TokenServerHandler)
+        httpd.lock = threading.Lock()
+        httpd.tokens = []
+        httpd.valid_token = None
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}/'.format(httpd.server_address[1])
+
+        analyzere.base_url = url
+        analyzere.oauth_token_url = url + 'token'
+        analyzere.oauth_client_id = 'client-id'
+        analyzere.oauth_client_secret = 'secret'
+        analyzere.connection_pool_maxsize = self.threads
+        requestor.session = None
+        yield httpd
+        requestor.session = None
+        analyzere.base_url = ''
+        analyzere.oauth_token_url = ''
+        analyzere.oauth_client_id = ''
+        analyzere.oauth_client_secret = ''
+        analyzere.connection_pool_maxsize = 10
+        httpd.shutdown()
+        httpd.server_close()
+
+    def _concurrent_gets(self, send=request_raw):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+        sessions = set()
+
+        def get():
+            barrier.wait()
+            try:
+                statuses.append(send('get', 'bar').status_code)
+            except Exception as e:
+                statuses.append(e)
+            sessions.add(id(requestor.session))
+
+        threads = [threading.Thread(target=get) for _ in range(self.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert statuses == [200] * self.threads
+        return sessions
+
+    def test_single_session_and_token(self, server):
+        sessions = self._concurrent_gets()
+        assert len(sessions) == 1
+        assert server.tokens == ['t1']
+
+    def test_single_refresh_on_401(self, server):
+        request_raw('get', 'bar')
+        # Revoke the token
+        server.valid_token = None
+        self._concurrent_gets()
+        assert server.tokens == ['t1', 't2']
+
+    def test_single_refresh_on_expiry(self, server):
+        request_raw('get', 'bar')
+        token = dict(requestor.session.token, expires_at=time.time() - 10)
+        requestor.session.token = token
+        self._concurrent_gets()
+        assert server.tokens == ['t1', 't2']
+
+    def test_client(self, server):
+        client = Client(analyzere.base_url, oauth_token_url=analyzere.oauth_token_url,
+                        oauth_client_id='client-id', oauth_client_secret='secret',
+                        connection_pool_maxsize=self.threads)
+        sessions = []
+
+        def send(*args):
+            resp = client.request_raw(*args)
+            sessions.append(client.session)
+            return resp
+        try:
+            self._concurrent_gets(send)
+        finally:
+            client.close()
+        assert len(set(id(s) for s in sessions)) == 1
+        assert server.tokens == ['t1']
+        assert requestor.session is None
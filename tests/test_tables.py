@@ -0,0 +1,121 @@
+import pytest
+
+import analyzere
+from analyzere import LossSet, tables
+from analyzere.base_resources import MetricsResource
+
+# Rendering and uploading tables works without numpy; parsing needs it
+requires_numpy = pytest.mark.skipif(tables.np is None, reason='numpy is not installed')
+np = tables.np
+
+
+class FooView(MetricsResource):
+    pass
+
+
+@requires_numpy
+class TestParseLossTable:
+    def test_yelt(self):
+        a = tables.parse_loss_table(b'Trial,Event,Sequence,Loss\n'
+                                    b'1,10,0.25,100.5\n'
+                                    b'2,11,0.5,200\n')
+        assert a.dtype.names == ('trial', 'event', 'sequence', 'loss')
+        assert a.dtype['trial'] == np.int64
+        assert a.dtype['loss'] == np.float64
+        assert a['trial'].tolist() == [1, 2]
+        assert a['event'].tolist() == [10, 11]
+        assert a['sequence'].tolist() == [0.25, 0.5]
+        assert a['loss'].tolist() == [100.5, 200.0]
+
+    def test_header_normalised(self):
+        a = tables.parse_loss_table('TrialId, EventId,Loss\r\n1,2,3.0\r\n')
+        assert a.dtype.names == ('trial_id', 'event_id', 'loss')
+        assert a['event_id'].tolist() == [2]
+
+    def test_single_row(self):
+        a = tables.parse_loss_table(b'Trial,Loss\n1,2.5\n')
+        assert a.shape == (1,)
+
+    def test_empty(self):
+        a = tables.parse_loss_table(b'Trial,Loss\n')
+        assert a.shape == (0,)
+        assert a.dtype.names == ('trial', 'loss')
+
+    def test_dtype_override(self):
+        dtype = np.dtype([('trial', np.int32), ('loss', np.float32)])
+        a = tables.parse_loss_table(b'Trial,Loss\n1,2.5\n', dtype=dtype)
+        assert a.dtype == dtype
+
+
+class TestIterCsv:
+    @requires_numpy
+    def test_structured_array(self):
+        a = np.array([(1, 10, 0.25, 100.5), (2, 11, 0.1, 2e-07)],
+                     dtype=[('trial', np.int64), ('event_id', np.int64),
+                            ('sequence', np.float64), ('loss', np.float64)])
+        csv = ''.join(tables.iter_csv(a))
+        assert csv == 'Trial,EventId,Sequence,Loss\n1,10,0.25,100.5\n2,11,0.1,2e-07\n'
+        assert tables.parse_loss_table(csv).tolist() == a.tolist()
+
+    def test_columns(self):
+        table = {'trial': range(5), 'loss': [0.5, 1, 1.5, 2, 2.5]}
+        batches = list(tables.iter_csv(table, header=['Trial', 'Loss'], batch_rows=2))
+        assert batches == ['Trial,Loss\n', '0,0.5\n1,1\n', '2,1.5\n3,2\n', '4,2.5\n']
+
+    def test_empty(self):
+        assert list(tables.iter_csv({'trial': [], 'loss': []})) == ['Trial,Loss\n']
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            list(tables.iter_csv({'trial': [1, 2], 'loss': [1.0]}))
+        with pytest.raises(ValueError):
+            list(tables.iter_csv({'trial': [1]}, header=['Trial', 'Loss']))
+        with pytest.raises(ValueError):
+            list(tables.iter_csv({}))
+
+
+class TestUploadTable:
+    def setup_method(self, _):
+        analyzere.base_url = 'https://api'
+
+    def teardown_method(self, _):
+        analyzere.base_url = ''
+
+    def test_upload_table(self, reqmock):
+        reqmock.post('https://api/loss_sets/abc123/data', status_code=201)
+        reqmock.patch('https://api/loss_sets/abc123/data', status_code=204)
+        reqmock.post('https://api/loss_sets/abc123/data/commit', status_code=204)
+        reqmock.get('https://api/loss_sets/abc123/data/status',
+                    text='{"status": "Processing Successful"}')
+        table = {'trial': list(range(1000)), 'loss': [i / 999 for i in range(1000)]}
+
+        status = LossSet(id='abc123').upload_table(table, batch_rows=100, chunk_size=4096,
+                                                   read_ahead=2)
+        assert status.status == 'Processing Successful'
+        patches = [(int(r.headers['Offset']), r.body) for r in reqmock.request_history
+                   if r.method == 'PATCH']
+        assert len(patches) > 1
+        assert b''.join(body for _, body in patches).decode() == ''.join(tables.iter_csv(table))
+
+
+@requires_numpy
+class TestDownloadArrays:
+    def setup_method(self, _):
+        analyzere.base_url = 'https://api'
+
+    def teardown_method(self, _):
+        analyzere.base_url = ''
+
+    def test_download_ylt_array(self, reqmock):
+        reqmock.get('https://api/foo_views/abc123/ylt', status_code=200,
+                    text='Trial,Loss\n1,2.5\n2,0\n')
+        a = FooView(id='abc123').download_ylt_array()
+        assert a['trial'].tolist() == [1, 2]
+        assert a['loss'].tolist() == [2.5, 0.0]
+
+    def test_download_yelt_array(self, reqmock):
+        reqmock.get('https://api/foo_views/abc123/yelt?perspective=NetLoss',
+                    status_code=200,
+                    text='Trial,Event,Sequence,Loss\n1,7,0.1,5\n')
+        a = FooView(id='abc123').download_yelt_array(perspective='NetLoss')
+        assert a['event'].tolist() == [7]
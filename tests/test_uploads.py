@@ -0,0 +1,214 @@
+import gzip
+import threading
+import time
+
+import pytest
+
+import analyzere
+from analyzere import LossSet, ServerError, UploadManager
+from analyzere.uploads import ChunkSizer, GzipChunk, RateLimiter, compress_chunks, prefetch
+
+
+class TestCompression:
+    def test_gzip_chunk(self):
+        chunk = GzipChunk('a,b\n' * 100, level=1)
+        assert len(chunk) == 400
+        assert len(chunk.body) < 400
+        assert gzip.decompress(chunk.body) == b'a,b\n' * 100
+
+    def test_compress_chunks(self):
+        chunks = [(b'12', 0), (b'34', 2), (b'5', 4)]
+        for ahead in (0, 1, 2, 8):
+            compressed = list(compress_chunks(iter(chunks), ahead=ahead))
+            assert [(gzip.decompress(c.body), o) for c, o in compressed] == chunks
+
+
+class TestChunkSizer:
+    def test_grows_on_fast_link(self):
+        sizer = ChunkSizer(initial=100, minimum=10, maximum=1000, target_seconds=1)
+        assert sizer() == 100
+        sizer.record(100, 0.01)
+        assert sizer() == 200
+        sizer.record(200, 0.01)
+        sizer.record(400, 0.01)
+        sizer.record(800, 0.01)
+        assert sizer() == 1000
+
+    def test_shrinks_on_slow_link(self):
+        sizer = ChunkSizer(initial=1000, minimum=10, maximum=1000, target_seconds=1)
+        sizer.record(1000, 10)
+        assert sizer() == 500
+        for _ in range(10):
+            sizer.record(sizer(), sizer() / 100.0)
+        # Converges on what is sent in a second at 100 bytes per second
+        assert 100 <= sizer() < 110
+
+    def test_stats(self):
+        sizer = ChunkSizer(initial=100, target_seconds=1)
+        sizer.record(100, 0.5)
+        sizer.record(200, 1.5)
+        stats = sizer.stats()
+        assert stats['chunks'] == 2
+        assert stats['bytes'] == 300
+        assert stats['seconds'] == 2
+        assert stats['sizes'] == [100, 200]
+        assert stats['throughput'] == 0.5 * 200 + 0.5 * 200 / 1.5
+
+
+class TestPrefetch:
+    def test_items(self):
+        assert list(prefetch(iter(range(100)), depth=3)) == list(range(100))
+
+    def test_produces_ahead(self):
+        produced = []
+
+        def produce():
+            for i in range(10):
+                produced.append(i)
+                yield i
+
+        items = prefetch(produce(), depth=2)
+        assert next(items) == 0
+        time.sleep(0.05)
+        # One taken, two queued and one waiting for space
+        assert len(produced) == 4
+        items.close()
+
+    def test_error(self):
+        def produce():
+            yield 1
+            raise ValueError('bad row')
+
+        items = prefetch(produce())
+        assert next(items) == 1
+        with pytest.raises(ValueError):
+            next(items)
+
+    def test_close_stops_producer(self):
+        def produce():
+            while True:
+                yield 1
+
+        threads = threading.active_count()
+        items = prefetch(produce(), depth=1)
+        next(items)
+        items.close()
+        time.sleep(0.3)
+        assert threading.active_count() == threads
+
+
+class TestRateLimiter:
+    def test_rate(self):
+        limiter = RateLimiter(1000, burst=100)
+        start = time.monotonic()
+        for _ in range(4):
+            limiter(50)
+        # The burst covers the first 100 bytes, the rest take 0.1 seconds
+        assert 0.09 <= time.monotonic() - start < 1
+
+    def test_shared_by_threads(self):
+        limiter = RateLimiter(2000, burst=1)
+        start = time.monotonic()
+        threads = [threading.Thread(target=limiter, args=(100,)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert 0.19 <= time.monotonic() - start < 1
+
+
+class TestUploadManager:
+    def setup_method(self, _):
+        analyzere.base_url = 'https://api'
+
+    def teardown_method(self, _):
+        analyzere.base_url = ''
+
+    def mock_loss_set(self, reqmock, id_, status='Processing Successful', patch_status=204):
+        url = 'https://api/loss_sets/{}/data'.format(id_)
+        reqmock.post(url, status_code=201)
+        reqmock.patch(url, status_code=patch_status)
+        reqmock.post(url + '/commit', status_code=204)
+        reqmock.get(url + '/status', text='{{"status": "{}"}}'.format(status))
+
+    def test_uploads(self, reqmock):
+        self.mock_loss_set(reqmock, 'ls1')
+        self.mock_loss_set(reqmock, 'ls2', status='Processing Failed')
+        self.mock_loss_set(reqmock, 'ls3', patch_status=500)
+        progress = []
+
+        with UploadManager(max_concurrent=2, progress_callback=progress.append) as manager:
+            futures = [manager.submit(LossSet(id=id_), 'data', chunk_size=2, poll_interval=0.001)
+                       for id_ in ('ls1', 'ls2', 'ls3')]
+
+        assert futures[0].result().status == 'Processing Successful'
+        assert futures[1].result().status == 'Processing Failed'
+        with pytest.raises(ServerError):
+            futures[2].result()
+
+        stats = manager.stats()
+        assert stats['total'] == 3
+        assert stats['succeeded'] == 1
+        assert stats['failed'] == 2
+        assert stats['bytes_sent'] == 10
+        assert progress[-1] == stats
+        failures = manager.failures()
+        assert [(ls.id, type(e)) for ls, e in failures] == [('ls2', type(None)), ('ls3', ServerError)]
+
+    def test_concurrency_and_bandwidth_caps(self, reqmock):
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def patch(request, context):
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.pop()
+            context.status_code = 204
+            return ''
+
+        for i in range(6):
+            self.mock_loss_set(reqmock, 'ls{}'.format(i))
+            reqmock.patch('https://api/loss_sets/ls{}/data'.format(i), text=patch)
+
+        start = time.monotonic()
+        with UploadManager(max_concurrent=2, max_bytes_per_second=2000) as manager:
+            for i in range(6):
+                manager.submit(LossSet(id='ls{}'.format(i)), b'x' * 500, chunk_size=100,
+                               poll_interval=0.001)
+        # 3000 bytes at 2000 bytes per second, less the initial burst of 2000
+        assert time.monotonic() - start >= 0.45
+        assert max(peak) <= 2
+        assert manager.stats()['succeeded'] == 6
+        assert manager.stats()['progress'] == 100.0
+
+    def test_compressed_bytes_sent(self, reqmock):
+        self.mock_loss_set(reqmock, 'ls1')
+        data = b'a,b\n' * 1000
+
+        with UploadManager(max_bytes_per_second=1e6) as manager:
+            manager.submit(LossSet(id='ls1'), data, chunk_size=1000, compression=6,
+                           poll_interval=0.001)
+
+        bodies = [r.body for r in reqmock.request_history if r.method == 'PATCH']
+        assert len(bodies) == 4
+        assert manager.stats()['bytes_sent'] == sum(len(b) for b in bodies) < len(data)
+
+    def test_commit_wait_overlaps_transfers(self, reqmock):
+        self.mock_loss_set(reqmock, 'ls1')
+        self.mock_loss_set(reqmock, 'ls2')
+        # ls1 takes a while to process
+        reqmock.get('https://api/loss_sets/ls1/data/status', [
+            {'text': '{"status": "Processing", "commit_progress": 0}'}] * 3 + [
+            {'text': '{"status": "Processing Successful"}'}])
+
+        manager = UploadManager(max_concurrent=1)
+        first = manager.submit(LossSet(id='ls1'), 'data', poll_interval=0.05)
+        second = manager.submit(LossSet(id='ls2'), 'data', poll_interval=0.001)
+        second.result(2)
+        assert not first.done()
+        manager.close()
+        assert first.result().status == 'Processing Successful'
@@ -1,6 +1,7 @@
 import json
 from datetime import datetime, tzinfo, timedelta
 
+import mock
 import pytest
 import six
 from six import StringIO
@@ -57,6 +58,34 @@ class TestDateTimeDecoder:
                        cls=utils.DateTimeDecoder)
         assert d['d'] == '2015-06-01T12:00:00+02:00'
 
+    def test_non_string_values_untouched(self):
+        d = json.loads('{"a": 1, "b": null, "c": [1], "d": "Z", "e": true}',
+                       cls=utils.DateTimeDecoder)
+        assert d == {'a': 1, 'b': None, 'c': [1], 'd': 'Z', 'e': True}
+
+
+@pytest.mark.parametrize('value', [
+    '2015-06-01T12:00:00Z',
+    '2015-06-01T12:00:00.123Z',
+    '2015-06-01T12:00:00.000001Z',
+    '2015-6-1T1:2:3Z',
+    '2015-06-01t12:00:00z',
+    '2015-06- 1T12:00:00Z',
+    '2015-02-30T00:00:00Z',
+    '2015-06-01T12:00:60Z',
+    '2015-06-01T24:00:00Z',
+    '2015-13-01T00:00:00Z',
+    '2015-06-01T12:00:00.1234567Z',
+    '2015-06-01T12:00:00.Z',
+    '2015-06-01T12:00:00ZZ',
+    '2015-06-01 12:00:00Z',
+    '20150-06-01T12:00:00Z',
+    'Z',
+])
+def test_parse_api_datetime_matches_strptime(value):
+    formats = ['%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ']
+    assert utils.parse_api_datetime(value) == utils.parse_datetime(value, formats)
+
 
 class TestReadInChunks:
     def test_valid_chunk_size(self):
@@ -79,6 +108,68 @@ class TestReadInChunks:
             six.next(reader)
 
 
+class TestIterInChunks:
+    def test_rows(self):
+        rows = ['a,b\n', b'1,2\n', '3,\u00e9\n']
+        chunks = list(utils.iter_in_chunks(iter(rows), 5))
+        assert chunks == [(b'a,b\n1', 0), (b',2\n3,', 5), (b'\xc3\xa9\n', 10)]
+
+    def test_offset(self):
+        chunks = list(utils.iter_in_chunks(['foo', 'bar', 'baz'], 4, offset=5))
+        assert chunks == [(b'rbaz', 5)]
+
+    def test_callable_chunk_size(self):
+        sizes = iter([1, 2, 3])
+        chunks = list(utils.iter_in_chunks(['foobar'], lambda: next(sizes, 10)))
+        assert chunks == [(b'f', 0), (b'oo', 1), (b'bar', 3)]
+
+
+class TestSkipBytes:
+    def test_skipped_in_chunks(self):
+        s = mock.Mock(wraps=StringIO('foobarbaz'))
+        utils.skip_bytes(s, 7, 3)
+        assert [c[0][0] for c in s.read.call_args_list] == [3, 3, 1]
+        assert s.read() == 'az'
+
+    def test_short_stream(self):
+        s = StringIO('foo')
+        utils.skip_bytes(s, 10, 2)
+        assert s.read() == ''
+
+
+class TestSliceInChunks:
+    def test_slices(self):
+        chunks = list(utils.slice_in_chunks(b'foobar', 4))
+        assert [(bytes(c), o) for c, o in chunks] == [(b'foob', 0), (b'ar', 4)]
+        assert all(isinstance(c, memoryview) for c, _ in chunks)
+
+    def test_offset(self):
+        chunks = utils.slice_in_chunks(bytearray(b'foobar'), 4, offset=3)
+        assert [(bytes(c), o) for c, o in chunks] == [(b'bar', 3)]
+
+    def test_small_chunk_size(self):
+        assert list(utils.slice_in_chunks(b'foob', 0)) == []
+
+
+class TestMapInChunks:
+    def test_offsets(self, tmp_path):
+        # Spans several allocation granularities, with unaligned chunks
+        data = bytes(range(256)) * 1000
+        path = tmp_path / 'data'
+        path.write_bytes(data)
+        with open(str(path), 'rb') as f:
+            for offset in (0, 7):
+                chunks = list(utils.map_in_chunks(f, 10007, offset))
+                assert [o for _, o in chunks] == list(range(offset, len(data), 10007))
+                assert b''.join(bytes(c) for c, _ in chunks) == data[offset:]
+
+    def test_small_chunk_size(self, tmp_path):
+        path = tmp_path / 'data'
+        path.write_bytes(b'foob')
+        with open(str(path), 'rb') as f:
+            assert list(utils.map_in_chunks(f, 0)) == []
+
+
 def test_file_length():
     s = StringIO('foobar')
     assert utils.file_length(s) == 6
@@ -86,6 +177,17 @@ def test_file_length():
     assert utils.file_length(s) == 6
 
 
+def test_write_chunks(tmp_path):
+    file_obj = six.BytesIO()
+    assert utils.write_chunks([b'foo', b'bar'], file_obj) == 6
+    assert file_obj.getvalue() == b'foobar'
+
+    path = str(tmp_path / 'out')
+    assert utils.write_chunks(iter([b'foo', b'bar']), path) == 6
+    with open(path, 'rb') as fp:
+        assert fp.read() == b'foobar'
+
+
 def test_vectorize():
     x = 123
     assert utils.vectorize(x) == 123